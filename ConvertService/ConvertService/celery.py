@@ -1,6 +1,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from kombu import Queue
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ConvertService.settings')
 
@@ -9,6 +10,44 @@ app = Celery('ConvertService')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+# interactive: small jobs (see process.task_routing), served by their own worker so bulk work never blocks them.
+# convert: CPU-heavy parsing and conversion, including the conversion step of an export (prefork pool).
+# export: Redis/IO-heavy file generation and cleanup (threads pool).
+# Within a queue, lower priority values are delivered first (Redis transport).
+app.conf.task_queues = (
+    Queue('interactive'),
+    Queue('convert'),
+    Queue('export'),
+)
+app.conf.task_default_queue = 'convert'
+app.conf.task_routes = {
+    'process.file_tasks.process_multiple_files_task': {'queue': 'interactive'},
+    'process.file_tasks.record_processed_manifest': {'queue': 'interactive'},
+    'process.file_tasks.process_file_task': {'queue': 'convert'},
+    'process.file_tasks.process_and_format_file': {'queue': 'convert'},
+    'process.file_tasks.export_download_task': {'queue': 'convert'},
+    'process.file_tasks.build_export_file_task': {'queue': 'export'},
+    'process.file_tasks.generate_csv_task': {'queue': 'export'},
+    'process.file_tasks.generate_excel_task': {'queue': 'export'},
+    'process.file_tasks.generate_zip_task': {'queue': 'export'},
+    'process.file_tasks.sweep_expired_sessions': {'queue': 'export'},
+}
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+app.conf.task_default_priority = 5
+# Long tasks: do not let a busy child reserve work another child could start.
+app.conf.worker_prefetch_multiplier = 1
+# Beat runs embedded in the export worker (scripts/celery_start.sh).
+app.conf.beat_schedule = {
+    'sweep-expired-sessions': {
+        'task': 'process.file_tasks.sweep_expired_sessions',
+        'schedule': int(os.getenv('SESSION_SWEEP_INTERVAL', 900)),
+    },
+}
+
 
 app.autodiscover_tasks()
 
@@ -117,6 +117,38 @@ CELERY_ACCEPT_CONTENT = ['json', 'yaml']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+FILE_PROCESS_CHUNK_SIZE = int(os.getenv('FILE_PROCESS_CHUNK_SIZE', 5000))
+XML_RECORD_PATH = os.getenv('XML_RECORD_PATH', './/record')
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 50))
+PDF_PROCESS_WORKERS = int(os.getenv('PDF_PROCESS_WORKERS', 0))
+FUSED_FILE_PROCESSING = os.getenv('FUSED_FILE_PROCESSING', 'True') == 'True'
+KEEP_PROCESSED_CHUNKS = os.getenv('KEEP_PROCESSED_CHUNKS', 'False') == 'True'
+CONVERT_CACHE_ENABLED = os.getenv('CONVERT_CACHE_ENABLED', 'True') == 'True'
+CONVERT_CACHE_TTL = int(os.getenv('CONVERT_CACHE_TTL', 86400))
+CONVERT_CACHE_MAX_ENTRIES = int(os.getenv('CONVERT_CACHE_MAX_ENTRIES', 200))
+FORMAT_PROCESS_WORKERS = int(os.getenv('FORMAT_PROCESS_WORKERS', 0))
+FORMAT_PARALLEL_MIN_ROWS = int(os.getenv('FORMAT_PARALLEL_MIN_ROWS', 20000))
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', 512))
+INTERACTIVE_MAX_ROWS = int(os.getenv('INTERACTIVE_MAX_ROWS', 5000))
+TENANT_MAX_HEAVY_JOBS = int(os.getenv('TENANT_MAX_HEAVY_JOBS', 2))
+TENANT_JOB_LEASE_SECONDS = int(os.getenv('TENANT_JOB_LEASE_SECONDS', 3600))
+TENANT_QUOTA_RETRY_SECONDS = int(os.getenv('TENANT_QUOTA_RETRY_SECONDS', 5))
+# Directory shared by the web server and the Celery workers (the shared_data volume in docker-compose.yml).
+SHARED_DATA_DIR = os.getenv('SHARED_DATA_DIR', '/var/lib/convert')
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(SHARED_DATA_DIR, 'uploads'))
+SPILL_DIR = os.getenv('SPILL_DIR', os.path.join(SHARED_DATA_DIR, 'spill'))
+SESSION_IDLE_SECONDS = int(os.getenv('SESSION_IDLE_SECONDS', 86400))
+SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', 900))
+REDIS_CODEC_COMPRESSION = os.getenv('REDIS_CODEC_COMPRESSION', 'zlib')
+REDIS_CODEC_COMPRESS_MIN_BYTES = int(os.getenv('REDIS_CODEC_COMPRESS_MIN_BYTES', 1024))
+REDIS_READ_WINDOW = int(os.getenv('REDIS_READ_WINDOW', 8))
+REDIS_WRITE_BATCH = int(os.getenv('REDIS_WRITE_BATCH', 64))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_BLOCKING = os.getenv('REDIS_POOL_BLOCKING', 'True') == 'True'
+REDIS_POOL_TIMEOUT = int(os.getenv('REDIS_POOL_TIMEOUT', 20))
+REDIS_SOCKET_KEEPALIVE = os.getenv('REDIS_SOCKET_KEEPALIVE', 'True') == 'True'
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
 AUTH_USER_MODEL = "accounts.Account"
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
@@ -0,0 +1,204 @@
+import argparse
+import datetime
+import logging
+import random
+import re
+import time
+from process.date_parser import DateParser
+
+logger = logging.getLogger(__name__)
+
+# Usage: python DateParserBenchmark.py [corpus.txt] [--repeat N]
+# The corpus holds one recorded input value per line. Without a corpus a synthetic one is generated.
+
+
+def legacy_convert_date(value, target_format='%Y/%m/%d'):
+    """
+    DataFormatter.convert_date as it was before process.date_parser, kept as the reference.
+    """
+    try:
+        def is_valid_date(year, month, day):
+            try:
+                datetime.datetime(year, month, day)
+                return True
+            except ValueError:
+                return False
+
+        if not value or not isinstance(value, str):
+            return ""
+
+        value = value.strip()
+        date_result = None
+
+        time_part = ""
+        time_match = re.search(r'(\s+\d{1,2}[:\.]\d{1,2}([:\.]\d{1,2})?\s*(AM|PM|am|pm)?)', value)
+        if time_match:
+            time_part = time_match.group(1)
+            value = value.replace(time_part, '')
+            value = value.strip()
+
+        era_map = {"S": 1925, "H": 1988, "R": 2018}
+        era_match = re.match(r'([SHR])\s*(\d{1,2})[.\-年/](\d{1,2})[.\-月/](\d{1,2})日?', value)
+        if era_match:
+            era, year, month, day = era_match.groups()
+            base_year = era_map.get(era[0], 0)
+            year = int(year) + base_year
+            date_result = datetime.datetime(year, int(month), int(day))
+
+        kanji_era_match = re.match(r'(昭和|平成|令和)\s*(\d{1,2})[.\-年/](\d{1,2})[.\-月/](\d{1,2})日?', value)
+        if not date_result and kanji_era_match:
+            kanji_era, year, month, day = kanji_era_match.groups()
+            era = {"昭和": 1925, "平成": 1988, "令和": 2018}[kanji_era]
+            year = int(year) + era
+            date_result = datetime.datetime(year, int(month), int(day))
+
+        if not date_result:
+            iso_match = re.match(r'(\d{4})([.\-/])(\d{1,2})\2(\d{1,2})', value)
+            if iso_match:
+                year, separator, month, day = iso_match.groups()
+                date_result = datetime.datetime(int(year), int(month), int(day))
+
+        if not date_result:
+            kanji_match = re.match(r'(\d{4})年(\d{1,2})月(\d{1,2})日?', value)
+            if kanji_match:
+                year, month, day = map(int, kanji_match.groups())
+                date_result = datetime.datetime(year, month, day)
+
+        if not date_result:
+            euro_match = re.match(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{4})', value)
+            if euro_match:
+                day, separator, month, year = euro_match.groups()
+                day_val = int(day)
+                month_val = int(month)
+
+                if day_val > 12 or (month_val <= 12 and is_valid_date(int(year), month_val, day_val)):
+                    date_result = datetime.datetime(int(year), month_val, day_val)
+                elif month_val > 12 or not is_valid_date(int(year), month_val, day_val):
+                    if is_valid_date(int(year), day_val, month_val):
+                        date_result = datetime.datetime(int(year), day_val, month_val)
+
+        if not date_result:
+            us_match = re.match(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{4})', value)
+            if us_match:
+                month, separator, day, year = us_match.groups()
+                month_val = int(month)
+                day_val = int(day)
+
+                if month_val <= 12 and is_valid_date(int(year), month_val, day_val):
+                    date_result = datetime.datetime(int(year), month_val, day_val)
+                elif day_val <= 12 and is_valid_date(int(year), day_val, month_val):
+                    date_result = datetime.datetime(int(year), day_val, month_val)
+
+        if not date_result:
+            short_year_match = re.match(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{2})', value)
+            if short_year_match:
+                first, separator, second, year = short_year_match.groups()
+                full_year = int(year) + (2000 if int(year) < 50 else 1900)
+
+                first_val = int(first)
+                second_val = int(second)
+
+                if first_val <= 12 and second_val <= 31 and is_valid_date(full_year, first_val, second_val):
+                    date_result = datetime.datetime(full_year, first_val, second_val)
+                elif second_val <= 12 and first_val <= 31 and is_valid_date(full_year, second_val, first_val):
+                    date_result = datetime.datetime(full_year, second_val, first_val)
+
+        if not date_result:
+            reverse_match = re.match(r'(\d{4})([.\-/])(\d{1,2})\2(\d{1,2})', value)
+            if reverse_match:
+                year, separator, first, second = reverse_match.groups()
+                if is_valid_date(int(year), int(first), int(second)):
+                    date_result = datetime.datetime(int(year), int(first), int(second))
+                elif is_valid_date(int(year), int(second), int(first)):
+                    date_result = datetime.datetime(int(year), int(second), int(first))
+
+        if date_result:
+            return date_result.strftime(target_format)
+
+        return value
+    except Exception:
+        return value
+
+
+def generate_corpus(size=50000, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        year, month, day = rng.randint(1930, 2024), rng.randint(1, 12), rng.randint(1, 31)
+        separator = rng.choice('/-.')
+        kind = rng.random()
+        if kind < 0.45:
+            corpus.append(f"{year}/{month:02d}/{day:02d}")
+        elif kind < 0.55:
+            corpus.append(f"{year}{separator}{month}{separator}{day}")
+        elif kind < 0.65:
+            corpus.append(f"{day:02d}{separator}{month:02d}{separator}{year}")
+        elif kind < 0.70:
+            corpus.append(f"{month}{separator}{day}{separator}{year % 100:02d}")
+        elif kind < 0.78:
+            corpus.append(f"{year}年{month}月{day}日")
+        elif kind < 0.84:
+            corpus.append(f"{rng.choice('SHR')}{rng.randint(1, 63)}.{month:02d}.{day:02d}")
+        elif kind < 0.88:
+            corpus.append(f"{rng.choice(['昭和', '平成', '令和'])}{rng.randint(1, 30)}年{month}月{day}日")
+        elif kind < 0.94:
+            corpus.append(f"{year}-{month:02d}-{day:02d} {rng.randint(0, 23)}:{rng.randint(0, 59):02d}")
+        else:
+            corpus.append(rng.choice(['', ' ', '不明', 'N/A', '2020/13/40', '99/99/9999', '31.02.2021']))
+    return corpus
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return [line.rstrip('\r\n') for line in f]
+
+
+def measure(function, corpus, target_format, repeat):
+    best = None
+    results = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [function(value, target_format) for value in corpus]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare DateParser with the legacy convert_date.")
+    parser.add_argument('corpus', nargs='?', help="File with one recorded date value per line.")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus()
+    logger.info(f"Corpus: {len(corpus)} values ({args.corpus or 'synthetic'}).")
+
+    exit_code = 0
+    for target_format in ('%Y/%m/%d', '%Y-%m-%d'):
+        legacy_time, legacy_results = measure(legacy_convert_date, corpus, target_format, args.repeat)
+        parser_time, parser_results = measure(DateParser.convert, corpus, target_format, args.repeat)
+
+        mismatches = [
+            (value, expected, actual)
+            for value, expected, actual in zip(corpus, legacy_results, parser_results)
+            if expected != actual
+        ]
+        logger.info(
+            f"{target_format}: legacy {legacy_time:.3f}s, DateParser {parser_time:.3f}s "
+            f"({legacy_time / parser_time if parser_time else 0:.1f}x), mismatches: {len(mismatches)}"
+        )
+        for value, expected, actual in mismatches[:20]:
+            logger.warning(f"  {value!r}: legacy={expected!r} parser={actual!r}")
+        if mismatches:
+            exit_code = 1
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler()]
+    )
+    exit(main())
@@ -0,0 +1,138 @@
+import argparse
+import csv
+import importlib.util
+import json
+import logging
+import random
+import time
+from process.chunk_codec import ChunkCodec
+from process.redis import PayloadCodec
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Usage: python RedisCodecBenchmark.py [roster.csv] [--rows N] [--chunk-size N] [--repeat N]
+# The roster is a CSV with a header row (UTF-8 or Shift_JIS). Without one a synthetic roster is generated.
+
+LAST_NAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤', '吉田', '山田']
+FIRST_NAMES = ['太郎', '花子', '翔太', '美咲', '大輔', '陽菜', '健一', 'さくら', '拓也', '由美', '蓮', '結衣']
+KANA = ['サトウ', 'スズキ', 'タカハシ', 'タナカ', 'イトウ', 'ワタナベ', 'ヤマモト', 'ナカムラ', 'コバヤシ', 'カトウ']
+PREFECTURES = ['東京都', '大阪府', '神奈川県', '愛知県', '福岡県', '北海道', '埼玉県', '千葉県']
+CITIES = ['中央区', '港区', '北区', '西区', '南区', '青葉区', '緑区', '浦和区']
+
+
+def generate_roster(rows, seed=42):
+    rng = random.Random(seed)
+    roster = []
+    for index in range(rows):
+        roster.append({
+            '社員番号': f"{100000 + index}",
+            '氏名': f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+            'フリガナ': f"{rng.choice(KANA)} {rng.choice(KANA)}",
+            '性別': rng.choice(['男', '女']),
+            '生年月日': f"{rng.randint(1950, 2005)}/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}",
+            '郵便番号': f"{rng.randint(100, 999)}-{rng.randint(0, 9999):04d}",
+            '住所': f"{rng.choice(PREFECTURES)}{rng.choice(CITIES)}{rng.randint(1, 9)}丁目{rng.randint(1, 30)}番{rng.randint(1, 20)}号",
+            '電話番号': f"0{rng.randint(10, 99)}-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+            '入社日': f"{rng.randint(1975, 2024)}-{rng.randint(1, 12):02d}-01",
+            '所属': rng.choice(['営業部', '総務部', '開発部', '人事部', '経理部']),
+            '備考': rng.choice(['', '', '', '扶養あり', '短時間勤務']),
+        })
+    return roster
+
+
+def load_roster(path):
+    for encoding in ('utf-8-sig', 'cp932'):
+        try:
+            with open(path, 'r', encoding=encoding, newline='') as f:
+                return list(csv.DictReader(f))
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Cannot decode {path} as UTF-8 or Shift_JIS.")
+
+
+def legacy_dumps(payload):
+    """
+    How chunks were stored before PayloadCodec: ASCII-escaped JSON text.
+    """
+    return json.dumps(payload).encode('utf-8')
+
+
+def legacy_loads(raw):
+    return json.loads(raw.decode('utf-8'))
+
+
+def get_codecs():
+    codecs = [
+        ('legacy json (ascii)', legacy_dumps, legacy_loads),
+        ('json utf-8', lambda payload: PayloadCodec.dumps(payload, PayloadCodec.NONE, 0), PayloadCodec.loads),
+        ('json utf-8 + zlib', lambda payload: PayloadCodec.dumps(payload, PayloadCodec.ZLIB, 0), PayloadCodec.loads),
+    ]
+    if importlib.util.find_spec('lz4'):
+        codecs.append(
+            ('json utf-8 + lz4', lambda payload: PayloadCodec.dumps(payload, PayloadCodec.LZ4, 0), PayloadCodec.loads)
+        )
+    else:
+        logger.info("lz4 not installed; skipping LZ4.")
+    return codecs
+
+
+def measure(dumps, loads, payloads, repeat):
+    best_encode = best_decode = None
+    stored = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stored = [dumps(payload) for payload in payloads]
+        encode_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        decoded = [loads(raw) for raw in stored]
+        decode_time = time.perf_counter() - started
+
+        best_encode = encode_time if best_encode is None else min(best_encode, encode_time)
+        best_decode = decode_time if best_decode is None else min(best_decode, decode_time)
+    return sum(len(raw) for raw in stored), best_encode, best_decode, decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Redis payload encodings on roster chunks.")
+    parser.add_argument('roster', nargs='?', help="CSV roster with a header row.")
+    parser.add_argument('--rows', type=int, default=50000, help="Rows of the synthetic roster.")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    roster = load_roster(args.roster) if args.roster else generate_roster(args.rows)
+    logger.info(f"Roster: {len(roster)} rows ({args.roster or 'synthetic'}), chunks of {args.chunk_size}.")
+
+    # processed:* chunks hold dict rows, display:* chunks hold list rows.
+    chunks = [roster[start:start + args.chunk_size] for start in range(0, len(roster), args.chunk_size)]
+    workloads = [
+        ('processed', [ChunkCodec.encode(chunk) for chunk in chunks]),
+        ('display', [ChunkCodec.encode([list(row.values()) for row in chunk]) for chunk in chunks]),
+    ]
+
+    codecs = get_codecs()
+    exit_code = 0
+    for workload, payloads in workloads:
+        legacy_size = None
+        for name, dumps, loads in codecs:
+            size, encode_time, decode_time, decoded = measure(dumps, loads, payloads, args.repeat)
+            legacy_size = legacy_size or size
+            if decoded != payloads:
+                logger.error(f"{workload} / {name}: decoded payloads differ from the originals.")
+                exit_code = 1
+            logger.info(
+                f"{workload:<9} {name:<20} {size / 1048576:8.2f} MB ({size / legacy_size:6.1%}), "
+                f"encode {encode_time:.3f}s, decode {decode_time:.3f}s"
+            )
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -5,7 +5,9 @@ from django.shortcuts import render, redirect
 from django.http import JsonResponse
 
 from process.fetch_data import FileFormatFetcher
+from process.session_namespace import SessionNamespace
 from process.redis import redis_client
+from process.session_index import SessionIndex
 import logging
 from process.views import process_and_display, save_format_field
 from configs.utils import get_edit_options
@@ -40,7 +42,7 @@ class HomeView(View):
                 tab = "upload-file"
 
             if tab == "upload-file":
-                redis_client.delete_all_keys()
+                SessionNamespace.clear(redis_client.get_client(), request.session.session_key)
                 context = {"tab": tab}
             elif tab == "process-file":
                 context = {"tab": tab}
@@ -56,11 +58,11 @@ class GetEditOptionsView(LoginRequiredMixin, View):
     def get(self, request):
         try:
             client = redis_client.get_client()
-            file_keys = client.keys(f'{request.session.session_key}-file:*')
+            file_names = SessionIndex.get_file_names(client, request.session.session_key)
 
             data_format_id = None
-            if file_keys:
-                first_file_key = file_keys[0].decode('utf-8').split(':')[1]
+            if file_names:
+                first_file_key = file_names[0]
                 file_format_key = f'{request.session.session_key}-file-format:{first_file_key}'
                 file_format = client.get(file_format_key)
 
@@ -0,0 +1,116 @@
+import logging
+from .redis import PayloadCodec
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkCodec:
+    """
+    Versioned columnar encoding for the row chunks stored under processed:* and display:* keys.
+
+    A chunk stores its header schema once and its values column by column, instead of
+    repeating every header on every row (processed:*) or nesting one list per row (display:*):
+
+        {"v": 1, "kind": "dict", "rows": 2, "headers": ["name", "sex"],
+         "columns": [["A", "B"], ["1", "2"]]}
+
+    Payloads written before this format (plain JSON lists) are still decoded as they are.
+    The payload is stored through PayloadCodec (UTF-8 JSON, compressed above a size threshold).
+    """
+    VERSION = 1
+
+    KIND_DICT = 'dict'
+    KIND_LIST = 'list'
+    KIND_RECORDS = 'records'
+
+    @staticmethod
+    def encode(rows):
+        """
+        Build the columnar payload for a list of dict rows or list rows.
+        """
+        rows = list(rows)
+        payload = {'v': ChunkCodec.VERSION, 'rows': len(rows)}
+
+        if rows and all(isinstance(row, dict) for row in rows):
+            headers = list(rows[0].keys())
+            header_set = rows[0].keys()
+            if all(row.keys() == header_set for row in rows):
+                payload['kind'] = ChunkCodec.KIND_DICT
+                payload['headers'] = headers
+                payload['columns'] = [[row[header] for row in rows] for header in headers]
+            else:
+                payload['kind'] = ChunkCodec.KIND_RECORDS
+                payload['records'] = rows
+            return payload
+
+        payload['kind'] = ChunkCodec.KIND_LIST
+        lengths = [len(row) for row in rows]
+        width = max(lengths, default=0)
+        payload['width'] = width
+        payload['columns'] = [
+            [row[pos] if pos < len(row) else None for row in rows]
+            for pos in range(width)
+        ]
+        if any(length != width for length in lengths):
+            payload['lengths'] = lengths
+        return payload
+
+    @staticmethod
+    def decode(payload):
+        """
+        Rebuild the rows of a payload produced by encode(). Legacy payloads are returned unchanged.
+        """
+        if not isinstance(payload, dict) or 'v' not in payload:
+            return payload
+
+        if payload['v'] != ChunkCodec.VERSION:
+            raise ValueError(f"Unsupported chunk format version: {payload['v']}")
+
+        kind = payload.get('kind')
+        row_count = payload.get('rows', 0)
+        columns = payload.get('columns') or []
+
+        if kind == ChunkCodec.KIND_RECORDS:
+            return payload.get('records', [])
+
+        if kind == ChunkCodec.KIND_DICT:
+            headers = payload.get('headers', [])
+            if not columns:
+                return [{} for _ in range(row_count)]
+            return [dict(zip(headers, values)) for values in zip(*columns)]
+
+        if kind == ChunkCodec.KIND_LIST:
+            if not columns:
+                return [[] for _ in range(row_count)]
+            rows = [list(values) for values in zip(*columns)]
+            lengths = payload.get('lengths')
+            if lengths:
+                rows = [row[:length] for row, length in zip(rows, lengths)]
+            return rows
+
+        raise ValueError(f"Unknown chunk kind: {kind}")
+
+    @staticmethod
+    def dumps(rows):
+        return PayloadCodec.dumps(ChunkCodec.encode(rows))
+
+    @staticmethod
+    def loads(raw):
+        return ChunkCodec.decode(PayloadCodec.loads(raw))
+
+    @staticmethod
+    def row_counts_key(session_id, kind):
+        """
+        Hash of '<file_index>:<chunk_index>' -> row count for the session's '{kind}:' chunks.
+        """
+        return f"{session_id}-{kind}-rows"
+
+    @staticmethod
+    def row_count(raw):
+        """
+        Number of rows in a stored chunk.
+        """
+        payload = PayloadCodec.loads(raw)
+        if isinstance(payload, dict) and 'v' in payload:
+            return payload.get('rows', 0)
+        return len(payload)
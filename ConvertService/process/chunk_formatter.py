@@ -0,0 +1,130 @@
+import os
+import logging
+from .chunk_codec import ChunkCodec
+from .job_progress import JobProgress
+from .redis import redis_client, RedisClient
+from .session_index import SessionIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkFormatter:
+    """
+    Convert stored chunks with a ConversionPlan, optionally fanned out to a process pool.
+
+    Every chunk gets its global row offset up front, so chunks are independent and can be
+    converted in any order while the output keeps the original row order. Like
+    PdfFormExtractor, this module imports nothing from Django at import time: spawned
+    workers set Django up once in their initializer and rebuild the plan from its spec.
+    """
+    _worker_plan = None
+
+    @staticmethod
+    def format_chunk(client, plan, session_id, key, type_key, row_offset, data_dict=None, writer=None, job_id=None):
+        """
+        Convert the chunk stored at key and write it to '{session_id}-{type_key}:<same suffix>',
+        claimed for job_id. data_dict is the already decoded chunk (read from client otherwise);
+        writer is where the result is written (default: client).
+        Returns the number of rows written and the written key (None if nothing was written).
+        """
+        if data_dict is None:
+            raw_data = client.get(key)
+            data_dict = ChunkCodec.loads(raw_data) if raw_data else None
+        if data_dict is None:
+            logger.warning(f"No valid data found for key {key}. Skipping...")
+            return 0, None
+
+        rows = data_dict if isinstance(data_dict, list) else list(data_dict.values())
+
+        for idx, row in enumerate(rows):
+            if isinstance(row, dict):
+                row['row_index'] = row_offset + idx
+
+        if isinstance(data_dict, list) and plan.width == 0:
+            display_data = []
+        else:
+            display_data = plan.apply_rows(rows)
+
+        suffix = ChunkFormatter.key_suffix(key)
+        target_key = f"{session_id}-{type_key}:{suffix}"
+        writer = writer or client
+        JobProgress.claim(writer, session_id, [target_key], job_id)
+        writer.set(target_key, ChunkCodec.dumps(display_data), ex=3600)
+        SessionIndex.add(writer, session_id, type_key, suffix)
+        return len(display_data), target_key
+
+    @staticmethod
+    def key_suffix(key):
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        return key.split(':', 1)[1]
+
+    @staticmethod
+    def _init_worker(plan_spec):
+        import django
+        from django.apps import apps
+
+        if not apps.ready:
+            django.setup()
+
+        from .utils import ConversionPlan
+        ChunkFormatter._worker_plan = ConversionPlan.from_spec(plan_spec)
+
+    @staticmethod
+    def _format_chunk_task(args):
+        session_id, key, type_key, row_offset, job_id = args
+        plan = ChunkFormatter._worker_plan
+        try:
+            row_count, written_key = ChunkFormatter.format_chunk(
+                redis_client.get_client(), plan, session_id, key, type_key, row_offset, job_id=job_id
+            )
+        except Exception as e:
+            logger.error(f"Error processing key {key}: {e}")
+            row_count, written_key = 0, None
+        return ChunkFormatter.key_suffix(key), row_count, written_key, plan.drain_memo_stats()
+
+    @staticmethod
+    def format_chunks(session_id, keys, row_offsets, plan, type_key, max_workers=None, progress=None, job_id=None):
+        """
+        Convert every key (with its row offset) and return (suffix, rows written) per key, in key order.
+        Memo statistics of pool workers are merged into plan; progress(suffix, rows, written key) is
+        called after each chunk and may raise to stop early (the pool is then terminated).
+        The written chunks are claimed for job_id (see JobProgress.claim).
+        """
+        workers = min(max_workers or os.cpu_count() or 1, len(keys))
+
+        if workers <= 1:
+            # Chunks are read a window per round trip and written through a pipeline.
+            client = redis_client.get_client()
+            results = []
+            with RedisClient.batch_writer(client) as writer:
+                chunks = RedisClient.iter_values(client, keys, decode=ChunkCodec.loads)
+                for (key, data_dict), row_offset in zip(chunks, row_offsets):
+                    try:
+                        row_count, written_key = ChunkFormatter.format_chunk(
+                            client, plan, session_id, key, type_key, row_offset, data_dict, writer, job_id
+                        )
+                    except Exception as e:
+                        logger.error(f"Error processing key {key}: {e}")
+                        row_count, written_key = 0, None
+                    suffix = ChunkFormatter.key_suffix(key)
+                    results.append((suffix, row_count))
+                    if progress:
+                        progress(suffix, row_count, written_key)
+            return results
+
+        import billiard
+
+        tasks = [(session_id, key, type_key, row_offset, job_id) for key, row_offset in zip(keys, row_offsets)]
+        with billiard.get_context('spawn').Pool(
+                processes=workers,
+                initializer=ChunkFormatter._init_worker,
+                initargs=(plan.to_spec(),)
+        ) as pool:
+            results = []
+            for suffix, row_count, written_key, stats in pool.imap(ChunkFormatter._format_chunk_task, tasks):
+                plan.merge_memo_stats(stats)
+                results.append((suffix, row_count))
+                if progress:
+                    progress(suffix, row_count, written_key)
+        return results
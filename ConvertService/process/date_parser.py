@@ -0,0 +1,169 @@
+import datetime
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DateParser:
+    """
+    Date normalization behind the CR_DATE1 / CR_DATE2 rules.
+
+    Patterns are compiled once and a value is routed by its first character, so only the
+    patterns that can match it are tried. Already normalized 'YYYY/MM/DD' / 'YYYY-MM-DD'
+    input is parsed by slicing, without any regex.
+
+    Ambiguity policy (identical to the historical DataFormatter.convert_date results):
+    - A trailing time ('12:30', '9.05.00 PM', ...) preceded by whitespace is dropped.
+    - Era dates: S = 昭和 (1925 + n), H = 平成 (1988 + n), R = 令和 (2018 + n).
+    - Four-digit leading year (YYYY?MM?DD, YYYY年MM月DD日) is always year-month-day;
+      an impossible date is returned unchanged, never reinterpreted as YYYY?DD?MM.
+    - NN?NN?YYYY is day-first (DD/MM/YYYY). It is read month-first (MM/DD/YYYY) only when
+      the day-first reading is impossible and the first number is at most 12.
+      A first number above 12 that still gives an impossible date is returned unchanged.
+    - When both readings fail, the value is retried as NN?NN?YY (first two digits of the
+      year, pivot: < 50 -> 20YY, otherwise 19YY), month-first then day-first.
+    - Matching is anchored at the start only; trailing text after the date is ignored.
+    - Values that match nothing are returned stripped (and without the time part).
+    """
+    ERA_BASE_YEARS = {"S": 1925, "H": 1988, "R": 2018, "昭和": 1925, "平成": 1988, "令和": 2018}
+    DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+    FAST_FORMATS = {'%Y/%m/%d': '/', '%Y-%m-%d': '-'}
+    ASCII_DIGITS = frozenset('0123456789')
+
+    TIME_PATTERN = re.compile(r'(\s+\d{1,2}[:\.]\d{1,2}([:\.]\d{1,2})?\s*(AM|PM|am|pm)?)')
+    ERA_PATTERN = re.compile(r'([SHR])\s*(\d{1,2})[.\-年/](\d{1,2})[.\-月/](\d{1,2})日?')
+    KANJI_ERA_PATTERN = re.compile(r'(昭和|平成|令和)\s*(\d{1,2})[.\-年/](\d{1,2})[.\-月/](\d{1,2})日?')
+    ISO_PATTERN = re.compile(r'(\d{4})([.\-/])(\d{1,2})\2(\d{1,2})')
+    KANJI_PATTERN = re.compile(r'(\d{4})年(\d{1,2})月(\d{1,2})日?')
+    DAY_FIRST_PATTERN = re.compile(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{4})')
+    SHORT_YEAR_PATTERN = re.compile(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{2})')
+
+    @staticmethod
+    def is_valid_date(year, month, day):
+        if not 1 <= year <= 9999 or not 1 <= month <= 12 or day < 1:
+            return False
+        if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+            return day <= 29
+        return day <= DateParser.DAYS_IN_MONTH[month]
+
+    @staticmethod
+    def format_date(year, month, day, target_format):
+        separator = DateParser.FAST_FORMATS.get(target_format)
+        if separator and year >= 1000:
+            return f"{year}{separator}{month:02d}{separator}{day:02d}"
+        return datetime.datetime(year, month, day).strftime(target_format)
+
+    @staticmethod
+    def _parse_normalized(value):
+        """
+        Parse 'YYYY/MM/DD' or 'YYYY-MM-DD' of ASCII digits by slicing. Returns None for anything else.
+        """
+        if len(value) != 10:
+            return None
+        separator = value[4]
+        if separator not in '/-' or value[7] != separator:
+            return None
+        digits = value[:4] + value[5:7] + value[8:]
+        if not DateParser.ASCII_DIGITS.issuperset(digits):
+            return None
+        return int(value[:4]), int(value[5:7]), int(value[8:])
+
+    @staticmethod
+    def _parse_era(match):
+        era, year, month, day = match.groups()
+        return int(year) + DateParser.ERA_BASE_YEARS[era], int(month), int(day)
+
+    @staticmethod
+    def _parse_numeric(value):
+        """
+        Parse a value starting with a digit. Returns (year, month, day), None when nothing
+        matched, or False when a pattern matched an impossible date.
+        """
+        match = DateParser.ISO_PATTERN.match(value)
+        if match:
+            year, _, month, day = match.groups()
+            return int(year), int(month), int(day)
+
+        match = DateParser.KANJI_PATTERN.match(value)
+        if match:
+            year, month, day = map(int, match.groups())
+            return year, month, day
+
+        match = DateParser.DAY_FIRST_PATTERN.match(value)
+        if match:
+            first, _, second, year = match.groups()
+            first, second, year = int(first), int(second), int(year)
+            if first > 12 or (second <= 12 and DateParser.is_valid_date(year, second, first)):
+                return year, second, first
+            if DateParser.is_valid_date(year, first, second):
+                return year, first, second
+
+        match = DateParser.SHORT_YEAR_PATTERN.match(value)
+        if not match:
+            return None
+
+        first, _, second, short_year = match.groups()
+        first, second, short_year = int(first), int(second), int(short_year)
+        full_year = short_year + (2000 if short_year < 50 else 1900)
+        if first <= 12 and second <= 31 and DateParser.is_valid_date(full_year, first, second):
+            return full_year, first, second
+        if second <= 12 and first <= 31 and DateParser.is_valid_date(full_year, second, first):
+            return full_year, second, first
+        return None
+
+    @staticmethod
+    def parse(value):
+        """
+        Parse a date string.
+        Returns ((year, month, day) or None, remaining value). A None date means the value
+        is not a date, False means it looks like one but the date does not exist.
+        """
+        value = value.strip()
+
+        parsed = DateParser._parse_normalized(value)
+        if parsed:
+            return (parsed if DateParser.is_valid_date(*parsed) else False), value
+
+        time_match = DateParser.TIME_PATTERN.search(value)
+        if time_match:
+            value = value.replace(time_match.group(1), '').strip()
+
+        if not value:
+            return None, value
+
+        first_char = value[0]
+        if first_char in 'SHR':
+            match = DateParser.ERA_PATTERN.match(value)
+            parsed = DateParser._parse_era(match) if match else None
+        elif first_char in '昭平令':
+            match = DateParser.KANJI_ERA_PATTERN.match(value)
+            parsed = DateParser._parse_era(match) if match else None
+        elif first_char.isdecimal():
+            parsed = DateParser._parse_numeric(value)
+        else:
+            parsed = None
+
+        if parsed and not DateParser.is_valid_date(*parsed):
+            parsed = False
+        return parsed, value
+
+    @staticmethod
+    def convert(value, target_format='%Y/%m/%d'):
+        """
+        Convert a date string to target_format. Returns "" for empty or non-string input
+        and the (stripped) value itself when it is not a valid date.
+        """
+        if not value or not isinstance(value, str):
+            return ""
+
+        try:
+            parsed, value = DateParser.parse(value)
+            if not parsed:
+                if parsed is False:
+                    logger.debug(f"Invalid date: {value}")
+                return value
+            return DateParser.format_date(*parsed, target_format)
+        except Exception as e:
+            logger.error(f"Error converting date: {value} -> {e}")
+            return value
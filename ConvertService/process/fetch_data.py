@@ -1,11 +1,10 @@
 import csv
 from functools import lru_cache
-import json
 from accounts.models import Account
 from .data_type import HeaderType, DisplayType, DownloadType
 from configs.models import ConvertDataValue
 from home.models import DataConversionInfo, DataFormat, DetailedInfo, DataItemType, FileFormat
-from .redis import redis_client
+from .redis import redis_client, PayloadCodec
 import logging
 
 logger = logging.getLogger(__name__)
@@ -124,9 +123,12 @@ class FileFormatFetcher:
         '.xlsx': 'EXCEL',
         '.xls': 'EXCEL',
         '.json': 'JSON',
+        '.jsonl': 'JSON',
         '.xml': 'XML',
     }
 
+    CSV_FORMATS = ['CSV_C_SJIS', 'CSV_C_UTF-8', 'CSV_T_SJIS', 'CSV_T_UTF-8']
+
     CACHE_TIMEOUT = 3600
 
     FORMAT_TO_DATA_FORMAT = {
@@ -146,16 +148,27 @@ class FileFormatFetcher:
     @staticmethod
     def get_allowed_formats_for_tenant(session_id, tenant_id):
         client = redis_client.get_client()
-        cache_key = f'tenant:{tenant_id}:allowed_formats'
 
         first_extension = client.get(f'{session_id}-file-format')
         if first_extension:
             first_extension = first_extension.decode('utf-8')
+            if first_extension.startswith('CSV'):
+                # CSV variants only differ by encoding/delimiter, which are detected per file:
+                # any variant the tenant accepts may follow.
+                tenant_formats = FileFormatFetcher.get_tenant_formats(tenant_id)
+                return [file_format for file_format in FileFormatFetcher.CSV_FORMATS if file_format in tenant_formats]
             return [first_extension]
 
+        return FileFormatFetcher.get_tenant_formats(tenant_id)
+
+    @staticmethod
+    def get_tenant_formats(tenant_id):
+        client = redis_client.get_client()
+        cache_key = f'tenant:{tenant_id}:allowed_formats'
+
         cached_formats = client.get(cache_key)
         if cached_formats:
-            return json.loads(cached_formats.decode('utf-8'))
+            return PayloadCodec.loads(cached_formats)
 
         try:
             formats = DataFormat.objects.filter(
@@ -169,7 +182,7 @@ class FileFormatFetcher:
             if not allowed_formats:
                 allowed_formats = []
 
-            client.set(cache_key, json.dumps(allowed_formats), ex=FileFormatFetcher.CACHE_TIMEOUT)
+            client.set(cache_key, PayloadCodec.dumps(allowed_formats), ex=FileFormatFetcher.CACHE_TIMEOUT)
 
             return allowed_formats
         except Exception as e:
@@ -177,12 +190,18 @@ class FileFormatFetcher:
             return []
 
     @staticmethod
-    def is_valid_file_type(content_type, file_extension, allowed_formats=None):
+    def is_valid_file_type(content_type, file_extension, allowed_formats=None, file_meta=None):
         """
         Validate if the file type is allowed for this tenant
         """
+        if file_meta and not file_meta.get('supported', True):
+            return False
+
         if not allowed_formats:
-            allowed_formats = ['CSV_C_SJIS', 'CSV_C_UTF-8', 'CSV_T_SJIS', 'CSV_T_UTF-8', 'XML', 'JSON', 'EXCEL']
+            allowed_formats = FileFormatFetcher.CSV_FORMATS + ['XML', 'JSON', 'EXCEL']
+
+        if file_meta and file_meta.get('file_format') in allowed_formats:
+            return True
 
         format_by_content = FileFormatFetcher.CONTENT_TYPE_MAP.get(content_type)
         if format_by_content and format_by_content in allowed_formats:
@@ -195,7 +214,10 @@ class FileFormatFetcher:
         return False
 
     @staticmethod
-    def get_file_format_for_content_type(content_type, file_extension):
+    def get_file_format_for_content_type(content_type, file_extension, file_meta=None):
+        if file_meta and file_meta.get('file_format'):
+            return file_meta['file_format']
+
         format_id = FileFormatFetcher.CONTENT_TYPE_MAP.get(content_type)
         if not format_id:
             format_id = FileFormatFetcher.EXTENSION_MAP.get(file_extension.lower())
@@ -291,8 +313,8 @@ class FileFormatFetcher:
         Clear all file format cache entries
         """
         client = redis_client.get_client()
-        keys = client.keys('*-file-format-*')
-        keys.extend(client.keys('tenant:*:allowed_formats'))
+        keys = redis_client.scan_keys('*-file-format-*')
+        keys.extend(redis_client.scan_keys('tenant:*:allowed_formats'))
 
         if keys:
             client.delete(*keys)
@@ -0,0 +1,214 @@
+import codecs
+import csv
+import hashlib
+import os
+import logging
+import puremagic
+from .fetch_data import FileFormatFetcher
+from .redis import RedisClient, PayloadCodec
+
+logger = logging.getLogger(__name__)
+
+
+class FileInspector:
+    """
+    Fingerprint an uploaded file in a single pass while it is written to disk.
+
+    The resulting metadata record (encoding, delimiter, header, row count, content hash, ...)
+    is stored next to the session's '-file:' key so later stages do not have to sniff
+    or re-read the file again.
+    """
+    SAMPLE_SIZE = 64 * 1024
+    DELIMITERS = [',', ';', '\t', '|']
+    TEXT_EXTENSIONS = ['.csv', '.tsv', '.txt', '.json', '.jsonl', '.xml']
+    DELIMITED_EXTENSIONS = ['.csv', '.tsv', '.txt']
+    TEXT_MAGIC_EXTENSIONS = ['.csv', '.tsv', '.txt', '.json', '.jsonl', '.xml', '.html']
+    BOMS = [
+        (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16'),
+    ]
+    STRICT_ENCODINGS = ['utf-8', 'shift_jis', 'cp932']
+    # Delimited files can only be read as one of the CSV_* formats (UTF-8 or SJIS).
+    UNSUPPORTED_DELIMITED_ENCODINGS = ['utf-16']
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.extension = os.path.splitext(file_name)[1].lower()
+        self._sample = bytearray()
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._line_breaks = 0
+        self._carriage_returns = 0
+        self._last_byte = b''
+        self._decoders = {
+            encoding: codecs.getincrementaldecoder(encoding)()
+            for encoding in self.STRICT_ENCODINGS
+        }
+        self._valid_encodings = set(self.STRICT_ENCODINGS)
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+
+        self._hash.update(chunk)
+        self._size += len(chunk)
+        self._line_breaks += chunk.count(b'\n')
+        self._carriage_returns += chunk.count(b'\r')
+        self._last_byte = chunk[-1:]
+
+        if len(self._sample) < self.SAMPLE_SIZE:
+            self._sample.extend(chunk[:self.SAMPLE_SIZE - len(self._sample)])
+
+        self._validate(chunk, final=False)
+
+    def _validate(self, chunk, final):
+        for encoding in list(self._valid_encodings):
+            try:
+                self._decoders[encoding].decode(chunk, final=final)
+            except UnicodeDecodeError:
+                self._valid_encodings.discard(encoding)
+
+    def _detect_magic(self, sample):
+        try:
+            return puremagic.from_string(sample, filename=self.file_name) or None
+        except Exception:
+            return None
+
+    def _detect_encoding(self, sample):
+        for bom, encoding in self.BOMS:
+            if sample.startswith(bom):
+                return encoding, True
+
+        for encoding in self.STRICT_ENCODINGS:
+            if encoding in self._valid_encodings:
+                return encoding, False
+
+        return 'iso-8859-1', False
+
+    def _detect_delimiter(self, first_line):
+        delimiter_counts = {d: first_line.count(d) for d in self.DELIMITERS}
+        if not any(delimiter_counts.values()):
+            return '\t' if self.extension == '.tsv' else ','
+        return max(delimiter_counts.items(), key=lambda x: x[1])[0]
+
+    def _count_rows(self):
+        if not self._size:
+            return 0
+        line_breaks = self._line_breaks or self._carriage_returns
+        if self._last_byte not in (b'\n', b'\r'):
+            line_breaks += 1
+        return max(line_breaks - 1, 0)
+
+    def _resolve_file_format(self, encoding, delimiter, magic_extension):
+        if self.extension in self.DELIMITED_EXTENSIONS:
+            if encoding in self.UNSUPPORTED_DELIMITED_ENCODINGS:
+                return None
+            separator = 'T' if delimiter == '\t' else 'C'
+            charset = 'UTF-8' if encoding in ('utf-8', 'utf-8-sig') else 'SJIS'
+            return f'CSV_{separator}_{charset}'
+
+        return (
+            FileFormatFetcher.EXTENSION_MAP.get(self.extension)
+            or FileFormatFetcher.EXTENSION_MAP.get(magic_extension or '')
+        )
+
+    def finish(self):
+        """
+        Close the inspection and return the metadata record.
+        """
+        self._validate(b'', final=True)
+        sample = bytes(self._sample)
+
+        magic_extension = self._detect_magic(sample) if sample else None
+        # A BOM marks text even when the magic bytes look like something else (UTF-16).
+        is_text = (
+            self.extension in self.TEXT_EXTENSIONS
+            and (
+                magic_extension is None
+                or magic_extension in self.TEXT_MAGIC_EXTENSIONS
+                or sample.startswith(tuple(bom for bom, _ in self.BOMS))
+            )
+        )
+
+        meta = {
+            'file_name': self.file_name,
+            'extension': self.extension,
+            'size': self._size,
+            'sha256': self._hash.hexdigest(),
+            'magic_extension': magic_extension,
+            'encoding': None,
+            'bom': False,
+            'delimiter': None,
+            'header': None,
+            'row_count': None,
+            'file_format': None,
+            'supported': True,
+        }
+
+        if is_text:
+            encoding, has_bom = self._detect_encoding(sample)
+            text = codecs.getincrementaldecoder(encoding)(errors='ignore').decode(sample, final=False)
+            meta['encoding'] = encoding
+            meta['bom'] = has_bom
+
+            if self.extension in self.DELIMITED_EXTENSIONS:
+                first_line = text.splitlines()[0] if text else ""
+                delimiter = self._detect_delimiter(first_line)
+                header = next(csv.reader([first_line], delimiter=delimiter), [])
+
+                meta['delimiter'] = delimiter
+                meta['header'] = [col.strip() for col in header]
+                meta['row_count'] = self._count_rows()
+                meta['supported'] = encoding not in self.UNSUPPORTED_DELIMITED_ENCODINGS
+
+        meta['file_format'] = self._resolve_file_format(meta['encoding'], meta['delimiter'], magic_extension)
+        return meta
+
+    @staticmethod
+    def inspect_path(file_path, block_size=1024 * 1024):
+        """
+        Inspect a file on disk (for files saved without metadata).
+        """
+        inspector = FileInspector(os.path.basename(str(file_path)))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                inspector.feed(block)
+        return inspector.finish()
+
+    @staticmethod
+    def inspect_upload(uploaded_file):
+        """
+        Inspect a Django UploadedFile without writing it anywhere.
+        """
+        inspector = FileInspector(getattr(uploaded_file, 'name', '') or '')
+        for chunk in uploaded_file.chunks():
+            inspector.feed(chunk)
+        uploaded_file.seek(0)
+        return inspector.finish()
+
+    @staticmethod
+    def get_meta_key(session_id, file_name):
+        return f'{session_id}-file-meta:{file_name}'
+
+    @staticmethod
+    def save_meta(client, session_id, file_name, meta, ex=3600):
+        client.set(FileInspector.get_meta_key(session_id, file_name), PayloadCodec.dumps(meta), ex=ex)
+
+    @staticmethod
+    def load_meta(client, session_id, file_name):
+        try:
+            raw_meta = client.get(FileInspector.get_meta_key(session_id, file_name))
+            return PayloadCodec.loads(raw_meta) if raw_meta else None
+        except Exception as e:
+            logger.warning(f"Error loading file metadata for {file_name}: {e}")
+            return None
+
+    @staticmethod
+    def load_metas(client, session_id, file_names):
+        """
+        Metadata of several files in one pass ({file_name: meta or None}).
+        """
+        meta_keys = [FileInspector.get_meta_key(session_id, file_name) for file_name in file_names]
+        metas = RedisClient.iter_values(client, meta_keys, decode=PayloadCodec.loads)
+        return {file_name: meta for file_name, (_, meta) in zip(file_names, metas)}
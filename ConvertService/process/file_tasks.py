@@ -1,158 +1,572 @@
 import base64
 import csv
+import hashlib
 import io
+import json
 import os
 import logging
+import pickle
+import tempfile
 import threading
 import zipfile
 from django.utils import timezone
 from .utils import (
+    ConversionPlan,
     DataFormatter,
     FileProcessor,
     FileFormatMapper,
     CharacterNormalizer,  
 )
-from .redis import redis_client
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from celery import shared_task
+from .chunk_codec import ChunkCodec
+from .chunk_formatter import ChunkFormatter
+from .file_inspector import FileInspector
+from .job_progress import JobProgress, JobSuperseded
+from .memory_budget import MemoryBudget
+from .result_cache import ConversionResultCache
+from .session_index import SessionIndex
+from .session_namespace import SessionNamespace
+from .task_routing import TaskRouting
+from .tenant_quota import TenantQuota
+from .redis import redis_client, RedisClient, PayloadCodec
+from celery import chord, shared_task
+from django.conf import settings
 from pathlib import Path
-import json
 
 logger = logging.getLogger(__name__)
 
 
+CHUNK_KINDS = ('processed', 'display', 'output')
+
+
+def get_manifest_key(session_id):
+    return f"{session_id}-processed-manifest"
+
+
+def get_fingerprint(value):
+    """
+    Stable hash of a JSON-serializable value (headers, ConversionPlan spec, ...).
+    """
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
 @shared_task
-def process_multiple_files_task(session_id, headers):
+def process_file_task(
+        session_id,
+        headers,
+        file_key,
+        file_index,
+        plan_spec=None,
+        keep_raw=True,
+        cache_key=None,
+        job_id=None
+):
+    """
+    Parse one uploaded file into '{session_id}-processed:{file_index}:<chunk_index>' keys.
+
+    With a plan_spec (fused mode) each parsed chunk is converted right away and written to
+    '{session_id}-display:{file_index}:<chunk_index>'; the raw processed:* chunk is then only
+    stored when keep_raw is set. In fused mode without raw chunks, cache_key selects the
+    ConversionResultCache entry the display chunks are taken from or stored to.
+    A superseded job stops between chunks and discards the chunks it already wrote.
+    """
+    file_name = file_key.split(':', 1)[1]
+    plan = ConversionPlan.from_spec(plan_spec) if plan_spec else None
+    store_raw = plan is None or keep_raw
+    summary = {
+        'file_index': file_index,
+        'file_name': file_name,
+        'sha256': None,
+        'headers_hash': get_fingerprint(headers),
+        'plan_hash': get_fingerprint(plan_spec) if plan_spec else None,
+        'raw': store_raw,
+        'row_count': 0,
+        'chunk_count': 0,
+    }
+    file_path = None
+    written = []
 
     try:
         client = redis_client.get_client()
-        redis_client.delete_key_batch(client.keys(f'{session_id}-processed:*'))
+        JobProgress.check(client, job_id)
+        raw_path = client.get(file_key)
+        if not raw_path:
+            logger.warning(f"File key {file_key} not found. Skipping...")
+            JobProgress.advance(client, job_id, files=1)
+            return {**summary, 'type': 'error', 'result': f"File not found: {file_name}"}
+
+        file_path = Path(raw_path.decode('utf-8'))
+        file_meta = FileInspector.load_meta(client, session_id, file_name)
+        summary['sha256'] = file_meta.get('sha256') if file_meta else None
+
+        row_counts_key = ChunkCodec.row_counts_key(session_id, 'processed')
+        display_row_counts_key = ChunkCodec.row_counts_key(session_id, 'display')
+        use_cache = cache_key is not None and plan is not None and not store_raw
+
+        if use_cache:
+            cached_row_counts = ConversionResultCache.link(client, cache_key, session_id, file_index, file_name, job_id)
+            if cached_row_counts is not None:
+                if cached_row_counts:
+                    client.hset(display_row_counts_key, mapping={
+                        f"{file_index}:{chunk_index}": row_count
+                        for chunk_index, row_count in enumerate(cached_row_counts)
+                    })
+                    client.expire(display_row_counts_key, 3600)
+                summary['row_count'] = sum(cached_row_counts)
+                summary['chunk_count'] = len(cached_row_counts)
+                JobProgress.advance(client, job_id, files=1, rows=summary['row_count'])
+                return {**summary, 'type': 'dict', 'result': f"{summary['row_count']} rows processed."}
+
+        # Chunk writes are queued on a pipeline and sent in batches instead of one round trip each.
+        with MemoryBudget.track(f'parse {file_name}'), RedisClient.batch_writer(client) as writer:
+            display_row_counts = []
+            chunks = FileProcessor.iter_file_chunks(file_path, headers, file_meta=file_meta)
+            for chunk_index, chunk in enumerate(chunks):
+                JobProgress.check(client, job_id)
+                suffix = f"{file_index}:{chunk_index}"
+                if store_raw:
+                    key = f"{session_id}-processed:{suffix}"
+                    JobProgress.claim(writer, session_id, [key], job_id)
+                    writer.set(key, ChunkCodec.dumps(chunk), ex=3600)
+                    SessionIndex.add(writer, session_id, 'processed', suffix)
+                    writer.hset(row_counts_key, suffix, len(chunk))
+                    written.append(key)
+
+                if plan is not None:
+                    display_data = plan.apply_rows(chunk) if plan.width > 0 else []
+                    key = f"{session_id}-display:{suffix}"
+                    JobProgress.claim(writer, session_id, [key], job_id)
+                    writer.set(key, ChunkCodec.dumps(display_data), ex=3600)
+                    SessionIndex.add(writer, session_id, 'display', suffix)
+                    writer.hset(display_row_counts_key, suffix, len(display_data))
+                    display_row_counts.append(len(display_data))
+                    written.append(key)
+
+                summary['row_count'] += len(chunk)
+                summary['chunk_count'] += 1
+                JobProgress.advance(client, job_id, rows=len(chunk))
+
+        client.expire(row_counts_key, 3600)
+        if plan is not None:
+            client.expire(display_row_counts_key, 3600)
+            logger.info(f"{file_name}: {plan.memo_report()}")
+
+        if use_cache:
+            ConversionResultCache.store(client, cache_key, session_id, file_index, display_row_counts)
+
+        JobProgress.advance(client, job_id, files=1)
+        return {**summary, 'type': 'dict', 'result': f"{summary['row_count']} rows processed."}
+    except JobSuperseded:
+        logger.info(f"Processing of {file_name} superseded after {summary['chunk_count']} chunks.")
+        JobProgress.discard(redis_client.get_client(), session_id, job_id, written)
+        return {**summary, 'type': 'cancelled', 'result': JobProgress.CANCELLED_MESSAGE}
+    except Exception as e:
+        logger.error(f"Error processing file {file_path or file_name}: {e}")
+        client = redis_client.get_client()
+        # A half-parsed file must not reach formatting or export: drop what was written of it.
+        for kind in ('processed', 'display'):
+            drop_chunks(client, session_id, kind, f"{file_index}:")
+        JobProgress.advance(client, job_id, files=1)
+        return {**summary, 'type': 'error', 'result': str(e)}
 
-        keys = client.keys(f'{session_id}-file:*')
-        if not keys:
-            logger.warning("No files to process.")
-            return {"status": "error", "message": "No files to process."}
 
-        output_results = []
+def save_manifest(client, session_id, files, fused):
+    files = sorted(files, key=lambda item: item['file_index'])
+    manifest = {
+        'files': files,
+        'row_count': sum(item['row_count'] for item in files),
+        'fused': fused,
+        'completed_at': timezone.now().isoformat(),
+    }
+    client.set(get_manifest_key(session_id), PayloadCodec.dumps(manifest), ex=3600)
+    return manifest
 
-        def process_and_convert(file_path, key, file_index):
-            try:
-                file_path = Path(file_path)
-                result_dict = FileProcessor.process_file(file_path, headers)
 
-                redis_key = f"{session_id}-processed:{file_index}"
-                client.set(redis_key, json.dumps(result_dict), ex=3600)
+@shared_task
+def record_processed_manifest(results, session_id, fused=False, reused=None, job_id=None):
+    """
+    Chord callback of process_multiple_files_task: store the manifest of the parsed files,
+    together with the entries of the files that were reused unchanged.
+    """
+    try:
+        client = redis_client.get_client()
+        JobProgress.check(client, job_id)
+        manifest = save_manifest(client, session_id, list(results) + list(reused or []), fused)
+
+        logger.info(
+            f"Processed {len(results)} files, reused {len(reused or [])}, "
+            f"{manifest['row_count']} rows in total."
+        )
+        errors = [f"{item['file_name']}: {item['result']}" for item in manifest['files'] if item['type'] == 'error']
+        JobProgress.finish(client, job_id, JobProgress.SUCCESS, " / ".join(errors))
+        return {
+            "status": "success",
+            "results": [{'type': item['type'], 'result': item['result']} for item in manifest['files']],
+        }
+    except JobSuperseded:
+        # No manifest: the chunks of a superseded run are never reused.
+        logger.info(f"File processing job {job_id} superseded; manifest not saved.")
+        JobProgress.finish(redis_client.get_client(), job_id, JobProgress.CANCELLED, JobProgress.CANCELLED_MESSAGE)
+        return {"status": "cancelled", "message": JobProgress.CANCELLED_MESSAGE}
+    except Exception as e:
+        logger.error(f"Error in 'record_processed_manifest': {e}")
+        JobProgress.finish(redis_client.get_client(), job_id, JobProgress.FAILURE, "ファイル処理中にエラーが発生しました。")
+        return {"status": "error", "message": f"An error occurred while processing files: {str(e)}"}
+
 
-                client.delete(key)
-                return {'type': 'dict', 'result': f"{len(result_dict)} rows processed."}
-            except Exception as e:
-                logger.error(f"Error processing file {file_path}: {e}")
-                return {'type': 'error', 'result': str(e)}
-
-        max_workers = os.cpu_count() or 1
-        logger.info(f"Processing files with {max_workers} workers.")
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(process_and_convert, client.get(key).decode('utf-8'), key, file_index): key
-                for file_index, key in enumerate(keys, start=1)
-            }
-            for future in as_completed(futures):
-                try:
-                    result = future.result()
-                    if result:
-                        output_results.append(result)
-                except Exception as e:
-                    logger.error(f"Error processing future: {e}")
+def load_manifest(client, session_id):
+    try:
+        raw_manifest = client.get(get_manifest_key(session_id))
+        return PayloadCodec.loads(raw_manifest) if raw_manifest else None
+    except Exception as e:
+        logger.warning(f"Error loading processed manifest: {e}")
+        return None
+
+
+def drop_chunks(client, session_id, kind, prefix=''):
+    """
+    Delete the session's '{kind}:' chunks whose suffix starts with prefix (all by default),
+    their index entries and their row counts.
+    """
+    suffixes = SessionIndex.get_suffixes(client, session_id, kind, prefix)
+    if suffixes:
+        keys = [f"{session_id}-{kind}:{suffix}" for suffix in suffixes]
+        redis_client.delete_key_batch(keys)
+        SessionIndex.remove(client, session_id, kind, *suffixes)
+        JobProgress.disown(client, session_id, keys)
+
+    row_counts_key = ChunkCodec.row_counts_key(session_id, kind)
+    fields = [field for field in client.hkeys(row_counts_key) if field.decode('utf-8').startswith(prefix)]
+    if fields:
+        client.hdel(row_counts_key, *fields)
+
+
+def drop_file_chunks(client, session_id, file_index):
+    """
+    Delete every chunk of one file (processed:*, display:*, output:*) and its row counts.
+    """
+    for kind in CHUNK_KINDS:
+        drop_chunks(client, session_id, kind, f"{file_index}:")
+
+
+def drop_session_file(client, session_id, file_name):
+    """
+    Remove the data of a deleted upload from the session's results and manifest.
+    """
+    manifest = load_manifest(client, session_id)
+    if not manifest:
+        return
 
-        logger.info("All files processed successfully.")
-        return {"status": "success", "results": output_results}
+    remaining = []
+    for entry in manifest['files']:
+        if entry['file_name'] == file_name:
+            drop_file_chunks(client, session_id, entry['file_index'])
+        else:
+            remaining.append(entry)
+
+    if remaining:
+        save_manifest(client, session_id, remaining, manifest.get('fused', False))
+    else:
+        client.delete(get_manifest_key(session_id))
+
+
+def is_reusable(entry, sha256, headers_hash, plan_hash, needs_raw):
+    return (
+        entry.get('type') != 'error'
+        and sha256 is not None
+        and entry.get('sha256') == sha256
+        and entry.get('headers_hash') == headers_hash
+        and (not needs_raw or entry.get('raw'))
+        and (plan_hash is None or entry.get('plan_hash') == plan_hash)
+    )
+
+
+def get_cache_key(sha256, tenant_id, data_format_id, headers, plan_spec):
+    config_hash = get_fingerprint({'headers': headers, 'plan': plan_spec, 'codec': ChunkCodec.VERSION})
+    return get_fingerprint([sha256, tenant_id, data_format_id, config_hash])
+
+
+def dispatch_file_processing(
+        session_id,
+        headers,
+        plan=None,
+        keep_raw=None,
+        tenant_id=None,
+        data_format_id=None,
+        job_id=None
+):
+    """
+    Bring the session's processed chunks up to date with its uploaded files.
+
+    The manifest of the previous run identifies each file by name and content hash: unchanged
+    files are reused as they are, new or changed files get one process_file_task each, and
+    the chunks of files that are gone are deleted. A file keeps its file index across runs,
+    so the global row order is simply the order of the chunk keys.
+    record_processed_manifest is the chord callback. Returns the AsyncResult of the
+    manifest task, or None when there are no uploaded files.
+
+    Passing the input -> display ConversionPlan selects fused mode: display:* chunks are
+    written during parsing and processed:* chunks are kept only if keep_raw
+    (default: the KEEP_PROCESSED_CHUNKS setting). Fused runs without raw chunks for a known
+    tenant go through the cross-session ConversionResultCache.
+    """
+    if keep_raw is None:
+        keep_raw = getattr(settings, 'KEEP_PROCESSED_CHUNKS', False)
+
+    client = redis_client.get_client()
+    manifest = load_manifest(client, session_id) or {}
+    previous = {entry['file_name']: entry for entry in manifest.get('files', [])}
+    file_names = SessionIndex.get_file_names(client, session_id)
+
+    fused = plan is not None
+    plan_spec = plan.to_spec() if fused else None
+    headers_hash = get_fingerprint(headers)
+    plan_hash = get_fingerprint(plan_spec) if fused else None
+    needs_raw = not fused or keep_raw
+    use_cache = not needs_raw and tenant_id is not None and ConversionResultCache.is_enabled()
+
+    next_index = max((entry['file_index'] for entry in previous.values()), default=0) + 1
+    file_metas = FileInspector.load_metas(client, session_id, file_names)
+    reused = []
+    pending = []
+    for file_name in file_names:
+        entry = previous.pop(file_name, None)
+        file_meta = file_metas[file_name]
+        sha256 = file_meta.get('sha256') if file_meta else None
+
+        if entry and is_reusable(entry, sha256, headers_hash, plan_hash, needs_raw):
+            # Without a plan, display:* is rebuilt from processed:* by process_and_format_file.
+            reused.append(entry if fused else {**entry, 'plan_hash': None})
+            continue
+
+        if entry:
+            file_index = entry['file_index']
+        else:
+            file_index = next_index
+            next_index += 1
+        # Also clears what an interrupted run may have left under a new file's index.
+        drop_file_chunks(client, session_id, file_index)
+        cache_key = get_cache_key(sha256, tenant_id, data_format_id, headers, plan_spec) if use_cache and sha256 else None
+        pending.append((f'{session_id}-file:{file_name}', file_index, cache_key))
+
+    for entry in previous.values():
+        drop_file_chunks(client, session_id, entry['file_index'])
+
+    if not file_names:
+        client.delete(get_manifest_key(session_id))
+        return None
+
+    pending_rows = [
+        (file_metas[file_key.split(':', 1)[1]] or {}).get('row_count')
+        for file_key, _, _ in pending
+    ]
+    reused_rows = sum(entry['row_count'] for entry in reused)
+    task_options = TaskRouting.get_options(sum(pending_rows) if None not in pending_rows else None)
+    JobProgress.update(
+        client,
+        job_id,
+        stage='parsing',
+        files_total=len(file_names),
+        files_done=len(reused),
+        rows_done=reused_rows,
+        rows_total=reused_rows + sum(pending_rows) if None not in pending_rows else 0
+    )
+
+    logger.info(f"Dispatching {len(pending)} file processing tasks, reusing {len(reused)} files (fused: {fused}).")
+    if not pending:
+        return record_processed_manifest.apply_async(([], session_id, fused, reused, job_id), **task_options)
+
+    return chord(
+        process_file_task.s(
+            session_id, headers, file_key, file_index, plan_spec, keep_raw, cache_key, job_id
+        ).set(**task_options)
+        for file_key, file_index, cache_key in pending
+    )(record_processed_manifest.s(session_id, fused, reused, job_id).set(**task_options))
+
+
+def acquire_tenant_slot(task, client, tenant_id, job_id, row_count):
+    """
+    Admit a heavy job under its tenant's quota; interactive jobs are not limited.
+    Re-queues the task (Celery retry) while the tenant has no free slot. Returns False when
+    the job was superseded while waiting (it is then finished as cancelled).
+    """
+    if not job_id or tenant_id is None or TaskRouting.is_interactive(row_count):
+        return True
+
+    try:
+        JobProgress.check(client, job_id)
+    except JobSuperseded:
+        JobProgress.finish(client, job_id, JobProgress.CANCELLED, JobProgress.CANCELLED_MESSAGE)
+        return False
+
+    if TenantQuota.acquire(client, tenant_id, job_id):
+        return True
+
+    JobProgress.update(client, job_id, status=JobProgress.PENDING, stage='waiting')
+    raise task.retry(countdown=TenantQuota.get_retry_delay(), max_retries=None)
+
+
+@shared_task(bind=True)
+def process_multiple_files_task(
+        self,
+        session_id,
+        headers,
+        plan_spec=None,
+        keep_raw=None,
+        tenant_id=None,
+        data_format_id=None,
+        job_id=None
+):
+    client = redis_client.get_client()
+    if not acquire_tenant_slot(self, client, tenant_id, job_id, TaskRouting.count_upload_rows(client, session_id)):
+        return {"status": "cancelled", "message": JobProgress.CANCELLED_MESSAGE}
+
+    try:
+        plan = ConversionPlan.from_spec(plan_spec) if plan_spec else None
+        job = dispatch_file_processing(session_id, headers, plan, keep_raw, tenant_id, data_format_id, job_id)
+        if job is None:
+            logger.warning("No files to process.")
+            JobProgress.finish(redis_client.get_client(), job_id, JobProgress.FAILURE, "処理するファイルがありません。")
+            return {"status": "error", "message": "No files to process."}
+
+        return {"status": "started", "job_id": job_id or job.id}
 
     except Exception as e:
         logger.error(f"Error in 'process_multiple_files_task': {e}")
+        JobProgress.finish(redis_client.get_client(), job_id, JobProgress.FAILURE, "ファイル処理中にエラーが発生しました。")
         return {"status": "error", "message": f"An error occurred while processing files: {str(e)}"}
 
 
-@shared_task
+def resolve_row_offsets(client, session_id, kind, sorted_keys):
+    """
+    Global row offset of every chunk key (prefix sum of the chunk row counts) and the total row count.
+    Counts come from the hash recorded when the chunks were written; chunks without one (e.g. written
+    before the counts were kept) are read a window at a time to count them, and their counts recorded.
+    """
+    row_counts_key = ChunkCodec.row_counts_key(session_id, kind)
+    recorded = client.hgetall(row_counts_key)
+    counts = {
+        key: recorded.get(key.decode('utf-8').split(':', 1)[1].encode('utf-8'))
+        for key in sorted_keys
+    }
+    unrecorded = [key for key, row_count in counts.items() if row_count is None]
+    rebuilt = {}
+    for key, row_count in RedisClient.iter_values(client, unrecorded, decode=ChunkCodec.row_count):
+        counts[key] = row_count or 0
+        if row_count is not None:
+            rebuilt[key.decode('utf-8').split(':', 1)[1]] = row_count
+    if rebuilt:
+        client.hset(row_counts_key, mapping=rebuilt)
+        client.expire(row_counts_key, 3600)
+    counts = [int(counts[key]) for key in sorted_keys]
+
+    offsets = []
+    total_rows = 0
+    for row_count in counts:
+        offsets.append(total_rows)
+        total_rows += row_count
+    return offsets, total_rows
+
+
+@shared_task(bind=True)
 def process_and_format_file(
+        self,
         session_id,
         rules,
         before_headers,
         after_headers,
         tenant_id,
-        type_keys="processed:*"
+        type_keys="processed:*",
+        job_id=None,
+        finish_job=True
 ):
+    """
+    Convert the session's '{type_keys}' chunks into display:* (or output:* from display:*),
+    replacing whatever chunks of the target kind an earlier run left.
+    With finish_job=False the job stays open for a following stage (export) and a failure
+    is raised to the caller instead of being returned as a message.
+    """
+    client = redis_client.get_client()
+    if finish_job and not acquire_tenant_slot(
+            self, client, tenant_id, job_id, TaskRouting.count_rows(client, session_id, type_keys.split(':', 1)[0])
+    ):
+        return JobProgress.CANCELLED_MESSAGE
+
     try:
         logger.info("Task 'process_and_format_file' started.")
-        client = redis_client.get_client()
 
-        keys = redis_client.scan_keys(f"{session_id}-{type_keys}")
+        keys = SessionIndex.get_pattern_keys(client, f"{session_id}-{type_keys}")
         if not keys:
             logger.warning("No data found in Redis for processing.")
+            if not finish_job:
+                raise ValueError("処理するデータが見つかりません。")
+            JobProgress.finish(client, job_id, JobProgress.FAILURE, "処理するデータが見つかりません。")
             return "処理するデータが見つかりません。"
 
         logger.info(f"Found {len(keys)} keys for processing.")
         type_key = "output" if type_keys == "display:*" else "display"
-
-        sorted_keys = sorted(keys, key=lambda k: int(k.decode('utf-8').split(':')[1])
-        if k.decode('utf-8').split(':')[1].isdigit() else 0)
-
-        row_index_counter = 0
-
-        for key in sorted_keys:
-            try:
-                raw_data = client.get(key)
-                if not raw_data:
-                    logger.warning(f"No valid data found for key {key}. Skipping...")
-                    continue
-
-                data_dict = json.loads(raw_data.decode('utf-8'))
-
-                if isinstance(data_dict, list):
-                    display_data = []
-                    for idx, row in enumerate(data_dict):
-                        if isinstance(row, dict):
-                            row['row_index'] = row_index_counter + idx
-
-                        display_row = DataFormatter.format_data_with_rules(
-                            row,
-                            rules,
-                            before_headers,
-                            after_headers,
-                            tenant_id
-                        )
-
-                        if isinstance(display_row, list) and len(display_row) > 0:
-                            display_data.append(display_row)
-
-                else:
-                    display_data = []
-                    for idx, (row_key, row) in enumerate(data_dict.items()):
-                        if isinstance(row, dict):
-                            row['row_index'] = row_index_counter + idx
-
-                        display_row = DataFormatter.format_data_with_rules(
-                            row,
-                            rules,
-                            before_headers,
-                            after_headers,
-                            tenant_id
-                        )
-                        display_data.append(display_row)
-
-                display_key = f"{session_id}-{type_key}:{key.decode('utf-8').split(':')[1]}"
-                client.set(display_key, json.dumps(display_data), ex=3600)
-
-                row_index_counter += len(display_data)
-
-            except Exception as e:
-                logger.error(f"Error processing key {key}: {e}")
-
+        # Chunks of an earlier run that this one does not overwrite must not end up in the result.
+        drop_chunks(client, session_id, type_key)
+
+        sorted_keys = RedisClient.sort_keys(keys)
+
+        plan = ConversionPlan.build(rules, before_headers, after_headers, tenant_id)
+        row_offsets, total_rows = resolve_row_offsets(client, session_id, type_keys.split(':', 1)[0], sorted_keys)
+
+        max_workers = getattr(settings, 'FORMAT_PROCESS_WORKERS', 0) or os.cpu_count() or 1
+        if total_rows < getattr(settings, 'FORMAT_PARALLEL_MIN_ROWS', 20000):
+            max_workers = 1
+        logger.info(f"Formatting {total_rows} rows in {len(sorted_keys)} chunks with up to {max_workers} workers.")
+
+        written = []
+
+        def on_chunk(suffix, row_count, key):
+            if key:
+                written.append(key)
+            JobProgress.advance(client, job_id, rows=row_count)
+            JobProgress.check(client, job_id)
+
+        JobProgress.update(client, job_id, stage='converting', rows_done=0, rows_total=total_rows)
+        try:
+            with MemoryBudget.track(f'convert {type_key}'):
+                results = ChunkFormatter.format_chunks(
+                    session_id,
+                    sorted_keys,
+                    row_offsets,
+                    plan,
+                    type_key,
+                    max_workers,
+                    progress=on_chunk if job_id else None,
+                    job_id=job_id
+                )
+        except JobSuperseded:
+            logger.info(f"Formatting superseded after {len(written)} of {len(sorted_keys)} chunks.")
+            JobProgress.discard(client, session_id, job_id, written)
+            if not finish_job:
+                raise
+            JobProgress.finish(client, job_id, JobProgress.CANCELLED, JobProgress.CANCELLED_MESSAGE)
+            return JobProgress.CANCELLED_MESSAGE
+
+        row_counts_key = ChunkCodec.row_counts_key(session_id, type_key)
+        client.delete(row_counts_key)
+        row_counts = {suffix: row_count for suffix, row_count in results}
+        if row_counts:
+            client.hset(row_counts_key, mapping=row_counts)
+            client.expire(row_counts_key, 3600)
+
+        logger.info(plan.memo_report())
         logger.info("All keys processed successfully.")
+        if finish_job:
+            JobProgress.finish(client, job_id, JobProgress.SUCCESS, "データは正常に処理され、保存されました。")
         return "データは正常に処理され、保存されました。"
 
+    except JobSuperseded:
+        raise
     except Exception as e:
         logger.error(f"Error in 'process_and_format_file' task: {e}")
+        if not finish_job:
+            raise
+        JobProgress.finish(redis_client.get_client(), job_id, JobProgress.FAILURE, "データフォーマット処理中にエラーが発生しました。")
         return "データフォーマット処理中にエラーが発生しました。"
 
 
@@ -160,7 +574,7 @@ def process_and_format_file(
 def generate_zip_task(zip_key, headers, file_format_id):
     try:
         client = redis_client.get_client()
-        keys = client.keys(zip_key)
+        keys = SessionIndex.get_pattern_keys(client, zip_key)
 
         if not keys:
             logger.warning("No display data found for ZIP generation.")
@@ -176,29 +590,26 @@ def generate_zip_task(zip_key, headers, file_format_id):
         delimiter = format_details['delimiter']
         encoding = format_details['encoding']
 
-        sorted_keys = sorted(keys, key=lambda k: int(k.decode('utf-8').split(':')[1]) if k.decode('utf-8').split(':')[1].isdigit() else 0)
-        all_data = []
-        for key in sorted_keys:
-            try:
-                data = client.get(key)
-                if data:
-                    display_data = json.loads(data)
-                    all_data.extend(display_data)
-                client.delete(key)
-            except Exception as e:
-                logger.error(f"Error processing key {key}: {e}")
+        sorted_keys = RedisClient.sort_keys(keys)
 
         csv_buffer = io.StringIO()
         csv_writer = csv.writer(csv_buffer, delimiter=delimiter)
         csv_writer.writerow(headers)
 
-        for row in all_data:
-            if isinstance(row, dict):
-                csv_writer.writerow(row.values())
-            elif isinstance(row, list):
-                csv_writer.writerow(row)
-            else:
-                logger.warning(f"Invalid row format: {row}")
+        with RedisClient.batch_writer(client) as writer:
+            for key, rows in RedisClient.iter_values(client, sorted_keys, decode=ChunkCodec.loads):
+                try:
+                    for row in rows or []:
+                        if isinstance(row, dict):
+                            csv_writer.writerow(row.values())
+                        elif isinstance(row, list):
+                            csv_writer.writerow(row)
+                        else:
+                            logger.warning(f"Invalid row format: {row}")
+                    writer.delete(key)
+                    SessionIndex.forget(writer, [key])
+                except Exception as e:
+                    logger.error(f"Error processing key {key}: {e}")
 
         with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
             file_name = f"{timezone.now().strftime('%Y%m%d')}_output.csv"
@@ -214,22 +625,42 @@ def generate_zip_task(zip_key, headers, file_format_id):
         return None
 
 
+def iter_export_rows(client, sorted_keys, job_id=None):
+    """
+    Yield the normalized values of every row stored under sorted_keys, one chunk decoded at a time
+    (chunks are fetched a read window at a time).
+    """
+    for key, rows in RedisClient.iter_values(client, sorted_keys, decode=ChunkCodec.loads):
+        JobProgress.check(client, job_id)
+        for row in rows or []:
+            if isinstance(row, dict):
+                row = row.values()
+            elif not isinstance(row, list):
+                logger.warning(f"Invalid row format: {type(row)}. Skipping.")
+                continue
+            yield [CharacterNormalizer.safe_normalize(val) for val in row]
+
+
 @shared_task
-def generate_csv_task(csv_key_pattern, headers, file_format_id):
+def generate_csv_task(csv_key_pattern, headers, file_format_id, job_id=None):
     """
     Generate a CSV file from display data stored in Redis.
 
+    Rows are written chunk by chunk. Above the memory budget the file is written to the
+    spill directory instead of being stored in Redis (see MemoryBudget).
+
     Args:
-        csv_key_pattern: Redis key pattern to find display data
+        csv_key_pattern: '{session_id}-<kind>:*' pattern of the chunks to export (looked up in SessionIndex)
         headers: List of column headers
         file_format_id: ID of the file format (encoding, delimiter)
+        job_id: JobProgress id checked between chunks (raises JobSuperseded)
 
     Returns:
-        Redis key where the generated CSV is stored, or None on failure
+        Redis key where the generated CSV (or the path of the spilled file) is stored, or None on failure
     """
     try:
         client = redis_client.get_client()
-        keys = list(redis_client.scan_keys(csv_key_pattern))
+        keys = SessionIndex.get_pattern_keys(client, csv_key_pattern)
 
         if not keys:
             logger.warning("No display data found for CSV generation.")
@@ -243,130 +674,257 @@ def generate_csv_task(csv_key_pattern, headers, file_format_id):
         delimiter = format_details['delimiter']
         encoding = format_details['encoding']
 
-        sorted_keys = sorted(keys, key=lambda k: int(k.decode('utf-8').split(':')[1])
-        if k.decode('utf-8').split(':')[1].isdigit() else 0)
-
-        csv_buffer = io.StringIO()
-        csv_writer = csv.writer(csv_buffer, delimiter=delimiter)
-        csv_writer.writerow(headers)
-
-        all_rows = []
-        for key in sorted_keys:
-            try:
-                data = client.get(key)
-                if data:
-                    display_data = json.loads(data)
-                    all_rows.extend(display_data)
-            except Exception as e:
-                logger.error(f"Error processing key {key}: {e}")
-                continue
+        sorted_keys = RedisClient.sort_keys(keys)
 
-        for row in all_rows:
-            try:
-                if isinstance(row, dict):
-                    values = [CharacterNormalizer.safe_normalize(val) for val in row.values()]
-                    csv_writer.writerow(values)
-                elif isinstance(row, list):
-                    values = [CharacterNormalizer.safe_normalize(val) for val in row]
-                    csv_writer.writerow(values)
+        with MemoryBudget.track('export-csv'):
+            if MemoryBudget.should_spill(client, sorted_keys, 'export-csv'):
+                csv_key_name, spill_path = MemoryBudget.create_spill_file('.csv')
+                csv_file = open(spill_path, 'w', encoding=encoding, errors='ignore', newline='')
+            else:
+                spill_path = None
+                csv_file = io.StringIO()
+
+            with csv_file:
+                csv_writer = csv.writer(csv_file, delimiter=delimiter)
+                csv_writer.writerow(headers)
+
+                for values in iter_export_rows(client, sorted_keys, job_id):
+                    try:
+                        csv_writer.writerow(values)
+                    except Exception as e:
+                        logger.error(f"Error writing row to CSV: {e}")
+                        continue
+
+                if spill_path:
+                    client.set(csv_key_name, spill_path, ex=MemoryBudget.SPILL_TTL)
                 else:
-                    logger.warning(f"Invalid row format: {type(row)}. Skipping.")
-            except Exception as e:
-                logger.error(f"Error writing row to CSV: {e}")
-                continue
+                    csv_key_name = f"csv:{base64.urlsafe_b64encode(os.urandom(6)).decode('utf-8')}"
+                    client.set(csv_key_name, csv_file.getvalue().encode(encoding, errors='ignore'), ex=3600)
 
-        csv_key_name = f"csv:{base64.urlsafe_b64encode(os.urandom(6)).decode('utf-8')}"
-        client.set(csv_key_name, csv_buffer.getvalue().encode(encoding, errors='ignore'), ex=3600)
         logger.info(f"CSV file created successfully with key {csv_key_name}")
         return csv_key_name
 
+    except JobSuperseded:
+        raise
     except Exception as e:
         logger.error(f"Critical error generating CSV file: {e}")
         return None
 
 
+def write_spilled_workbook(client, sorted_keys, headers, sheet_name, job_id=None):
+    """
+    Build the workbook in write-only mode with bounded memory.
+    Rows are first spooled to a local temporary file (column widths have to be known before
+    the first row is written), then streamed into the workbook in the spill directory.
+    Returns the Redis key referencing the file.
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    widths = [len(str(header)) if header else 0 for header in headers]
+    with tempfile.TemporaryFile(dir=MemoryBudget.get_spill_dir()) as spool:
+        row_count = 0
+        for values in iter_export_rows(client, sorted_keys, job_id):
+            if len(values) > len(widths):
+                widths.extend([0] * (len(values) - len(widths)))
+            for pos, value in enumerate(values):
+                if value and len(str(value)) > widths[pos]:
+                    widths[pos] = len(str(value))
+            # One pickle per row: a shared Pickler/Unpickler memo would keep every row alive.
+            pickle.dump(values, spool, protocol=pickle.HIGHEST_PROTOCOL)
+            row_count += 1
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=sheet_name)
+        for pos, width in enumerate(widths, start=1):
+            ws.column_dimensions[get_column_letter(pos)].width = min(width + 2, 50)
+
+        ws.append(headers)
+        spool.seek(0)
+        for _ in range(row_count):
+            try:
+                ws.append(pickle.load(spool))
+            except Exception as e:
+                logger.error(f"Error adding row to Excel: {e}")
+
+        excel_key_name, spill_path = MemoryBudget.create_spill_file('.xlsx')
+        wb.save(spill_path)
+
+    client.set(excel_key_name, spill_path, ex=MemoryBudget.SPILL_TTL)
+    return excel_key_name
+
+
 @shared_task
-def generate_excel_task(excel_key_pattern, headers, sheet_name):
+def generate_excel_task(excel_key_pattern, headers, sheet_name, job_id=None):
     """
     Generate an Excel file from display data stored in Redis.
 
+    Above the memory budget the workbook is written in write-only mode to the spill
+    directory (see write_spilled_workbook).
+
     Args:
-        excel_key_pattern: Redis key pattern to find display data
+        excel_key_pattern: '{session_id}-<kind>:*' pattern of the chunks to export (looked up in SessionIndex)
         headers: List of column headers
         sheet_name: Name for the Excel sheet
+        job_id: JobProgress id checked between chunks (raises JobSuperseded)
 
     Returns:
-        Redis key where the generated Excel file is stored, or None on failure
+        Redis key where the generated Excel file (or the path of the spilled file) is stored, or None on failure
     """
     try:
         client = redis_client.get_client()
-        keys = list(redis_client.scan_keys(excel_key_pattern))
+        keys = SessionIndex.get_pattern_keys(client, excel_key_pattern)
 
         if not keys:
             logger.warning("No display data found for Excel generation.")
             return None
 
-        import pandas as pd
-        import io
         from openpyxl import Workbook
-        from openpyxl.utils.dataframe import dataframe_to_rows
 
-        wb = Workbook()
-        ws = wb.active
-        ws.title = sheet_name
+        sorted_keys = RedisClient.sort_keys(keys)
 
-        ws.append(headers)
+        with MemoryBudget.track('export-excel'):
+            if MemoryBudget.should_spill(client, sorted_keys, 'export-excel'):
+                excel_key_name = write_spilled_workbook(client, sorted_keys, headers, sheet_name, job_id)
+                logger.info(f"Excel file created successfully with key {excel_key_name}")
+                return excel_key_name
 
-        sorted_keys = sorted(keys, key=lambda k: int(k.decode('utf-8').split(':')[1])
-        if k.decode('utf-8').split(':')[1].isdigit() else 0)
+            wb = Workbook()
+            ws = wb.active
+            ws.title = sheet_name
 
-        all_rows = []
-        for key in sorted_keys:
-            try:
-                data = client.get(key)
-                if data:
-                    display_data = json.loads(data)
-                    all_rows.extend(display_data)
-            except Exception as e:
-                logger.error(f"Error processing key {key}: {e}")
-                continue
-
-        for row in all_rows:
-            try:
-                if isinstance(row, dict):
-                    values = [CharacterNormalizer.safe_normalize(val) for val in row.values()]
-                    ws.append(values)
-                elif isinstance(row, list):
-                    values = [CharacterNormalizer.safe_normalize(val) for val in row]
-                    ws.append(values)
-                else:
-                    logger.warning(f"Invalid row format: {type(row)}. Skipping.")
-            except Exception as e:
-                logger.error(f"Error adding row to Excel: {e}")
-                continue
+            ws.append(headers)
 
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
+            for values in iter_export_rows(client, sorted_keys, job_id):
                 try:
-                    if cell.value and len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column_letter].width = min(adjusted_width, 50)
-
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
+                    ws.append(values)
+                except Exception as e:
+                    logger.error(f"Error adding row to Excel: {e}")
+                    continue
 
-        excel_key_name = f"excel:{base64.urlsafe_b64encode(os.urandom(6)).decode('utf-8')}"
-        client.set(excel_key_name, excel_buffer.getvalue(), ex=3600)
+            for column in ws.columns:
+                max_length = 0
+                column_letter = column[0].column_letter
+                for cell in column:
+                    try:
+                        if cell.value and len(str(cell.value)) > max_length:
+                            max_length = len(str(cell.value))
+                    except:
+                        pass
+                adjusted_width = (max_length + 2)
+                ws.column_dimensions[column_letter].width = min(adjusted_width, 50)
+
+            excel_buffer = io.BytesIO()
+            wb.save(excel_buffer)
+            excel_buffer.seek(0)
+
+            excel_key_name = f"excel:{base64.urlsafe_b64encode(os.urandom(6)).decode('utf-8')}"
+            client.set(excel_key_name, excel_buffer.getvalue(), ex=3600)
 
         logger.info(f"Excel file created successfully with key {excel_key_name}")
         return excel_key_name
 
+    except JobSuperseded:
+        raise
     except Exception as e:
         logger.error(f"Error generating Excel file: {e}")
         return None
+
+
+@shared_task(bind=True)
+def export_download_task(
+        self,
+        session_id,
+        download_type,
+        rules,
+        format_headers,
+        output_headers,
+        tenant_id,
+        output_file_format,
+        sheet_name,
+        job_id=None
+):
+    """
+    Convert display:* into output:*, then hand the file generation to build_export_file_task.
+    The conversion is CPU-bound and runs here (prefork 'convert' queue); building the file
+    is Redis/IO-bound and runs on the threaded 'export' queue.
+    """
+    client = redis_client.get_client()
+    if not acquire_tenant_slot(self, client, tenant_id, job_id, TaskRouting.count_rows(client, session_id, 'display')):
+        return None
+
+    try:
+        process_and_format_file(
+            session_id,
+            rules,
+            format_headers,
+            output_headers,
+            tenant_id,
+            type_keys="display:*",
+            job_id=job_id,
+            finish_job=False
+        )
+
+        JobProgress.update(client, job_id, stage='exporting')
+        build_export_file_task.apply_async(
+            args=(session_id, download_type, output_headers, output_file_format, sheet_name),
+            kwargs={'job_id': job_id},
+            **TaskRouting.get_options(TaskRouting.count_rows(client, session_id, 'output'))
+        )
+        return {"status": "started", "job_id": job_id}
+
+    except JobSuperseded:
+        logger.info(f"Export job {job_id} superseded.")
+        JobProgress.finish(client, job_id, JobProgress.CANCELLED, JobProgress.CANCELLED_MESSAGE)
+        return None
+    except Exception as e:
+        logger.error(f"Error in 'export_download_task': {e}")
+        JobProgress.finish(client, job_id, JobProgress.FAILURE, f'ファイルのダウンロード中にエラーが発生しました: {str(e)}')
+        return None
+
+
+@shared_task
+def build_export_file_task(session_id, download_type, output_headers, output_file_format, sheet_name, job_id=None):
+    """
+    Build the download file from the session's output:* chunks and finish the export job.
+    The job result is the Redis key of the file, served by DownloadView.
+    """
+    client = redis_client.get_client()
+    try:
+        if output_file_format == 'EXCEL':
+            file_key = generate_excel_task(f"{session_id}-output:*", output_headers, sheet_name, job_id)
+            extension = 'xlsx'
+            error_message = '指定されたExcelファイルを生成できませんでした。'
+        else:
+            file_key = generate_csv_task(f"{session_id}-output:*", output_headers, output_file_format, job_id)
+            extension = 'csv'
+            error_message = '指定されたCSVファイルを生成できませんでした。'
+
+        if not file_key:
+            JobProgress.finish(client, job_id, JobProgress.FAILURE, error_message)
+            return None
+
+        file_name = f"{timezone.now().strftime('%Y%m%d_%H%M%S')}_{download_type}_output.{extension}"
+        JobProgress.finish(client, job_id, JobProgress.SUCCESS, result=file_key, file_name=file_name)
+        return file_key
+
+    except JobSuperseded:
+        logger.info(f"Export job {job_id} superseded.")
+        JobProgress.finish(client, job_id, JobProgress.CANCELLED, JobProgress.CANCELLED_MESSAGE)
+        return None
+    except Exception as e:
+        logger.error(f"Error in 'build_export_file_task': {e}")
+        JobProgress.finish(client, job_id, JobProgress.FAILURE, f'ファイルのダウンロード中にエラーが発生しました: {str(e)}')
+        return None
+
+
+@shared_task
+def sweep_expired_sessions():
+    """
+    Periodic (Celery beat) cleanup of the keys and uploaded files of expired sessions.
+    """
+    try:
+        return SessionNamespace.sweep(redis_client.get_client())
+    except Exception as e:
+        logger.error(f"Error in 'sweep_expired_sessions': {e}")
+        return None
@@ -0,0 +1,220 @@
+import time
+import uuid
+import logging
+from redis.exceptions import WatchError
+from .session_index import SessionIndex
+
+logger = logging.getLogger(__name__)
+
+
+class JobSuperseded(Exception):
+    """
+    Raised by JobProgress.check once a newer job was started for the same session.
+    """
+
+
+class JobProgress:
+    """
+    Progress of an asynchronous job (file processing, formatting, export).
+
+    Kept in the Redis hash 'job-progress:{job_id}' and polled through JobStatusView.
+    Counters: files_done/files_total, rows_done/rows_total (0 when unknown); stage is one of
+    queued, parsing, converting, exporting, done. Every helper is a no-op without a job_id,
+    so the tasks can still be called without one.
+
+    Only the latest job of a session is current: creating a job (or cancel_session) marks
+    the previous one as superseded. Running jobs call check() between chunks, stop with
+    JobSuperseded and remove the keys they wrote with discard().
+
+    Every chunk write is preceded by claim(), which records the writing job in the
+    '{session_id}-chunk-owners' hash; discard() only deletes keys the job still owns, so a
+    newer job that rewrote the same keys (typically with identical content) keeps them.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    SUCCESS = 'SUCCESS'
+    FAILURE = 'FAILURE'
+    CANCELLED = 'CANCELLED'
+
+    CANCELLED_MESSAGE = '新しい処理が開始されたため中断しました。'
+
+    INT_FIELDS = ['files_done', 'files_total', 'rows_done', 'rows_total']
+    TTL = 3600
+
+    @staticmethod
+    def get_key(job_id):
+        return f"job-progress:{job_id}"
+
+    @staticmethod
+    def get_active_key(session_id):
+        return f"{session_id}-active-job"
+
+    @staticmethod
+    def create(client, session_id, kind, tenant_id=None):
+        """
+        Register a new job for the session, supersede the previous one and return its id
+        (used as the Celery task id). tenant_id ties the job to its tenant's quota slot.
+        """
+        job_id = str(uuid.uuid4())
+        key = JobProgress.get_key(job_id)
+        client.hset(key, mapping={
+            'job_id': job_id,
+            'session_id': session_id,
+            'kind': kind,
+            'tenant_id': '' if tenant_id is None else tenant_id,
+            'status': JobProgress.PENDING,
+            'stage': 'queued',
+            'files_done': 0,
+            'files_total': 0,
+            'rows_done': 0,
+            'rows_total': 0,
+            'message': '',
+            'result': '',
+            'updated_at': time.time(),
+        })
+        client.expire(key, JobProgress.TTL)
+
+        previous_job_id = client.set(JobProgress.get_active_key(session_id), job_id, ex=JobProgress.TTL, get=True)
+        JobProgress._supersede(client, previous_job_id)
+        return job_id
+
+    @staticmethod
+    def cancel_session(client, session_id):
+        """
+        Supersede the session's current job without starting a new one.
+        """
+        pipeline = client.pipeline()
+        pipeline.get(JobProgress.get_active_key(session_id))
+        pipeline.delete(JobProgress.get_active_key(session_id))
+        JobProgress._supersede(client, pipeline.execute()[0])
+
+    @staticmethod
+    def _supersede(client, job_id):
+        if not job_id:
+            return
+        key = JobProgress.get_key(job_id.decode('utf-8') if isinstance(job_id, bytes) else job_id)
+        if client.exists(key):
+            client.hset(key, 'superseded', 1)
+
+    @staticmethod
+    def check(client, job_id):
+        """
+        Raise JobSuperseded when the job was superseded or its progress hash is gone
+        (session data deleted). One HMGET, cheap enough to call once per chunk.
+        """
+        if not job_id:
+            return
+        status, superseded = client.hmget(JobProgress.get_key(job_id), 'status', 'superseded')
+        if status is None or superseded:
+            raise JobSuperseded(job_id)
+
+    @staticmethod
+    def get_owners_key(session_id):
+        return f"{session_id}-chunk-owners"
+
+    @staticmethod
+    def claim(client, session_id, keys, job_id):
+        """
+        Record job_id ('' without a job) as the writer of the session's keys; client may be a
+        pipeline. Queue it before the writes themselves, so a discard() that runs in between
+        already sees the new owner.
+        """
+        if not keys:
+            return
+        owners_key = JobProgress.get_owners_key(session_id)
+        client.hset(owners_key, mapping={key: job_id or '' for key in keys})
+        client.expire(owners_key, JobProgress.TTL)
+
+    @staticmethod
+    def disown(client, session_id, keys):
+        """
+        Forget the writers of deleted keys; client may be a pipeline.
+        """
+        if keys:
+            client.hdel(JobProgress.get_owners_key(session_id), *keys)
+
+    @staticmethod
+    def discard(client, session_id, job_id, written):
+        """
+        Delete the keys a superseded job wrote, except those another job has claimed since.
+        """
+        owners_key = JobProgress.get_owners_key(session_id)
+        discarded = 0
+        for key in written:
+            with client.pipeline() as pipeline:
+                while True:
+                    try:
+                        pipeline.watch(owners_key, key)
+                        owner = pipeline.hget(owners_key, key)
+                        if owner is None or owner.decode('utf-8') != job_id:
+                            break
+                        pipeline.multi()
+                        pipeline.delete(key)
+                        pipeline.hdel(owners_key, key)
+                        SessionIndex.forget(pipeline, [key])
+                        pipeline.execute()
+                        discarded += 1
+                        break
+                    except WatchError:
+                        continue
+        logger.info(f"Discarded {discarded} of {len(written)} keys written by superseded job {job_id}.")
+
+    @staticmethod
+    def update(client, job_id, **fields):
+        if not job_id:
+            return
+        try:
+            key = JobProgress.get_key(job_id)
+            fields['updated_at'] = time.time()
+            fields.setdefault('status', JobProgress.RUNNING)
+            client.hset(key, mapping={name: '' if value is None else value for name, value in fields.items()})
+            client.expire(key, JobProgress.TTL)
+        except Exception as e:
+            logger.warning(f"Error updating progress of job {job_id}: {e}")
+
+    @staticmethod
+    def advance(client, job_id, files=0, rows=0):
+        if not job_id:
+            return
+        try:
+            key = JobProgress.get_key(job_id)
+            pipeline = client.pipeline()
+            if files:
+                pipeline.hincrby(key, 'files_done', files)
+            if rows:
+                pipeline.hincrby(key, 'rows_done', rows)
+            pipeline.hset(key, 'updated_at', time.time())
+            pipeline.expire(key, JobProgress.TTL)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Error advancing progress of job {job_id}: {e}")
+
+    @staticmethod
+    def finish(client, job_id, status, message='', **fields):
+        """
+        Record the final status and free the job's tenant quota slot.
+        """
+        JobProgress.update(client, job_id, status=status, stage='done', message=message, **fields)
+        if not job_id:
+            return
+
+        try:
+            tenant_id = client.hget(JobProgress.get_key(job_id), 'tenant_id')
+            if tenant_id:
+                from .tenant_quota import TenantQuota
+                TenantQuota.release(client, tenant_id.decode('utf-8'), job_id)
+        except Exception as e:
+            logger.warning(f"Error releasing the quota slot of job {job_id}: {e}")
+
+    @staticmethod
+    def get(client, job_id):
+        raw = client.hgetall(JobProgress.get_key(job_id))
+        if not raw:
+            return None
+
+        job = {name.decode('utf-8'): value.decode('utf-8') for name, value in raw.items()}
+        job['superseded'] = bool(job.get('superseded'))
+        for name in JobProgress.INT_FIELDS:
+            job[name] = int(job.get(name) or 0)
+        job['updated_at'] = float(job.get('updated_at') or 0)
+        return job
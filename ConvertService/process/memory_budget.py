@@ -0,0 +1,161 @@
+import os
+import time
+import base64
+import logging
+import resource
+from contextlib import contextmanager
+from celery.signals import worker_process_init
+from django.conf import settings
+from .redis import PayloadCodec
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    Memory budget of a worker stage (MEMORY_BUDGET_MB, 0 = unlimited).
+
+    A stage estimates its working set from the stored size of the chunks it reads; when
+    that exceeds the budget it switches to its spill mode and keeps intermediate data and
+    the generated file in SPILL_DIR instead of in memory / Redis. Spilled files are
+    referenced by a 'spilled:<token>' Redis key holding the path, which the web server
+    opens for the download, so SPILL_DIR has to be shared with the workers.
+
+    track(stage) logs the peak RSS of a stage. The peak is reset per stage
+    (/proc/self/clear_refs, Linux) only in a process that runs one task at a time: a
+    prefork child or a solo worker. The reset is process-wide, so in the threads pool or a
+    threaded web server it would clobber the peak of concurrent stages; there, and on other
+    platforms, the process-wide peak is reported.
+    """
+    # Decoded Python rows take several times the size of their JSON encoding.
+    EXPANSION_FACTOR = 8
+    SPILLED_PREFIX = 'spilled:'
+    SPILL_TTL = 3600
+    # Set in prefork children and solo workers (worker_process_init).
+    single_task_process = False
+
+    @staticmethod
+    def get_limit():
+        return int(getattr(settings, 'MEMORY_BUDGET_MB', 512)) * 1024 * 1024
+
+    @staticmethod
+    def get_spill_dir():
+        spill_dir = getattr(settings, 'SPILL_DIR', '') or os.path.join(
+            getattr(settings, 'SHARED_DATA_DIR', '/var/lib/convert'), 'spill'
+        )
+        os.makedirs(spill_dir, exist_ok=True)
+        return spill_dir
+
+    @staticmethod
+    def estimate(client, keys):
+        """
+        Estimated memory needed to hold the decoded rows of all keys at once.
+        Compressed chunks are sized by the uncompressed size recorded in their header.
+        """
+        pipeline = client.pipeline()
+        for key in keys:
+            pipeline.strlen(key)
+            pipeline.getrange(key, 0, PayloadCodec.HEADER_SIZE - 1)
+        results = pipeline.execute()
+        encoded = sum(
+            PayloadCodec.decoded_size(head, stored_size)
+            for stored_size, head in zip(results[::2], results[1::2])
+        )
+        return encoded * MemoryBudget.EXPANSION_FACTOR
+
+    @staticmethod
+    def should_spill(client, keys, stage):
+        limit = MemoryBudget.get_limit()
+        if not limit:
+            return False
+
+        estimate = MemoryBudget.estimate(client, keys)
+        if estimate <= limit:
+            return False
+
+        logger.info(
+            f"Stage '{stage}': estimated {estimate / 1048576:.0f} MB exceeds the memory budget "
+            f"of {limit / 1048576:.0f} MB, spilling to {MemoryBudget.get_spill_dir()}."
+        )
+        return True
+
+    @staticmethod
+    def create_spill_file(suffix):
+        """
+        Return (Redis key, path) for a new spilled result file; stale spill files are purged first.
+        """
+        MemoryBudget.purge_spill_dir()
+        token = base64.urlsafe_b64encode(os.urandom(6)).decode('utf-8')
+        path = os.path.join(MemoryBudget.get_spill_dir(), f"{token}{suffix}")
+        return f"{MemoryBudget.SPILLED_PREFIX}{token}", path
+
+    @staticmethod
+    def is_spilled(key):
+        return key.startswith(MemoryBudget.SPILLED_PREFIX)
+
+    @staticmethod
+    def purge_spill_dir():
+        spill_dir = MemoryBudget.get_spill_dir()
+        expired = time.time() - MemoryBudget.SPILL_TTL
+        for entry in os.scandir(spill_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except OSError as e:
+                logger.warning(f"Error removing spill file {entry.path}: {e}")
+
+    @staticmethod
+    def _read_status(field):
+        try:
+            with open('/proc/self/status') as status:
+                for line in status:
+                    if line.startswith(field):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def _reset_peak():
+        try:
+            with open('/proc/self/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def peak_rss():
+        peak = MemoryBudget._read_status('VmHWM:')
+        if peak is None:
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak *= 1 if os.uname().sysname == 'Darwin' else 1024
+        return peak
+
+    @staticmethod
+    @contextmanager
+    def track(stage):
+        """
+        Log the peak memory of the enclosed stage.
+        """
+        per_stage = MemoryBudget.single_task_process and MemoryBudget._reset_peak()
+        started_rss = MemoryBudget._read_status('VmRSS:')
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            peak = MemoryBudget.peak_rss()
+            limit = MemoryBudget.get_limit()
+            logger.info(
+                f"Stage '{stage}': peak RSS {peak / 1048576:.0f} MB"
+                f"{'' if per_stage else ' (process lifetime)'}"
+                f"{f', start {started_rss / 1048576:.0f} MB' if started_rss else ''}"
+                f", budget {f'{limit / 1048576:.0f} MB' if limit else 'unlimited'}"
+                f", {time.perf_counter() - started:.2f}s."
+            )
+
+
+@worker_process_init.connect
+def mark_single_task_process(**kwargs):
+    MemoryBudget.single_task_process = True
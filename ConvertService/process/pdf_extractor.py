@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+import fitz
+
+logger = logging.getLogger(__name__)
+
+
+class PdfFormExtractor:
+    """
+    Extract form widget values from PDF pages, fanning page ranges out to a process pool.
+
+    This module deliberately imports nothing from Django so that pool workers started
+    with the 'spawn' method stay cheap to boot.
+    """
+
+    @staticmethod
+    def extract_page_range(file_path, headers, start, stop):
+        """
+        Extract one row per page in [start, stop). Returns the rows and (page, seconds) timings.
+        """
+        header_set = set(headers)
+        rows = []
+        timings = []
+
+        pdf_document = fitz.open(file_path)
+        try:
+            for page_number in range(start, stop):
+                started = time.perf_counter()
+                page = pdf_document[page_number]
+                form_fields = page.widgets()
+                if form_fields:
+                    row_data = {}
+                    for widget in form_fields:
+                        field_name = widget.field_name
+                        field_value = widget.field_value or ""
+                        if field_name in header_set:
+                            row_data[field_name] = field_value
+                        else:
+                            row_data[field_name] = ""
+                    rows.append(row_data)
+                timings.append((page_number + 1, time.perf_counter() - started))
+        finally:
+            pdf_document.close()
+
+        return rows, timings
+
+    @staticmethod
+    def _extract_page_range_task(args):
+        return PdfFormExtractor.extract_page_range(*args)
+
+    @staticmethod
+    def split_pages(page_count, pages_per_task):
+        pages_per_task = max(1, pages_per_task)
+        return [
+            (start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)
+        ]
+
+    @staticmethod
+    def extract(file_path, headers, pages_per_task=50, max_workers=None):
+        """
+        Extract form rows from every page, in page order.
+        Page ranges run in a spawned process pool when the document spans several ranges.
+        """
+        file_path = str(file_path)
+        pdf_document = fitz.open(file_path)
+        try:
+            page_count = pdf_document.page_count
+        finally:
+            pdf_document.close()
+
+        page_ranges = PdfFormExtractor.split_pages(page_count, pages_per_task)
+        workers = min(max_workers or os.cpu_count() or 1, len(page_ranges))
+
+        if workers <= 1:
+            results = [
+                PdfFormExtractor.extract_page_range(file_path, headers, start, stop)
+                for start, stop in page_ranges
+            ]
+        else:
+            import billiard
+
+            tasks = [(file_path, list(headers), start, stop) for start, stop in page_ranges]
+            with billiard.get_context('spawn').Pool(processes=workers) as pool:
+                results = pool.map(PdfFormExtractor._extract_page_range_task, tasks)
+
+        rows = []
+        timings = []
+        for range_rows, range_timings in results:
+            rows.extend(range_rows)
+            timings.extend(range_timings)
+
+        return rows, timings
+
+    @staticmethod
+    def timing_report(file_path, timings, slowest=5):
+        if not timings:
+            return f"PDF {os.path.basename(str(file_path))}: no pages."
+
+        total = sum(seconds for _, seconds in timings)
+        slow_pages = sorted(timings, key=lambda item: item[1], reverse=True)[:slowest]
+        slow_text = ", ".join(f"p{page}={seconds * 1000:.1f}ms" for page, seconds in slow_pages)
+        return (
+            f"PDF {os.path.basename(str(file_path))}: {len(timings)} pages, "
+            f"page time {total:.2f}s total, {total / len(timings) * 1000:.1f}ms avg; slowest: {slow_text}"
+        )
@@ -1,51 +1,395 @@
 import os
+import json
+import time
+import zlib
 import redis
+import struct
 import logging
+import threading
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
+class PayloadCodec:
+    """
+    Binary envelope of the JSON values stored in Redis (chunks, manifests, metadata).
+
+    The first byte records how the rest was written: encoding in the low 4 bits, compression
+    in the high 4 bits. Values without a known header (plain JSON text written before this
+    envelope) are still decoded as JSON, so old and new data can be mixed.
+
+        encodings:    1 = JSON as UTF-8, without \\uXXXX escapes or whitespace
+        compression:  0 = none, 1 = zlib, 2 = LZ4 frame (needs the optional lz4 package)
+
+    Bodies of REDIS_CODEC_COMPRESS_MIN_BYTES or more are compressed with REDIS_CODEC_COMPRESSION
+    ('zlib', 'lz4' or 'none'); a compressed body is preceded by its uncompressed size
+    (4 bytes, big endian) so it can be sized without inflating it (MemoryBudget.estimate).
+    ENCODINGS and COMPRESSIONS map the header ids to their (encode, decode) functions.
+    RedisCodecBenchmark.py compares the options on roster data.
+    """
+    JSON = 0x01
+    NONE = 0x00
+    ZLIB = 0x01
+    LZ4 = 0x02
+    COMPRESSION_NAMES = {'none': NONE, 'zlib': ZLIB, 'lz4': LZ4}
+    ZLIB_LEVEL = 1
+    SIZE = struct.Struct('>I')
+    # Enough to read the header and the uncompressed size (GETRANGE key 0 HEADER_SIZE-1).
+    HEADER_SIZE = 1 + SIZE.size
+
+    @staticmethod
+    def _encode_json(value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _decode_json(body):
+        return json.loads(body)
+
+    @staticmethod
+    def _zlib_compress(body):
+        return zlib.compress(body, PayloadCodec.ZLIB_LEVEL)
+
+    @staticmethod
+    def _zlib_decompress(body):
+        return zlib.decompress(body)
+
+    @staticmethod
+    def _lz4():
+        try:
+            import lz4.frame
+        except ImportError:
+            logger.error("lz4 library not installed. Cannot use LZ4 compression.")
+            raise ImportError("lz4 library required for LZ4 compressed Redis payloads")
+        return lz4.frame
+
+    @staticmethod
+    def _lz4_compress(body):
+        return PayloadCodec._lz4().compress(body)
+
+    @staticmethod
+    def _lz4_decompress(body):
+        return PayloadCodec._lz4().decompress(body)
+
+    ENCODINGS = {
+        JSON: (_encode_json, _decode_json),
+    }
+    COMPRESSIONS = {
+        ZLIB: (_zlib_compress, _zlib_decompress),
+        LZ4: (_lz4_compress, _lz4_decompress),
+    }
+
+    @staticmethod
+    def get_compression():
+        name = str(getattr(settings, 'REDIS_CODEC_COMPRESSION', 'zlib')).lower()
+        if name not in PayloadCodec.COMPRESSION_NAMES:
+            logger.warning(f"Unknown REDIS_CODEC_COMPRESSION '{name}', using zlib.")
+            return PayloadCodec.ZLIB
+        return PayloadCodec.COMPRESSION_NAMES[name]
+
+    @staticmethod
+    def get_compress_min_bytes():
+        return int(getattr(settings, 'REDIS_CODEC_COMPRESS_MIN_BYTES', 1024))
+
+    @staticmethod
+    def parse_header(raw):
+        """
+        (encoding, compression) of a stored value, or None for header-less (legacy JSON text) values.
+        """
+        if not raw:
+            return None
+        encoding, compression = raw[0] & 0x0F, raw[0] >> 4
+        if encoding not in PayloadCodec.ENCODINGS or (
+                compression != PayloadCodec.NONE and compression not in PayloadCodec.COMPRESSIONS
+        ):
+            return None
+        return encoding, compression
+
+    @staticmethod
+    def dumps(value, compression=None, min_bytes=None):
+        compression = PayloadCodec.get_compression() if compression is None else compression
+        min_bytes = PayloadCodec.get_compress_min_bytes() if min_bytes is None else min_bytes
+
+        body = PayloadCodec._encode_json(value)
+        if compression == PayloadCodec.NONE or len(body) < min_bytes:
+            return bytes((PayloadCodec.JSON,)) + body
+
+        compress = PayloadCodec.COMPRESSIONS[compression][0]
+        return bytes((compression << 4 | PayloadCodec.JSON,)) + PayloadCodec.SIZE.pack(len(body)) + compress(body)
+
+    @staticmethod
+    def loads(raw):
+        if isinstance(raw, str):
+            return json.loads(raw)
+
+        header = PayloadCodec.parse_header(raw)
+        if header is None:
+            return json.loads(raw)
+
+        encoding, compression = header
+        body = memoryview(raw)[1:]
+        if compression != PayloadCodec.NONE:
+            body = PayloadCodec.COMPRESSIONS[compression][1](body[PayloadCodec.SIZE.size:])
+        return PayloadCodec.ENCODINGS[encoding][1](bytes(body))
+
+    @staticmethod
+    def decoded_size(head, stored_size):
+        """
+        Size of the encoded (uncompressed) body of a value, from its first HEADER_SIZE bytes.
+        """
+        header = PayloadCodec.parse_header(head)
+        if header is None:
+            return stored_size
+        if header[1] == PayloadCodec.NONE or len(head) < PayloadCodec.HEADER_SIZE:
+            return stored_size - 1
+        return PayloadCodec.SIZE.unpack_from(head, 1)[0]
+
+
+class BatchWriter:
+    """
+    Pipelined writer (RedisClient.batch_writer): any Redis command called on it is queued and
+    sent batch_size commands per round trip. Leaving the with-block sends the rest; leaving it
+    by an exception drops the commands that were not sent yet.
+    """
+    def __init__(self, client, batch_size):
+        self.pipeline = client.pipeline(transaction=False)
+        self.batch_size = batch_size
+
+    def __getattr__(self, name):
+        command = getattr(self.pipeline, name)
+
+        def queue(*args, **kwargs):
+            command(*args, **kwargs)
+            if len(self.pipeline) >= self.batch_size:
+                self.flush()
+            return self
+
+        return queue
+
+    def flush(self):
+        if len(self.pipeline):
+            self.pipeline.execute()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.pipeline.reset()
+        return False
+
+
+class PoolStatsMixin:
+    """
+    Counters of a connection pool: connections handed out, checkouts that failed because the
+    pool was exhausted, and the total and longest time callers waited for a connection
+    (including connecting a new one and failed checkouts).
+    """
+    def __init__(self, *args, **kwargs):
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.exhausted = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        super().__init__(*args, **kwargs)
+
+    def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except redis.exceptions.ConnectionError as e:
+            # 'Too many connections' (ConnectionPool) / 'No connection available.' (BlockingConnectionPool)
+            if str(e).startswith(('Too many connections', 'No connection available')):
+                self._record_wait(time.perf_counter() - started, exhausted=True)
+            raise
+        self._record_wait(time.perf_counter() - started)
+        return connection
+
+    def _record_wait(self, waited, exhausted=False):
+        with self._stats_lock:
+            if exhausted:
+                self.exhausted += 1
+            else:
+                self.acquired += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def count_connections(self):
+        """
+        (in use, idle) connections of this pool.
+        """
+        if isinstance(self, redis.BlockingConnectionPool):
+            # The queue holds idle connections and None placeholders for connections not created yet.
+            idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+            return len(self._connections) - idle, idle
+        return len(self._in_use_connections), len(self._available_connections)
+
+    def get_stats(self):
+        in_use, idle = self.count_connections()
+        with self._stats_lock:
+            return {
+                'pool': type(self).__name__,
+                'pid': os.getpid(),
+                'max_connections': self.max_connections,
+                'in_use': in_use,
+                'idle': idle,
+                'acquired': self.acquired,
+                'exhausted': self.exhausted,
+                'wait_total_ms': round(self.wait_seconds * 1000, 3),
+                'wait_avg_ms': round(self.wait_seconds * 1000 / (self.acquired + self.exhausted), 3) if self.acquired + self.exhausted else 0.0,
+                'wait_max_ms': round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+class InstrumentedConnectionPool(PoolStatsMixin, redis.ConnectionPool):
+    """
+    ConnectionPool that raises as soon as max_connections are in use.
+    """
+
+
+class InstrumentedBlockingConnectionPool(PoolStatsMixin, redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool: when max_connections are in use, callers wait up to timeout seconds.
+    """
+
+
 class RedisClient:
+    """
+    Process-wide Redis client over a lazily created connection pool.
+
+    The pool is configured from settings: REDIS_MAX_CONNECTIONS, REDIS_POOL_BLOCKING
+    (wait for a free connection up to REDIS_POOL_TIMEOUT seconds instead of failing),
+    REDIS_SOCKET_KEEPALIVE and REDIS_HEALTH_CHECK_INTERVAL. Pool and client belong to the
+    process that created them: a forked child (prefork Celery worker) builds its own on
+    first use instead of sharing the parent's sockets. get_pool_stats() reports its counters.
+    """
     def __init__(self):
         self.redis_pool = None
         self.redis_client = None
+        self._pid = os.getpid()
+        self._init_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The parent's lock may have been held by another thread at fork time.
+        self._init_lock = threading.Lock()
+        self.redis_pool = None
+        self.redis_client = None
+        self._pid = os.getpid()
+
+    @staticmethod
+    def create_pool():
+        pool_class = (
+            InstrumentedBlockingConnectionPool
+            if getattr(settings, 'REDIS_POOL_BLOCKING', True)
+            else InstrumentedConnectionPool
+        )
+        options = {
+            'host': os.getenv('REDIS_HOST', 'localhost'),
+            'port': int(os.getenv('REDIS_PORT', 6379)),
+            'db': int(os.getenv('REDIS_DB', 0)),
+            'max_connections': int(getattr(settings, 'REDIS_MAX_CONNECTIONS', 50)),
+            'socket_keepalive': bool(getattr(settings, 'REDIS_SOCKET_KEEPALIVE', True)),
+            'health_check_interval': int(getattr(settings, 'REDIS_HEALTH_CHECK_INTERVAL', 30)),
+        }
+        if pool_class is InstrumentedBlockingConnectionPool:
+            options['timeout'] = int(getattr(settings, 'REDIS_POOL_TIMEOUT', 20))
+        logger.info(
+            f"Creating Redis {pool_class.__name__} in process {os.getpid()}: "
+            f"max_connections={options['max_connections']}, timeout={options.get('timeout')}."
+        )
+        return pool_class(**options)
 
     def get_client(self):
         try:
-            if self.redis_pool is None:
-                self.redis_pool = redis.ConnectionPool(
-                    host=os.getenv('REDIS_HOST', 'localhost'),
-                    port=int(os.getenv('REDIS_PORT', 6379)),
-                    db=int(os.getenv('REDIS_DB', 0)),
-                    max_connections=10
-                )
+            if self._pid != os.getpid():
+                self._reset_after_fork()
             if self.redis_client is None:
-                self.redis_client = redis.StrictRedis(connection_pool=self.redis_pool)
+                with self._init_lock:
+                    if self.redis_pool is None:
+                        self.redis_pool = RedisClient.create_pool()
+                    if self.redis_client is None:
+                        self.redis_client = redis.StrictRedis(connection_pool=self.redis_pool)
             return self.redis_client
         except Exception as e:
             logger.error(f"Error initializing Redis client: {e}")
             raise
 
+    def get_pool_stats(self):
+        """
+        Counters of this process's pool (None before the first get_client()).
+        """
+        pool = self.redis_pool
+        if pool is None or self._pid != os.getpid() or not isinstance(pool, PoolStatsMixin):
+            return None
+        return pool.get_stats()
+
     def scan_keys(self, pattern):
         try:
-            if self.redis_client is None:
-                self.get_client()
+            client = self.get_client()
 
             cursor = '0'
             keys = []
             while cursor != 0:
-                cursor, partial_keys = self.redis_client.scan(cursor=cursor, match=pattern, count=1000)
+                cursor, partial_keys = client.scan(cursor=cursor, match=pattern, count=1000)
                 keys.extend(partial_keys)
             return keys
         except Exception as e:
             logger.error(f"Error scanning keys: {e}")
             raise
 
+    @staticmethod
+    def sort_keys(keys):
+        """
+        Sort '<prefix>:<file_index>[:<chunk_index>]' keys by their numeric parts.
+        """
+        def key_order(key):
+            if isinstance(key, bytes):
+                key = key.decode('utf-8')
+            return tuple(int(part) if part.isdigit() else 0 for part in key.split(':')[1:])
+
+        return sorted(keys, key=key_order)
+
+    @staticmethod
+    def get_read_window():
+        return max(int(getattr(settings, 'REDIS_READ_WINDOW', 8)), 1)
+
+    @staticmethod
+    def get_write_batch():
+        return max(int(getattr(settings, 'REDIS_WRITE_BATCH', 64)), 1)
+
+    @staticmethod
+    def iter_values(client, keys, decode=None, window=None):
+        """
+        Yield (key, value) for keys in order, fetching a window of keys per MGET round trip
+        (REDIS_READ_WINDOW). Only one window of raw values is held at a time. With decode,
+        values are decoded as they are yielded; missing keys and values that fail to decode
+        yield None.
+        """
+        window = window or RedisClient.get_read_window()
+        keys = list(keys)
+        for start in range(0, len(keys), window):
+            batch = keys[start:start + window]
+            for key, value in zip(batch, client.mget(batch)):
+                if decode is not None and value is not None:
+                    try:
+                        value = decode(value)
+                    except Exception as e:
+                        logger.error(f"Error decoding Redis key {key}: {e}")
+                        value = None
+                yield key, value
+
+    @staticmethod
+    def batch_writer(client, batch_size=None):
+        return BatchWriter(client, batch_size or RedisClient.get_write_batch())
+
     def delete_key_batch(self, keys):
         try:
-            if self.redis_client is None:
-                self.get_client()
-            pipeline = self.redis_client.pipeline()
+            client = self.get_client()
+            pipeline = client.pipeline()
             for key in keys:
                 pipeline.delete(key)
             pipeline.execute()
@@ -56,11 +400,10 @@ class RedisClient:
 
     def delete_all_keys(self):
         try:
-            if self.redis_client is None:
-                self.get_client()
-            keys = self.redis_client.keys('*')
+            client = self.get_client()
+            keys = client.keys('*')
             if keys:
-                self.redis_client.delete(*keys)
+                client.delete(*keys)
                 logger.info(f"Deleted all keys. Total: {len(keys)} keys.")
                 return len(keys)
             return 0
@@ -0,0 +1,162 @@
+import time
+import logging
+from django.conf import settings
+from .job_progress import JobProgress
+from .redis import PayloadCodec
+from .session_index import SessionIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionResultCache:
+    """
+    Cross-session cache of converted display chunks, addressed by content.
+
+    An entry is identified by (file sha256, tenant, data_format_id, config hash), where the
+    config hash covers the input headers and the compiled ConversionPlan (fixed-value
+    dictionaries included). A repeat upload of the same file copies the cached chunks into
+    the session server-side (Redis COPY) instead of parsing and converting it again.
+
+    Entries expire after CONVERT_CACHE_TTL seconds without use; beyond
+    CONVERT_CACHE_MAX_ENTRIES the least recently used entries are evicted.
+    """
+    LRU_KEY = 'convert-cache-lru'
+    STATS_KEY = 'convert-cache-stats'
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'CONVERT_CACHE_ENABLED', True)
+
+    @staticmethod
+    def get_ttl():
+        return getattr(settings, 'CONVERT_CACHE_TTL', 86400)
+
+    @staticmethod
+    def get_meta_key(cache_key):
+        return f"convert-cache-meta:{cache_key}"
+
+    @staticmethod
+    def get_chunk_key(cache_key, chunk_index):
+        return f"convert-cache:{cache_key}:{chunk_index}"
+
+    @staticmethod
+    def _record(client, outcome):
+        """
+        Count a hit or a miss and return the overall hit rate for the log line.
+        """
+        try:
+            client.hincrby(ConversionResultCache.STATS_KEY, outcome, 1)
+            stats = ConversionResultCache.get_stats(client)
+            lookups = stats['hits'] + stats['misses']
+            return f"Overall: {stats['hits']}/{lookups} hits ({stats['hit_rate'] * 100:.1f}%)."
+        except Exception as e:
+            logger.warning(f"Error updating conversion cache stats: {e}")
+            return ""
+
+    @staticmethod
+    def get_stats(client):
+        stats = client.hgetall(ConversionResultCache.STATS_KEY)
+        hits = int(stats.get(b'hits', 0))
+        misses = int(stats.get(b'misses', 0))
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'entries': client.zcard(ConversionResultCache.LRU_KEY),
+        }
+
+    @staticmethod
+    def _touch(client, cache_key, chunk_count):
+        ttl = ConversionResultCache.get_ttl()
+        pipeline = client.pipeline()
+        pipeline.expire(ConversionResultCache.get_meta_key(cache_key), ttl)
+        for chunk_index in range(chunk_count):
+            pipeline.expire(ConversionResultCache.get_chunk_key(cache_key, chunk_index), ttl)
+        pipeline.zadd(ConversionResultCache.LRU_KEY, {cache_key: time.time()})
+        pipeline.execute()
+
+    @staticmethod
+    def link(client, cache_key, session_id, file_index, file_name='', job_id=None):
+        """
+        Copy a cached entry to '{session_id}-display:{file_index}:<chunk_index>', claimed for job_id.
+        Returns the chunk row counts, or None on a miss.
+        """
+        raw_meta = client.get(ConversionResultCache.get_meta_key(cache_key))
+        if not raw_meta:
+            logger.info(f"Conversion cache miss for {file_name}. {ConversionResultCache._record(client, 'misses')}")
+            return None
+
+        row_counts = PayloadCodec.loads(raw_meta)['row_counts']
+        suffixes = [f"{file_index}:{chunk_index}" for chunk_index in range(len(row_counts))]
+        JobProgress.claim(client, session_id, [f"{session_id}-display:{suffix}" for suffix in suffixes], job_id)
+        pipeline = client.pipeline()
+        for chunk_index, suffix in enumerate(suffixes):
+            display_key = f"{session_id}-display:{suffix}"
+            pipeline.copy(ConversionResultCache.get_chunk_key(cache_key, chunk_index), display_key, replace=True)
+            pipeline.expire(display_key, 3600)
+        copied = pipeline.execute()[::2]
+
+        if not all(copied):
+            # Chunks expired or were evicted since the meta lookup.
+            ConversionResultCache.evict(client, cache_key)
+            if suffixes:
+                display_keys = [f"{session_id}-display:{suffix}" for suffix in suffixes]
+                client.delete(*display_keys)
+                JobProgress.disown(client, session_id, display_keys)
+            logger.info(f"Conversion cache miss (incomplete entry) for {file_name}. "
+                        f"{ConversionResultCache._record(client, 'misses')}")
+            return None
+
+        SessionIndex.add(client, session_id, 'display', *suffixes)
+        ConversionResultCache._touch(client, cache_key, len(row_counts))
+        logger.info(f"Conversion cache hit for {file_name}: {len(row_counts)} chunks, {sum(row_counts)} rows. "
+                    f"{ConversionResultCache._record(client, 'hits')}")
+        return row_counts
+
+    @staticmethod
+    def store(client, cache_key, session_id, file_index, row_counts):
+        """
+        Copy the session's freshly converted display chunks of one file into the cache.
+        """
+        try:
+            ttl = ConversionResultCache.get_ttl()
+            pipeline = client.pipeline()
+            for chunk_index in range(len(row_counts)):
+                chunk_key = ConversionResultCache.get_chunk_key(cache_key, chunk_index)
+                pipeline.copy(f"{session_id}-display:{file_index}:{chunk_index}", chunk_key, replace=True)
+                pipeline.expire(chunk_key, ttl)
+            pipeline.set(
+                ConversionResultCache.get_meta_key(cache_key),
+                PayloadCodec.dumps({'row_counts': row_counts, 'created_at': time.time()}),
+                ex=ttl
+            )
+            pipeline.zadd(ConversionResultCache.LRU_KEY, {cache_key: time.time()})
+            pipeline.execute()
+
+            ConversionResultCache.evict_overflow(client)
+        except Exception as e:
+            logger.warning(f"Error storing conversion cache entry {cache_key}: {e}")
+
+    @staticmethod
+    def evict(client, cache_key):
+        raw_meta = client.get(ConversionResultCache.get_meta_key(cache_key))
+        chunk_count = len(PayloadCodec.loads(raw_meta)['row_counts']) if raw_meta else 0
+        keys = [ConversionResultCache.get_chunk_key(cache_key, i) for i in range(chunk_count)]
+        client.delete(ConversionResultCache.get_meta_key(cache_key), *keys)
+        client.zrem(ConversionResultCache.LRU_KEY, cache_key)
+
+    @staticmethod
+    def evict_overflow(client):
+        """
+        Drop expired entries from the LRU index and evict the least recently used ones beyond the limit.
+        """
+        max_entries = getattr(settings, 'CONVERT_CACHE_MAX_ENTRIES', 200)
+        client.zremrangebyscore(ConversionResultCache.LRU_KEY, '-inf', time.time() - ConversionResultCache.get_ttl())
+
+        overflow = client.zcard(ConversionResultCache.LRU_KEY) - max_entries
+        if overflow <= 0:
+            return
+
+        for cache_key in client.zrange(ConversionResultCache.LRU_KEY, 0, overflow - 1):
+            ConversionResultCache.evict(client, cache_key.decode('utf-8'))
+        logger.info(f"Evicted {overflow} conversion cache entries.")
@@ -0,0 +1,110 @@
+import time
+import logging
+from .redis import RedisClient
+
+logger = logging.getLogger(__name__)
+
+
+class SessionIndex:
+    """
+    Per-session index of the session's file and chunk keys, so that lookups and cleanup
+    only touch the session's own keys instead of walking the whole keyspace (KEYS / SCAN).
+
+    '{session_id}-index:{kind}' is a set with the suffix of every '{session_id}-{kind}:<suffix>'
+    key: the file name for file:*, '<file_index>:<chunk_index>' for the chunk kinds.
+    Writers add the suffix next to the key and deleters remove it. Chunks expire on their own,
+    so a member can outlive its key by a little; readers already skip chunks without data.
+
+    SESSIONS_KEY is a sorted set of the sessions with indexed keys, scored by their last write;
+    SessionNamespace uses it to find idle sessions.
+    """
+    SESSIONS_KEY = 'session-index-sessions'
+    FILE = 'file'
+    CHUNK_KINDS = ('processed', 'display', 'output')
+    KINDS = (FILE,) + CHUNK_KINDS
+    TTL = 3600
+
+    @staticmethod
+    def get_key(session_id, kind):
+        return f"{session_id}-index:{kind}"
+
+    @staticmethod
+    def parse_key(key):
+        """
+        Split an indexed key into (session_id, kind, suffix); None for any other key.
+        """
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        name, _, suffix = key.partition(':')
+        session_id, _, kind = name.rpartition('-')
+        if not suffix or not session_id or kind not in SessionIndex.KINDS:
+            return None
+        return session_id, kind, suffix
+
+    @staticmethod
+    def add(client, session_id, kind, *suffixes):
+        """
+        Record suffixes of the session's kind keys; client may be a pipeline.
+        Uploaded files do not expire, so neither does their index.
+        """
+        if not suffixes:
+            return
+        index_key = SessionIndex.get_key(session_id, kind)
+        client.sadd(index_key, *suffixes)
+        if kind != SessionIndex.FILE:
+            client.expire(index_key, SessionIndex.TTL)
+        client.zadd(SessionIndex.SESSIONS_KEY, {session_id: time.time()})
+
+    @staticmethod
+    def remove(client, session_id, kind, *suffixes):
+        if suffixes:
+            client.srem(SessionIndex.get_key(session_id, kind), *suffixes)
+
+    @staticmethod
+    def forget(client, keys):
+        """
+        Remove deleted keys from the index of their session; keys that are not indexed are ignored.
+        """
+        for key in keys:
+            parsed = SessionIndex.parse_key(key)
+            if parsed:
+                SessionIndex.remove(client, *parsed)
+
+    @staticmethod
+    def get_suffixes(client, session_id, kind, prefix=''):
+        return [
+            member.decode('utf-8')
+            for member in client.smembers(SessionIndex.get_key(session_id, kind))
+            if member.decode('utf-8').startswith(prefix)
+        ]
+
+    @staticmethod
+    def get_file_names(client, session_id):
+        return sorted(SessionIndex.get_suffixes(client, session_id, SessionIndex.FILE))
+
+    @staticmethod
+    def has_files(client, session_id):
+        return client.scard(SessionIndex.get_key(session_id, SessionIndex.FILE)) > 0
+
+    @staticmethod
+    def get_keys(client, session_id, kind, prefix=''):
+        """
+        The session's kind keys (bytes, like KEYS returns them) in chunk order.
+        """
+        return RedisClient.sort_keys([
+            f"{session_id}-{kind}:{suffix}".encode('utf-8')
+            for suffix in SessionIndex.get_suffixes(client, session_id, kind, prefix)
+        ])
+
+    @staticmethod
+    def get_pattern_keys(client, pattern):
+        """
+        Resolve a '{session_id}-{kind}:*' pattern through the index. Other patterns are not
+        looked up (that would need a keyspace scan) and resolve to no keys.
+        """
+        parsed = SessionIndex.parse_key(pattern)
+        if not parsed or parsed[2] != '*':
+            logger.warning(f"Key pattern {pattern} is not a session index pattern.")
+            return []
+        session_id, kind, _ = parsed
+        return SessionIndex.get_keys(client, session_id, kind)
@@ -0,0 +1,177 @@
+import os
+import time
+import shutil
+import logging
+from importlib import import_module
+from django.conf import settings
+from .chunk_codec import ChunkCodec
+from .file_inspector import FileInspector
+from .job_progress import JobProgress
+from .session_index import SessionIndex
+
+logger = logging.getLogger(__name__)
+
+
+class SessionNamespace:
+    """
+    Everything one session owns: its Redis keys and its uploaded files in the session's
+    upload directory (UPLOAD_DIR/<session_id>). UPLOAD_DIR has to be shared by the web
+    server, which saves the uploads, and the workers, which parse them.
+
+    clear() removes exactly that, so resetting one user's work never touches other
+    sessions, the conversion cache, tenant quotas or Celery's keys. sweep() clears the
+    sessions whose Django session is gone or that have been idle for SESSION_IDLE_SECONDS;
+    it runs periodically as sweep_expired_sessions.
+    """
+    SWEEP_LOCK_KEY = 'session-sweep-lock'
+    UNLINK_BATCH_SIZE = 500
+
+    @staticmethod
+    def get_idle_seconds():
+        return int(getattr(settings, 'SESSION_IDLE_SECONDS', 86400))
+
+    @staticmethod
+    def get_sweep_interval():
+        return int(getattr(settings, 'SESSION_SWEEP_INTERVAL', 900))
+
+    @staticmethod
+    def get_upload_root():
+        return getattr(settings, 'UPLOAD_DIR', '') or os.path.join(
+            getattr(settings, 'SHARED_DATA_DIR', '/var/lib/convert'), 'uploads'
+        )
+
+    @staticmethod
+    def get_upload_dir(session_id):
+        upload_dir = os.path.join(SessionNamespace.get_upload_root(), session_id)
+        os.makedirs(upload_dir, exist_ok=True)
+        return upload_dir
+
+    @staticmethod
+    def get_keys(client, session_id):
+        """
+        Every Redis key of the session, found through its SessionIndex (no keyspace scan).
+        """
+        from .file_tasks import get_manifest_key
+
+        keys = [
+            f'{session_id}-file-format',
+            f'{session_id}-file-format-before',
+            f'{session_id}-file-format-after',
+            get_manifest_key(session_id),
+            JobProgress.get_active_key(session_id),
+            JobProgress.get_owners_key(session_id),
+        ]
+        for file_name in SessionIndex.get_file_names(client, session_id):
+            keys.append(f'{session_id}-file:{file_name}')
+            keys.append(FileInspector.get_meta_key(session_id, file_name))
+        for kind in SessionIndex.CHUNK_KINDS:
+            keys.extend(SessionIndex.get_keys(client, session_id, kind))
+            keys.append(ChunkCodec.row_counts_key(session_id, kind))
+        keys.extend(SessionIndex.get_key(session_id, kind) for kind in SessionIndex.KINDS)
+        return keys
+
+    @staticmethod
+    def get_upload_paths(client, session_id):
+        pipeline = client.pipeline()
+        for file_name in SessionIndex.get_file_names(client, session_id):
+            pipeline.get(f'{session_id}-file:{file_name}')
+        return [path.decode('utf-8') for path in pipeline.execute() if path]
+
+    @staticmethod
+    def clear(client, session_id):
+        """
+        Cancel the session's job and delete its keys (UNLINK, pipelined in batches) and uploaded files.
+        Returns the number of keys removed.
+        """
+        if not session_id:
+            return 0
+
+        JobProgress.cancel_session(client, session_id)
+        paths = SessionNamespace.get_upload_paths(client, session_id)
+        keys = SessionNamespace.get_keys(client, session_id)
+
+        pipeline = client.pipeline(transaction=False)
+        for start in range(0, len(keys), SessionNamespace.UNLINK_BATCH_SIZE):
+            pipeline.unlink(*keys[start:start + SessionNamespace.UNLINK_BATCH_SIZE])
+        pipeline.zrem(SessionIndex.SESSIONS_KEY, session_id)
+        removed = sum(pipeline.execute()[:-1])
+
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Error removing uploaded file {path}: {e}")
+        shutil.rmtree(os.path.join(SessionNamespace.get_upload_root(), session_id), ignore_errors=True)
+
+        logger.info(f"Cleared session {session_id}: {removed} keys, {len(paths)} uploaded files.")
+        return removed
+
+    @staticmethod
+    def is_expired(session_store, session_id, last_write, now):
+        return last_write < now - SessionNamespace.get_idle_seconds() or not session_store.exists(session_id)
+
+    @staticmethod
+    def get_last_modified(path):
+        """
+        Latest mtime of the directory and the files in it.
+        """
+        last_modified = os.stat(path).st_mtime
+        for entry in os.scandir(path):
+            last_modified = max(last_modified, entry.stat().st_mtime)
+        return last_modified
+
+    @staticmethod
+    def sweep_orphaned_uploads(known, now):
+        """
+        Remove upload directories of sessions Redis no longer knows about.
+
+        UPLOAD_DIR is the volume shared with the web server (see settings.SHARED_DATA_DIR);
+        the sweep never creates it, so a worker without the volume finds nothing to remove.
+        An upload is saved before its session has any Redis key, so directories touched within
+        SESSION_IDLE_SECONDS are kept.
+        """
+        upload_root = SessionNamespace.get_upload_root()
+        if not os.path.isdir(upload_root):
+            logger.info(f"Upload directory {upload_root} not found; orphaned uploads not swept.")
+            return
+
+        for entry in os.scandir(upload_root):
+            try:
+                if (
+                        entry.is_dir() and entry.name not in known
+                        and SessionNamespace.get_last_modified(entry.path) < now - SessionNamespace.get_idle_seconds()
+                ):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError as e:
+                logger.warning(f"Error removing upload directory {entry.path}: {e}")
+
+    @staticmethod
+    def sweep(client):
+        """
+        Clear expired sessions and orphaned upload directories. Returns the number of sessions
+        cleared, or None when another sweep is still running.
+        """
+        if not client.set(SessionNamespace.SWEEP_LOCK_KEY, os.getpid(), nx=True, ex=SessionNamespace.get_sweep_interval()):
+            return None
+
+        try:
+            session_store = import_module(settings.SESSION_ENGINE).SessionStore()
+            now = time.time()
+            known = set()
+            cleared = 0
+            for raw_session_id, last_write in client.zrange(SessionIndex.SESSIONS_KEY, 0, -1, withscores=True):
+                session_id = raw_session_id.decode('utf-8')
+                if SessionNamespace.is_expired(session_store, session_id, last_write, now):
+                    SessionNamespace.clear(client, session_id)
+                    cleared += 1
+                else:
+                    known.add(session_id)
+
+            SessionNamespace.sweep_orphaned_uploads(known, now)
+
+            logger.info(f"Session sweep: cleared {cleared} expired sessions, {len(known)} active.")
+            return cleared
+        finally:
+            client.delete(SessionNamespace.SWEEP_LOCK_KEY)
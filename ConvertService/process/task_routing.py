@@ -0,0 +1,59 @@
+import logging
+from django.conf import settings
+from .chunk_codec import ChunkCodec
+from .file_inspector import FileInspector
+from .session_index import SessionIndex
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRouting:
+    """
+    Queue and priority of a job's tasks (queues are declared in ConvertService/celery.py).
+
+    Jobs of at most INTERACTIVE_MAX_ROWS rows go to the 'interactive' queue with the highest
+    priority; larger jobs keep the statically routed queue ('convert' / 'export') at the
+    bulk priority. Unknown sizes count as bulk.
+    """
+    INTERACTIVE_QUEUE = 'interactive'
+    INTERACTIVE_PRIORITY = 0
+    BULK_PRIORITY = 5
+
+    @staticmethod
+    def is_interactive(row_count):
+        return row_count is not None and row_count <= getattr(settings, 'INTERACTIVE_MAX_ROWS', 5000)
+
+    @staticmethod
+    def get_options(row_count):
+        """
+        apply_async / signature options for a job of row_count rows.
+        """
+        if TaskRouting.is_interactive(row_count):
+            return {'queue': TaskRouting.INTERACTIVE_QUEUE, 'priority': TaskRouting.INTERACTIVE_PRIORITY}
+        return {'priority': TaskRouting.BULK_PRIORITY}
+
+    @staticmethod
+    def count_rows(client, session_id, kind):
+        """
+        Rows stored in the session's '{kind}:' chunks according to their row-count hash, None if unknown.
+        """
+        try:
+            counts = client.hvals(ChunkCodec.row_counts_key(session_id, kind))
+            return sum(int(count) for count in counts) if counts else None
+        except Exception as e:
+            logger.warning(f"Error counting {kind} rows of session {session_id}: {e}")
+            return None
+
+    @staticmethod
+    def count_upload_rows(client, session_id):
+        """
+        Rows of the session's uploaded files according to their metadata, None if any is unknown.
+        """
+        total = 0
+        file_names = SessionIndex.get_file_names(client, session_id)
+        for meta in FileInspector.load_metas(client, session_id, file_names).values():
+            meta = meta or {}
+            if meta.get('row_count') is None:
+                return None
+            total += meta['row_count']
+        return total
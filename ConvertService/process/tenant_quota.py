@@ -0,0 +1,130 @@
+import time
+import logging
+from django.conf import settings
+from redis.exceptions import WatchError
+
+logger = logging.getLogger(__name__)
+
+
+class TenantQuota:
+    """
+    Per-tenant cap on concurrent heavy (non-interactive) jobs, kept in Redis.
+
+    'tenant-quota-running:{tenant}' is a sorted set of job ids scored by lease expiry, so a
+    job that dies without releasing its slot frees it after TENANT_JOB_LEASE_SECONDS.
+    Jobs over the cap wait in 'tenant-quota-waiting:{tenant}' (scored by arrival) and are
+    admitted first come, first served within their tenant; since every tenant has its own
+    cap, a tenant with a long backlog only ever holds its own slots.
+    Slots are released when the job finishes (JobProgress.finish).
+    """
+    TENANTS_KEY = 'tenant-quota-tenants'
+
+    @staticmethod
+    def get_limit():
+        return int(getattr(settings, 'TENANT_MAX_HEAVY_JOBS', 2))
+
+    @staticmethod
+    def get_lease():
+        return int(getattr(settings, 'TENANT_JOB_LEASE_SECONDS', 3600))
+
+    @staticmethod
+    def get_retry_delay():
+        return int(getattr(settings, 'TENANT_QUOTA_RETRY_SECONDS', 5))
+
+    @staticmethod
+    def get_running_key(tenant_id):
+        return f"tenant-quota-running:{tenant_id}"
+
+    @staticmethod
+    def get_waiting_key(tenant_id):
+        return f"tenant-quota-waiting:{tenant_id}"
+
+    @staticmethod
+    def acquire(client, tenant_id, job_id):
+        """
+        Take a slot for the job, or put it in line. Returns True when the job may run.
+        """
+        running_key = TenantQuota.get_running_key(tenant_id)
+        waiting_key = TenantQuota.get_waiting_key(tenant_id)
+        limit = TenantQuota.get_limit()
+        lease = TenantQuota.get_lease()
+
+        with client.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(running_key, waiting_key)
+                    now = time.time()
+                    expired_running = pipeline.zrangebyscore(running_key, '-inf', now)
+                    expired_waiting = pipeline.zrangebyscore(waiting_key, '-inf', now - lease)
+                    running = pipeline.zcard(running_key) - len(expired_running)
+                    if pipeline.zscore(running_key, job_id) is not None:
+                        return True
+
+                    waiting = [
+                        member.decode('utf-8')
+                        for member in pipeline.zrange(waiting_key, 0, -1)
+                        if member not in expired_waiting
+                    ]
+                    position = waiting.index(job_id) if job_id in waiting else len(waiting)
+                    granted = position < limit - running
+
+                    pipeline.multi()
+                    if expired_running:
+                        pipeline.zrem(running_key, *expired_running)
+                    if expired_waiting:
+                        pipeline.zrem(waiting_key, *expired_waiting)
+                    if granted:
+                        pipeline.zadd(running_key, {job_id: now + lease})
+                        pipeline.zrem(waiting_key, job_id)
+                    else:
+                        pipeline.zadd(waiting_key, {job_id: now}, nx=True)
+                    pipeline.expire(running_key, lease)
+                    pipeline.expire(waiting_key, lease)
+                    pipeline.sadd(TenantQuota.TENANTS_KEY, tenant_id)
+                    pipeline.execute()
+                    break
+                except WatchError:
+                    continue
+
+        if not granted:
+            logger.info(f"Tenant {tenant_id}: job {job_id} waiting ({running}/{limit} running, position {position + 1}).")
+        return granted
+
+    @staticmethod
+    def release(client, tenant_id, job_id):
+        """
+        Free the job's slot, or take it out of line if it never ran.
+        """
+        try:
+            pipeline = client.pipeline()
+            pipeline.zrem(TenantQuota.get_running_key(tenant_id), job_id)
+            pipeline.zrem(TenantQuota.get_waiting_key(tenant_id), job_id)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Error releasing tenant {tenant_id} slot of job {job_id}: {e}")
+
+    @staticmethod
+    def get_usage(client):
+        """
+        Running and waiting heavy jobs per tenant.
+        """
+        now = time.time()
+        lease = TenantQuota.get_lease()
+        limit = TenantQuota.get_limit()
+        usage = {}
+        for raw_tenant_id in sorted(client.smembers(TenantQuota.TENANTS_KEY)):
+            tenant_id = raw_tenant_id.decode('utf-8')
+            running = client.zrangebyscore(TenantQuota.get_running_key(tenant_id), now, '+inf')
+            waiting = client.zrangebyscore(TenantQuota.get_waiting_key(tenant_id), now - lease, '+inf')
+            if not running and not waiting:
+                client.srem(TenantQuota.TENANTS_KEY, raw_tenant_id)
+                continue
+
+            usage[tenant_id] = {
+                'limit': limit,
+                'running': len(running),
+                'waiting': len(waiting),
+                'running_jobs': [job_id.decode('utf-8') for job_id in running],
+                'waiting_jobs': [job_id.decode('utf-8') for job_id in waiting],
+            }
+        return usage
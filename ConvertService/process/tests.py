@@ -1,3 +1,558 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+import fakeredis
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from DateParserBenchmark import generate_corpus, legacy_convert_date
+from .chunk_codec import ChunkCodec
+from .date_parser import DateParser
+from .file_tasks import process_file_task
+from .job_progress import JobProgress
+from .redis import PayloadCodec, redis_client
+from .session_index import SessionIndex
+from .tenant_quota import TenantQuota
+from .utils import ConversionPlan, DisplayData, FileProcessor
+from .views import UploadFileView
 
-# Create your tests here.
+
+class TempFileMixin:
+    def write_temp_file(self, content, suffix):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'wb') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+
+class IterJsonValuesTests(TempFileMixin, SimpleTestCase):
+    def read_values(self, text, read_size=64 * 1024):
+        path = self.write_temp_file(text.encode('utf-8'), '.json')
+        return list(FileProcessor.iter_json_values(path, 'utf-8', read_size=read_size))
+
+    def test_array_items_match_json_loads(self):
+        items = [{'氏名': f'山田{i}', 'id': i, 'score': i * 1.5, 'tags': ['a', None, True]} for i in range(200)]
+        text = json.dumps(items, ensure_ascii=False, indent=2)
+        # A tiny read size makes values and numbers straddle buffer edges.
+        for read_size in (7, 64, 64 * 1024):
+            self.assertEqual(self.read_values(text, read_size), items)
+
+    def test_json_lines_and_concatenated_values(self):
+        self.assertEqual(self.read_values('{"a": 1}\n{"a": 2}\n\n{"a": 3}\n', read_size=5), [{'a': 1}, {'a': 2}, {'a': 3}])
+        self.assertEqual(self.read_values('{"a": 1}{"a": 2} 12345', read_size=3), [{'a': 1}, {'a': 2}, 12345])
+
+    def test_single_object_and_empty_documents(self):
+        self.assertEqual(self.read_values('{"rows": [1, 2]}'), [{'rows': [1, 2]}])
+        self.assertEqual(self.read_values('[]'), [])
+        self.assertEqual(self.read_values('  \n '), [])
+
+    def test_malformed_array_raises(self):
+        with self.assertRaises(ValueError):
+            self.read_values('[{"a": 1} {"a": 2}]')
+        with self.assertRaises(ValueError):
+            self.read_values('[{"a": 1},')
+
+    def test_iter_json_chunks_projects_headers(self):
+        path = self.write_temp_file(json.dumps([{'a': 1, 'b': 2}, [1], {'b': 3}, {'a': 4}]).encode('utf-8'), '.json')
+        chunks = list(FileProcessor.iter_json_chunks(path, ['a'], chunk_size=2, file_meta={'encoding': 'utf-8'}))
+        self.assertEqual(chunks, [[{'a': 1}, {'a': ''}], [{'a': 4}]])
+
+
+class ChunkCodecTests(SimpleTestCase):
+    def assertRoundTrip(self, rows):
+        self.assertEqual(ChunkCodec.decode(ChunkCodec.encode(rows)), rows)
+        self.assertEqual(ChunkCodec.loads(ChunkCodec.dumps(rows)), rows)
+        self.assertEqual(ChunkCodec.row_count(ChunkCodec.dumps(rows)), len(rows))
+
+    def test_dict_rows_are_stored_by_column(self):
+        rows = [{'氏名': '山田', '性別': '1'}, {'氏名': '佐藤', '性別': None}]
+        payload = ChunkCodec.encode(rows)
+        self.assertEqual(payload['kind'], ChunkCodec.KIND_DICT)
+        self.assertEqual(payload['headers'], ['氏名', '性別'])
+        self.assertEqual(payload['columns'], [['山田', '佐藤'], ['1', None]])
+        self.assertRoundTrip(rows)
+
+    def test_dict_rows_with_different_keys_are_stored_as_records(self):
+        rows = [{'a': 1}, {'b': 2}, {'a': 3, 'b': 4}]
+        self.assertEqual(ChunkCodec.encode(rows)['kind'], ChunkCodec.KIND_RECORDS)
+        self.assertRoundTrip(rows)
+
+    def test_list_rows_of_equal_length_have_no_lengths(self):
+        rows = [['1', '2'], ['3', '4']]
+        payload = ChunkCodec.encode(rows)
+        self.assertEqual(payload['kind'], ChunkCodec.KIND_LIST)
+        self.assertNotIn('lengths', payload)
+        self.assertRoundTrip(rows)
+
+    def test_ragged_list_rows_keep_their_lengths(self):
+        rows = [['1', '2', '3'], [], ['4'], ['5', None]]
+        payload = ChunkCodec.encode(rows)
+        self.assertEqual(payload['lengths'], [3, 0, 1, 2])
+        self.assertEqual(payload['width'], 3)
+        self.assertRoundTrip(rows)
+
+    def test_empty_and_columnless_chunks(self):
+        self.assertRoundTrip([])
+        self.assertRoundTrip([[], []])
+        self.assertRoundTrip([{}, {}])
+
+    def test_legacy_payloads_are_decoded_unchanged(self):
+        rows = [{'a': '1'}, {'a': '2'}]
+        legacy = json.dumps(rows).encode('utf-8')
+        self.assertEqual(ChunkCodec.loads(legacy), rows)
+        self.assertEqual(ChunkCodec.row_count(legacy), 2)
+        self.assertEqual(ChunkCodec.loads(PayloadCodec.dumps([['x']])), [['x']])
+
+    def test_unknown_version_is_rejected(self):
+        payload = ChunkCodec.encode([['1']])
+        payload['v'] = ChunkCodec.VERSION + 1
+        with self.assertRaises(ValueError):
+            ChunkCodec.decode(payload)
+
+
+class ConversionPlanTests(SimpleTestCase):
+    BEFORE_HEADERS = [
+        {'header_name': '氏名', 'index_value': 1},
+        {'header_name': '性別', 'index_value': 2},
+        {'header_name': '所属', 'index_value': 3},
+    ]
+    AFTER_HEADERS = [
+        {'header_name': '所属コード', 'index_value': 10},
+        {'header_name': '名前', 'index_value': 20},
+        {'header_name': '性別区分', 'index_value': 30},
+    ]
+    RULES = [['CR_NOT_CHANGE', 1, 20], ['CR_G_12', 2, 30], ['CR_GROUP_NO', 3, 10]]
+
+    def build_plan(self, mapping=None):
+        mapping = {'営業': 'S01', '総務': 'G01'} if mapping is None else mapping
+        with mock.patch('process.utils.FixedValueFetcher.get_value_mapping', return_value=mapping) as fetch:
+            plan = ConversionPlan.build(self.RULES, self.BEFORE_HEADERS, self.AFTER_HEADERS, tenant_id=7)
+        fetch.assert_called_once_with(7, 'CR_GROUP_NO')
+        return plan
+
+    def test_build_resolves_positions_and_rules(self):
+        plan = self.build_plan()
+        self.assertEqual(plan.width, 3)
+        self.assertEqual(plan.copy_steps, [('氏名', 0, 1), ('性別', 1, 2), ('所属', 2, 0)])
+        self.assertEqual(plan.rule_specs, [(2, 'CR_G_12', None), (0, 'CR_GROUP_NO', {'営業': 'S01', '総務': 'G01'})])
+
+    def test_fixed_value_mapping_falls_back_to_the_source_value(self):
+        plan = self.build_plan({'営業': 'S01', '開発': ''})
+        rows = [
+            {'氏名': '山田', '性別': '男', '所属': '営業'},
+            {'氏名': '佐藤', '性別': '女', '所属': '開発'},
+            {'氏名': '鈴木', '性別': '2', '所属': '人事'},
+            ['田中', '男性', '営業'],
+            {'氏名': '高橋'},
+        ]
+        expected = [
+            ['S01', '山田', '1'],
+            ['開発', '佐藤', '2'],
+            ['人事', '鈴木', '2'],
+            ['S01', '田中', '1'],
+            ['', '高橋', ''],
+        ]
+        self.assertEqual(plan.apply_rows(rows), expected)
+        self.assertEqual([plan.apply_row(row) for row in rows], expected)
+
+    def test_unsupported_rows_become_blank(self):
+        plan = self.build_plan()
+        with self.assertLogs('process.utils', 'ERROR'):
+            self.assertEqual(plan.apply_rows(['not a row', None]), [['', '', ''], ['', '', '']])
+
+    def test_memo_counts_hits_misses_and_distinct_values(self):
+        plan = self.build_plan()
+        rows = [{'性別': gender, '所属': group} for gender, group in [('男', '営業'), ('女', '営業'), ('男', '総務'), ('男', '営業')]]
+        plan.apply_rows(rows)
+        gender, group = plan.memo_stats()
+        self.assertEqual((gender['rule_id'], gender['position']), ('CR_G_12', 2))
+        self.assertEqual((gender['hits'], gender['misses'], gender['distinct']), (2, 2, 2))
+        self.assertEqual((group['hits'], group['misses'], group['distinct']), (2, 2, 2))
+        self.assertTrue(gender['distinct_exact'])
+        self.assertEqual(gender['hit_rate'], 0.5)
+
+    def test_memo_keeps_equal_values_of_different_types_apart(self):
+        plan = ConversionPlan(1, [('value', 0, 0)], [(0, 'CR_GROUP_NO', {'1': 'one', 'True': 'yes'})])
+        values = [1, True, '1', 1.0, [1], 1]
+        self.assertEqual(
+            plan.apply_rows([{'value': value} for value in values]),
+            [['one'], ['yes'], ['one'], [1.0], [[1]], ['one']],
+        )
+        stats = plan.memo_stats()[0]
+        # The unhashable list is converted but never cached.
+        self.assertEqual((stats['hits'], stats['misses'], stats['distinct']), (1, 5, 4))
+
+    def test_memo_is_bounded(self):
+        plan = self.build_plan()
+        with mock.patch.object(ConversionPlan, 'MEMO_MAX_ENTRIES', 2):
+            plan.apply_rows([{'所属': value} for value in ['a', 'b', 'c', 'c']])
+        self.assertEqual(plan.memo_stats()[1]['distinct'], 2)
+        self.assertEqual(plan.memo_stats()[1]['misses'], 4)
+
+    def test_spec_round_trip(self):
+        plan = self.build_plan()
+        copy = ConversionPlan.from_spec(plan.to_spec())
+        row = {'氏名': '山田', '性別': '女性', '所属': '総務'}
+        self.assertEqual(copy.apply_row(row), plan.apply_row(row))
+        self.assertEqual(copy.rule_specs, plan.rule_specs)
+
+    def test_merged_stats_make_distinct_an_upper_bound(self):
+        plan = self.build_plan()
+        worker = ConversionPlan.from_spec(plan.to_spec())
+        plan.apply_rows([{'性別': '男'}, {'性別': '女'}])
+        worker.apply_rows([{'性別': '男'}, {'性別': '男'}])
+        plan.merge_memo_stats(worker.memo_stats())
+
+        gender = plan.memo_stats()[0]
+        self.assertEqual((gender['hits'], gender['misses'], gender['distinct']), (1, 3, 3))
+        self.assertFalse(gender['distinct_exact'])
+        self.assertIn('<=3 distinct', plan.memo_report())
+
+    def test_drain_returns_counts_since_previous_drain(self):
+        plan = self.build_plan()
+        plan.apply_rows([{'性別': '男'}, {'性別': '男'}])
+        first = plan.drain_memo_stats()[0]
+        self.assertEqual((first['hits'], first['misses'], first['distinct']), (1, 1, 1))
+
+        plan.apply_rows([{'性別': '男'}, {'性別': '女'}])
+        second = plan.drain_memo_stats()[0]
+        self.assertEqual((second['hits'], second['misses'], second['distinct']), (1, 1, 1))
+        self.assertEqual(plan.drain_memo_stats()[0]['distinct'], 0)
+
+
+class DateParserTests(SimpleTestCase):
+    TARGET_FORMATS = ('%Y/%m/%d', '%Y-%m-%d')
+
+    def test_known_values(self):
+        cases = [
+            ('2024/1/5', '2024/01/05'),
+            ('R5.04.01', '2023/04/01'),
+            ('平成31年4月30日', '2019/04/30'),
+            (' 2023年1月2日 ', '2023/01/02'),
+            ('25.12.2023', '2023/12/25'),
+            ('12/25/2023', '2023/12/25'),
+            ('3/4/21', '2021/03/04'),
+            ('2020-02-29 13:45', '2020/02/29'),
+            ('2021/02/30', '2021/02/30'),
+            ('不明', '不明'),
+            ('', ''),
+            (None, ''),
+            (20240101, ''),
+        ]
+        for value, expected in cases:
+            with self.subTest(value=value):
+                self.assertEqual(DateParser.convert(value), expected)
+        self.assertEqual(DateParser.convert('R5.04.01', '%Y-%m-%d'), '2023-04-01')
+
+    def test_matches_legacy_convert_date(self):
+        # The corpus of the DateParserBenchmark script, run as a regression check.
+        corpus = generate_corpus(size=20000, seed=0) + [
+            '2020/02/29', '2019/02/29', '1900/02/29', '2000-02-29', '0999/01/01',
+            '31/04/2021', '13/13/2021', '00/01/2021', '1/1/49', '1/1/50', '12.31.99',
+            'S64.01.07', 'H 1/1/8', '令和 1年5月1日', '2024/01/01 9.05.00 PM', '２０２４/０１/０１',
+        ]
+        for target_format in self.TARGET_FORMATS:
+            mismatches = []
+            for value in corpus:
+                expected = legacy_convert_date(value, target_format)
+                actual = DateParser.convert(value, target_format)
+                if expected != actual:
+                    mismatches.append((value, expected, actual))
+            self.assertEqual(mismatches[:20], [], f"{len(mismatches)} mismatches for {target_format}")
+
+
+@override_settings(TENANT_MAX_HEAVY_JOBS=2, TENANT_JOB_LEASE_SECONDS=60)
+class TenantQuotaTests(SimpleTestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeStrictRedis()
+        self.now = 1000.0
+        clock = mock.patch('process.tenant_quota.time')
+        self.addCleanup(clock.stop)
+        clock.start().time.side_effect = lambda: self.now
+
+    def acquire(self, *job_ids, tenant_id=1):
+        return [TenantQuota.acquire(self.client, tenant_id, job_id) for job_id in job_ids]
+
+    def test_jobs_are_admitted_in_arrival_order(self):
+        self.assertEqual(self.acquire('a', 'b', 'c', 'd'), [True, True, False, False])
+        self.assertEqual(self.acquire('a', 'd'), [True, False])
+
+        TenantQuota.release(self.client, 1, 'a')
+        # d retries first but c arrived earlier and keeps its place.
+        self.assertEqual(self.acquire('d', 'c', 'd'), [False, True, False])
+
+        TenantQuota.release(self.client, 1, 'b')
+        self.assertEqual(self.acquire('d'), [True])
+
+    def test_tenants_have_separate_limits(self):
+        self.assertEqual(self.acquire('a', 'b', 'c'), [True, True, False])
+        self.assertEqual(self.acquire('x', tenant_id=2), [True])
+
+        usage = TenantQuota.get_usage(self.client)
+        self.assertEqual(usage['1']['running_jobs'], ['a', 'b'])
+        self.assertEqual(usage['1']['waiting_jobs'], ['c'])
+        self.assertEqual((usage['2']['running'], usage['2']['waiting']), (1, 0))
+
+    def test_released_waiting_job_leaves_the_line(self):
+        self.acquire('a', 'b', 'c', 'd')
+        TenantQuota.release(self.client, 1, 'c')
+        TenantQuota.release(self.client, 1, 'a')
+        self.assertEqual(self.acquire('d'), [True])
+
+    def test_expired_leases_free_their_slots(self):
+        self.acquire('a', 'b')
+        self.now += 30
+        self.assertEqual(self.acquire('c'), [False])
+
+        self.now += 31
+        self.assertEqual(self.acquire('c'), [True])
+        self.assertEqual(TenantQuota.get_usage(self.client)['1']['running_jobs'], ['c'])
+
+    @override_settings(TENANT_MAX_HEAVY_JOBS=1)
+    def test_abandoned_waiting_jobs_expire(self):
+        self.assertEqual(self.acquire('a', 'c'), [True, False])
+        TenantQuota.release(self.client, 1, 'a')
+        self.now += 30
+        self.assertEqual(self.acquire('b'), [False])
+
+        # c has waited longer than the lease without retrying, so b goes ahead of it.
+        self.now += 31
+        self.assertEqual(self.acquire('b'), [True])
+        self.assertEqual(TenantQuota.get_usage(self.client)['1']['waiting_jobs'], [])
+
+    def test_idle_tenants_are_dropped_from_usage(self):
+        self.acquire('a')
+        TenantQuota.release(self.client, 1, 'a')
+        self.assertEqual(TenantQuota.get_usage(self.client), {})
+        self.assertFalse(self.client.sismember(TenantQuota.TENANTS_KEY, 1))
+
+
+class PayloadCodecTests(SimpleTestCase):
+    ROWS = [{'氏名': f'山田{i}', '所属': '営業'} for i in range(100)]
+
+    def test_small_values_are_stored_uncompressed(self):
+        raw = PayloadCodec.dumps({'a': 'あ'}, compression=PayloadCodec.ZLIB, min_bytes=1024)
+        self.assertEqual(raw, b'\x01' + '{"a":"あ"}'.encode('utf-8'))
+        self.assertEqual(PayloadCodec.parse_header(raw), (PayloadCodec.JSON, PayloadCodec.NONE))
+        self.assertEqual(PayloadCodec.loads(raw), {'a': 'あ'})
+        self.assertEqual(PayloadCodec.dumps(self.ROWS, compression=PayloadCodec.NONE, min_bytes=0)[:1], b'\x01')
+
+    def test_large_values_are_compressed_with_their_size(self):
+        body = PayloadCodec._encode_json(self.ROWS)
+        raw = PayloadCodec.dumps(self.ROWS, compression=PayloadCodec.ZLIB, min_bytes=len(body))
+        self.assertEqual(raw[0], 0x11)
+        self.assertEqual(PayloadCodec.parse_header(raw), (PayloadCodec.JSON, PayloadCodec.ZLIB))
+        self.assertEqual(zlib.decompress(raw[PayloadCodec.HEADER_SIZE:]), body)
+        self.assertLess(len(raw), len(body))
+        self.assertEqual(PayloadCodec.loads(raw), self.ROWS)
+
+    @override_settings(REDIS_CODEC_COMPRESSION='zlib', REDIS_CODEC_COMPRESS_MIN_BYTES=64)
+    def test_settings_choose_the_compression(self):
+        self.assertEqual(PayloadCodec.dumps(self.ROWS)[0], 0x11)
+        self.assertEqual(PayloadCodec.dumps([1, 2])[0], 0x01)
+        with override_settings(REDIS_CODEC_COMPRESSION='none'):
+            self.assertEqual(PayloadCodec.dumps(self.ROWS)[0], 0x01)
+        with override_settings(REDIS_CODEC_COMPRESSION='brotli'), self.assertLogs('process.redis', 'WARNING'):
+            self.assertEqual(PayloadCodec.dumps(self.ROWS)[0], 0x11)
+
+    @unittest.skipUnless(importlib.util.find_spec('lz4'), "lz4 is not installed")
+    def test_lz4_round_trip(self):
+        raw = PayloadCodec.dumps(self.ROWS, compression=PayloadCodec.LZ4, min_bytes=0)
+        self.assertEqual(raw[0], 0x21)
+        self.assertEqual(PayloadCodec.loads(raw), self.ROWS)
+
+    def test_legacy_json_has_no_header(self):
+        for value in [[1, 2], {'a': 1}, '山田', 1, 12, -1.5, 0, None, True, False, [], {}]:
+            legacy = json.dumps(value)
+            for raw in (legacy.encode('utf-8'), f' {legacy}\n'.encode('utf-8')):
+                with self.subTest(raw=raw):
+                    self.assertIsNone(PayloadCodec.parse_header(raw))
+                    self.assertEqual(PayloadCodec.loads(raw), value)
+                    self.assertEqual(PayloadCodec.decoded_size(raw[:PayloadCodec.HEADER_SIZE], len(raw)), len(raw))
+        self.assertIsNone(PayloadCodec.parse_header(b''))
+
+    def test_str_values_are_read_as_json(self):
+        self.assertEqual(PayloadCodec.loads('{"a": [1, null]}'), {'a': [1, None]})
+
+    def test_decoded_size_reads_only_the_head(self):
+        body = PayloadCodec._encode_json(self.ROWS)
+        compressed = PayloadCodec.dumps(self.ROWS, compression=PayloadCodec.ZLIB, min_bytes=0)
+        plain = PayloadCodec.dumps(self.ROWS, compression=PayloadCodec.NONE)
+        self.assertEqual(PayloadCodec.decoded_size(compressed[:PayloadCodec.HEADER_SIZE], len(compressed)), len(body))
+        self.assertEqual(PayloadCodec.decoded_size(plain[:PayloadCodec.HEADER_SIZE], len(plain)), len(body))
+
+
+@override_settings(FILE_PROCESS_CHUNK_SIZE=2)
+class ProcessFileTaskTests(TempFileMixin, SimpleTestCase):
+    SESSION_ID = 'session'
+    HEADERS = ['氏名', '性別']
+
+    def setUp(self):
+        self.client = fakeredis.FakeStrictRedis()
+        patcher = mock.patch.object(redis_client, 'get_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        rows = ''.join(f'山田{i},男\n' for i in range(5))
+        path = self.write_temp_file(f'氏名,性別\n{rows}'.encode('utf-8'), '.csv')
+        self.file_key = f'{self.SESSION_ID}-file:roster.csv'
+        self.client.set(self.file_key, path)
+
+    def run_task(self, job_id=None):
+        return process_file_task(self.SESSION_ID, self.HEADERS, self.file_key, 0, job_id=job_id)
+
+    def stored_chunks(self, kind='processed'):
+        suffixes = sorted(SessionIndex.get_suffixes(self.client, self.SESSION_ID, kind))
+        return {suffix: self.client.get(f'{self.SESSION_ID}-{kind}:{suffix}') for suffix in suffixes}
+
+    def test_superseded_job_keeps_the_chunks_of_a_rerun(self):
+        first_job = JobProgress.create(self.client, self.SESSION_ID, 'process')
+        check = JobProgress.check
+        rerun = []
+
+        def check_then_rerun(client, job_id):
+            # The user starts the same processing again while the first job is on its second chunk.
+            if job_id == first_job and self.stored_chunks() and not rerun:
+                rerun.append(JobProgress.create(self.client, self.SESSION_ID, 'process'))
+                rerun.append(self.run_task(rerun[0]))
+            check(client, job_id)
+
+        with override_settings(REDIS_WRITE_BATCH=1), \
+                mock.patch.object(JobProgress, 'check', side_effect=check_then_rerun):
+            result = self.run_task(first_job)
+
+        self.assertEqual(result['type'], 'cancelled')
+        self.assertEqual(rerun[1]['type'], 'dict')
+        chunks = self.stored_chunks()
+        self.assertEqual(sorted(chunks), ['0:0', '0:1', '0:2'])
+        self.assertTrue(all(chunks.values()))
+        owners = self.client.hgetall(JobProgress.get_owners_key(self.SESSION_ID))
+        self.assertEqual(set(owners.values()), {rerun[0].encode('utf-8')})
+
+    def test_superseded_job_discards_only_its_own_chunks(self):
+        first_job = JobProgress.create(self.client, self.SESSION_ID, 'process')
+        self.run_task(first_job)
+        JobProgress.create(self.client, self.SESSION_ID, 'process')
+        written = [f'{self.SESSION_ID}-processed:{suffix}' for suffix in self.stored_chunks()]
+        JobProgress.claim(self.client, self.SESSION_ID, written[:1], 'newer-job')
+
+        JobProgress.discard(self.client, self.SESSION_ID, first_job, written)
+        self.assertEqual(list(self.stored_chunks()), ['0:0'])
+
+    def test_failed_file_leaves_no_chunks(self):
+        def fail_after_first_chunk(*args, **kwargs):
+            yield [{'氏名': '山田', '性別': '男'}]
+            raise ValueError("broken row")
+
+        self.client.hset(ChunkCodec.row_counts_key(self.SESSION_ID, 'processed'), '1:0', 3)
+        plan_spec = ConversionPlan(2, [('氏名', 0, 0), ('性別', 1, 1)], []).to_spec()
+        with override_settings(REDIS_WRITE_BATCH=1), \
+                mock.patch.object(FileProcessor, 'iter_file_chunks', side_effect=fail_after_first_chunk):
+            result = process_file_task(self.SESSION_ID, self.HEADERS, self.file_key, 0, plan_spec=plan_spec)
+
+        self.assertEqual((result['type'], result['result']), ('error', 'broken row'))
+        for kind in ('processed', 'display'):
+            self.assertEqual(self.stored_chunks(kind), {})
+            self.assertFalse(self.client.exists(f'{self.SESSION_ID}-{kind}:0:0'))
+        self.assertEqual(self.client.hgetall(ChunkCodec.row_counts_key(self.SESSION_ID, 'processed')), {b'1:0': b'3'})
+        self.assertEqual(self.client.hgetall(ChunkCodec.row_counts_key(self.SESSION_ID, 'display')), {})
+
+
+class PaginatedDataTests(SimpleTestCase):
+    SESSION_ID = 'session'
+    HEADERS = [
+        {'header_name': 'A', 'index_value': 1},
+        {'header_name': 'B', 'index_value': 2, 'display': False},
+    ]
+
+    def setUp(self):
+        self.client = fakeredis.FakeStrictRedis()
+        self.keys = []
+        row = 0
+        for suffix, size in [('0:0', 3), ('0:1', 3), ('1:0', 2)]:
+            rows = [[f'a{row + i}', f'b{row + i}'] for i in range(size)]
+            row += size
+            key = f'{self.SESSION_ID}-display:{suffix}'
+            # The last chunk is a legacy payload (plain JSON list, no recorded count).
+            payload = json.dumps(rows).encode('utf-8') if suffix == '1:0' else ChunkCodec.dumps(rows)
+            self.client.set(key, payload)
+            self.keys.append(key.encode('utf-8'))
+        self.client.hset(ChunkCodec.row_counts_key(self.SESSION_ID, 'display'), '0:0', 3)
+
+    def get_page(self, page, page_size):
+        return DisplayData.get_paginated_data(self.client, self.SESSION_ID, self.keys, self.HEADERS, page, page_size)
+
+    def test_pages_span_chunks(self):
+        rows, total = self.get_page(2, 3)
+        self.assertEqual(total, 8)
+        self.assertEqual(
+            [(row['global_index'], row['data'], row['original_key']) for row in rows],
+            [(3, ['a3'], 'session-display:0:1'), (4, ['a4'], 'session-display:0:1'), (5, ['a5'], 'session-display:0:1')],
+        )
+        rows, _ = self.get_page(2, 4)
+        self.assertEqual([row['data'] for row in rows], [['a4'], ['a5'], ['a6'], ['a7']])
+        self.assertEqual(self.get_page(3, 4), ([], 8))
+
+    def test_missing_row_counts_are_rebuilt_and_recorded(self):
+        self.get_page(1, 2)
+        self.assertEqual(
+            self.client.hgetall(ChunkCodec.row_counts_key(self.SESSION_ID, 'display')),
+            {b'0:0': b'3', b'0:1': b'3', b'1:0': b'2'},
+        )
+
+        # With every count known, a page loads only the chunks it overlaps.
+        with mock.patch.object(self.client, 'mget', wraps=self.client.mget) as mget:
+            rows, total = self.get_page(4, 2)
+        self.assertEqual(([row['data'] for row in rows], total), ([['a6'], ['a7']], 8))
+        self.assertEqual(mget.call_args_list, [mock.call([self.keys[2]])])
+
+
+class UploadFileViewTests(SimpleTestCase):
+    SESSION_ID = 'session'
+
+    def setUp(self):
+        self.client = fakeredis.FakeStrictRedis()
+        self.upload_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_root)
+        self.enterContext(override_settings(UPLOAD_DIR=self.upload_root))
+        self.enterContext(mock.patch.object(redis_client, 'get_client', return_value=self.client))
+        self.enterContext(mock.patch('process.views.Account.objects.get'))
+        self.enterContext(mock.patch(
+            'process.fetch_data.FileFormatFetcher.get_tenant_formats', return_value=['CSV_C_UTF-8', 'JSON']
+        ))
+
+    def upload(self, name, content, content_type='text/csv'):
+        request = RequestFactory().post('/upload/', {'file': SimpleUploadedFile(name, content, content_type)})
+        request.user = mock.Mock(id=1)
+        request.session = mock.Mock(session_key=self.SESSION_ID)
+        return json.loads(UploadFileView().post(request).content)
+
+    def uploaded_files(self):
+        upload_dir = os.path.join(self.upload_root, self.SESSION_ID)
+        return sorted(os.listdir(upload_dir)) if os.path.isdir(upload_dir) else []
+
+    def test_accepted_upload_is_saved(self):
+        self.assertEqual(self.upload('roster.csv', '氏名,性別\n山田,男\n'.encode('utf-8'))['status'], 'success')
+        self.assertEqual(self.uploaded_files(), ['roster.csv'])
+        self.assertTrue(self.client.exists(f'{self.SESSION_ID}-file:roster.csv'))
+
+    def test_rejected_uploads_are_not_saved(self):
+        utf16 = self.upload('roster.csv', '氏名,性別\n山田,男\n'.encode('utf-16'))
+        too_large = self.upload('large.csv', b'a,b\n' * (2 * 1024 * 1024))
+        wrong_type = self.upload('notes.exe', b'MZ\x90\x00', 'application/octet-stream')
+
+        self.assertEqual([utf16['status'], too_large['status'], wrong_type['status']], ['error'] * 3)
+        self.assertEqual(self.uploaded_files(), [])
+        self.assertFalse(SessionIndex.has_files(self.client, self.SESSION_ID))
+
+    def test_rejected_reupload_keeps_the_accepted_file(self):
+        content = '氏名,性別\n山田,男\n'.encode('utf-8')
+        self.upload('roster.csv', content)
+        self.assertEqual(self.upload('roster.csv', '氏名,性別\n'.encode('utf-16'))['status'], 'error')
+        with open(os.path.join(self.upload_root, self.SESSION_ID, 'roster.csv'), 'rb') as f:
+            self.assertEqual(f.read(), content)
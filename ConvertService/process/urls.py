@@ -9,4 +9,7 @@ urlpatterns = [
     path('file-format/', views.FormatDataProcessingView.as_view(), name='format_data_processing'),
     path('download-zip/<str:zip_key>/', views.DownloadZipView.as_view(), name='download_zip'),
     path('download/<str:download_type>/', views.DownloadView.as_view(), name='download'),
+    path('job-status/<str:job_id>/', views.JobStatusView.as_view(), name='job_status'),
+    path('tenant-usage/', views.TenantUsageView.as_view(), name='tenant_usage'),
+    path('redis-pool/', views.RedisPoolStatsView.as_view(), name='redis_pool'),
 ]
\ No newline at end of file
@@ -1,19 +1,26 @@
+import codecs
 import datetime
 import os
 import re
 import unicodedata
 import csv
 import json
-import fitz
 import xml.etree.ElementTree as ET
+from lxml import etree
 from pathlib import Path
 import pandas as pd
 import jaconv
 from PyPDF2 import PdfReader
 from openpyxl import load_workbook
 from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 import logging
+from .chunk_codec import ChunkCodec
+from .date_parser import DateParser
 from .fetch_data import RuleFixedID, FixedValueFetcher
+from .file_inspector import FileInspector
+from .pdf_extractor import PdfFormExtractor
+from .redis import RedisClient
 
 logger = logging.getLogger(__name__)
 
@@ -62,11 +69,9 @@ class DisplayData:
             result = []
             max_workers = os.cpu_count() or 4
 
-            for key in keys:
+            for key, data in RedisClient.iter_values(redis_client, keys, decode=ChunkCodec.loads):
                 try:
-                    raw_data = redis_client.get(key)
-                    if raw_data:
-                        data = json.loads(raw_data.decode('utf-8'))
+                    if data:
                         with ThreadPoolExecutor(max_workers=max_workers) as executor:
                             filtered_rows = []
                             futures = []
@@ -113,7 +118,14 @@ class DisplayData:
             return []
 
     @staticmethod
-    def get_paginated_data(redis_client, keys, all_display_header, page=1, page_size=20):
+    def get_paginated_data(redis_client, session_id, keys, all_display_header, page=1, page_size=20, kind='display'):
+        """
+        Return (rows of the page, total rows). Chunk offsets come from the session's
+        '{kind}-rows' counts (see resolve_row_offsets), so only the chunks overlapping the
+        page are loaded.
+        """
+        from .file_tasks import resolve_row_offsets
+
         try:
 
             sorted_headers = sorted(all_display_header, key=lambda h: h.get('index_value', float('inf')))
@@ -122,51 +134,46 @@ class DisplayData:
                 if header.get('display') == False:
                     hidden_positions.append(i)
 
-            all_rows_with_global_index = []
-            total_rows = 0
-            current_global_index = 0
-
-            sorted_keys = sorted(keys, key=lambda k: int(k.decode('utf-8').split(':')[1])
-            if k.decode('utf-8').split(':')[1].isdigit() else 0)
-
-            for key in sorted_keys:
-                try:
-                    raw_data = redis_client.get(key)
-                    if not raw_data:
-                        continue
-
-                    data = json.loads(raw_data.decode('utf-8'))
-                    data_rows_count = len(data)
-                    total_rows += data_rows_count
-
-                    for i, row in enumerate(data):
-                        if isinstance(row, list):
-                            new_row = []
-                            for pos, value in enumerate(row):
-                                if pos not in hidden_positions:
-                                    new_row.append(value)
-
-                            all_rows_with_global_index.append({
-                                "global_index": current_global_index,
-                                "data": new_row,
-                                "original_key": key.decode('utf-8')
-                            })
-                        current_global_index += 1
+            sorted_keys = RedisClient.sort_keys(keys)
+            row_offsets, total_rows = resolve_row_offsets(redis_client, session_id, kind, sorted_keys)
 
-                except Exception as e:
-                    logger.error(f"Reading Redis key failed {key}: {e}")
-                    continue
-
-            start_idx = (page - 1) * page_size
-            end_idx = start_idx + page_size
-            paginated_rows = all_rows_with_global_index[start_idx:end_idx]
-
-            return paginated_rows, total_rows
+            return DisplayData._get_page_window(
+                redis_client, sorted_keys, row_offsets, total_rows, hidden_positions, page, page_size
+            ), total_rows
 
         except Exception as e:
             logger.error(f"Failed to get pagination: {e}")
             return [], 0
 
+    @staticmethod
+    def _get_page_window(redis_client, sorted_keys, row_offsets, total_rows, hidden_positions, page, page_size):
+        """
+        Rows of the page, read from the chunks overlapping it only.
+        """
+        start_idx = (page - 1) * page_size
+        end_idx = start_idx + page_size
+        chunk_ends = row_offsets[1:] + [total_rows]
+        window = [
+            (key, offset)
+            for key, offset, chunk_end in zip(sorted_keys, row_offsets, chunk_ends)
+            if chunk_end > start_idx and offset < end_idx
+        ]
+
+        paginated_rows = []
+        window_values = RedisClient.iter_values(redis_client, [key for key, _ in window], decode=ChunkCodec.loads)
+        for (key, data), (_, chunk_offset) in zip(window_values, window):
+            data = data or []
+            for i in range(max(start_idx - chunk_offset, 0), min(end_idx - chunk_offset, len(data))):
+                row = data[i]
+                if isinstance(row, list):
+                    paginated_rows.append({
+                        "global_index": chunk_offset + i,
+                        "data": [value for pos, value in enumerate(row) if pos not in hidden_positions],
+                        "original_key": key.decode('utf-8')
+                    })
+
+        return paginated_rows
+
 
 class FileFormatMapper:
     FORMAT_MAPPING = {
@@ -183,16 +190,22 @@ class FileFormatMapper:
 
 class FileProcessor:
     Fallback_Encodings = ['utf-8', 'shift_jis', 'cp932', 'iso-8859-1']
+    SAMPLE_SIZE = 64 * 1024
+    XML_ENCODING_DECLARATION = re.compile(rb'\s*<\?xml[^>]*?\bencoding\s*=')
 
     @staticmethod
-    def process_file(file_path, headers):
+    def get_chunk_size():
+        return int(getattr(settings, 'FILE_PROCESS_CHUNK_SIZE', 5000))
+
+    @staticmethod
+    def process_file(file_path, headers, file_meta=None):
         file_path = Path(file_path)
         if file_path.suffix.lower() in ['.csv', '.tsv', '.txt']:
-            return FileProcessor.process_csv(file_path, headers)
-        elif file_path.suffix.lower() in ['.json']:
-            return FileProcessor.process_json(file_path, headers)
+            return FileProcessor.process_csv(file_path, headers, file_meta)
+        elif file_path.suffix.lower() in ['.json', '.jsonl']:
+            return FileProcessor.process_json(file_path, headers, file_meta)
         elif file_path.suffix.lower() in ['.xml']:
-            return FileProcessor.process_xml(file_path, headers)
+            return FileProcessor.process_xml(file_path, headers, file_meta)
         elif file_path.suffix.lower() in ['.xlsx', '.xls']:
             return FileProcessor.process_excel(file_path, headers)
         elif file_path.suffix.lower() in ['.pdf']:
@@ -201,58 +214,118 @@ class FileProcessor:
             raise ValueError(f"Unsupported file type: {file_path.suffix}")
 
     @staticmethod
-    def process_csv(file_path, headers):
+    def iter_file_chunks(file_path, headers, chunk_size=None, file_meta=None):
         """
-        Process CSV files with fallback for different encodings
+        Yield the rows of a file as lists of at most chunk_size dicts.
         """
-        try:
-            encodings = ['utf-8', 'shift_jis', 'cp932', 'iso-8859-1']
+        file_path = Path(file_path)
+        chunk_size = chunk_size or FileProcessor.get_chunk_size()
 
-            with open(file_path, 'r', encoding=encodings[0], errors='ignore') as f:
-                first_line = f.readline().strip()
+        if file_path.suffix.lower() in ['.csv', '.tsv', '.txt']:
+            yield from FileProcessor.iter_csv_chunks(file_path, headers, chunk_size, file_meta)
+            return
+        if file_path.suffix.lower() in ['.xlsx', '.xls']:
+            yield from FileProcessor.iter_excel_chunks(file_path, headers, chunk_size)
+            return
+        if file_path.suffix.lower() in ['.xml']:
+            yield from FileProcessor.iter_xml_chunks(file_path, headers, chunk_size, file_meta)
+            return
+        if file_path.suffix.lower() in ['.json', '.jsonl']:
+            yield from FileProcessor.iter_json_chunks(file_path, headers, chunk_size, file_meta)
+            return
+
+        data = FileProcessor.process_file(file_path, headers, file_meta)
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    @staticmethod
+    def sniff_encoding(file_path):
+        """
+        Detect the encoding of a text file from a byte sample of its head.
+        Returns the encoding and the decoded sample.
+        """
+        with open(file_path, 'rb') as f:
+            sample = f.read(FileProcessor.SAMPLE_SIZE)
+            is_complete = not f.read(1)
 
-            delimiters = [',', ';', '\t', '|']
-            delimiter_counts = {d: first_line.count(d) for d in delimiters}
-            delimiter = max(delimiter_counts.items(), key=lambda x: x[1])[0]
+        if sample.startswith(codecs.BOM_UTF8):
+            encoding = 'utf-8-sig'
+            return encoding, codecs.getincrementaldecoder(encoding)().decode(sample, final=is_complete)
 
+        for candidate in FileProcessor.Fallback_Encodings:
             try:
-                return FileProcessor._read_csv(file_path, headers, delimiter, encodings[0])
+                return candidate, codecs.getincrementaldecoder(candidate)().decode(sample, final=is_complete)
             except UnicodeDecodeError:
-                pass
+                continue
 
-            for encoding in encodings[1:]:
-                try:
-                    return FileProcessor._read_csv(file_path, headers, delimiter, encoding)
-                except UnicodeDecodeError:
-                    continue
+        raise ValueError("Failed to detect encoding with all attempted encodings.")
 
-            raise ValueError("Failed to process CSV file with all attempted encodings.")
+    @staticmethod
+    def resolve_encoding(file_path, file_meta=None):
+        """
+        Encoding of a text file: the one recorded at upload time, or sniffed from its head.
+        """
+        if file_meta and file_meta.get('encoding'):
+            return file_meta['encoding']
+        return FileProcessor.sniff_encoding(file_path)[0]
+
+    @staticmethod
+    def process_csv(file_path, headers, file_meta=None):
+        """
+        Process CSV files into a single list of rows
+        """
+        try:
+            data = []
+            for chunk in FileProcessor.iter_csv_chunks(file_path, headers, file_meta=file_meta):
+                data.extend(chunk)
+            return data
         except Exception as e:
             logger.error(f"Error processing CSV file {file_path}: {e}")
             raise
 
     @staticmethod
-    def _read_csv(file_path, headers, delimiter, encoding):
+    def iter_csv_chunks(file_path, headers, chunk_size=None, file_meta=None):
         """
-        Helper method to read CSV files
+        Stream CSV rows projected to headers in chunks, detecting the format only once.
+        The encoding is one that decodes the whole file (validated by FileInspector: the
+        upload fingerprint, or a pass over the file when there is none), so the file is
+        decoded strictly even when its first bytes would fit several encodings.
         """
-        try:
-            with open(file_path, 'r', encoding=encoding, newline='') as csvfile:
-                reader = csv.DictReader(csvfile, delimiter=delimiter)
-                data = []
-                for row_idx, row in enumerate(reader):
-                    try:
-                        filtered_row = {header: row.get(header, "") for header in headers}
-                        data.append(filtered_row)
-                    except Exception as row_error:
-                        logger.warning(f"Error processing row {row_idx + 1}: {row_error}. Skipping this row.")
-                        continue
+        chunk_size = chunk_size or FileProcessor.get_chunk_size()
+        if not (file_meta and file_meta.get('encoding') and file_meta.get('delimiter')):
+            file_meta = FileInspector.inspect_path(file_path)
+        encoding, delimiter = file_meta['encoding'], file_meta['delimiter']
+
+        with open(file_path, 'r', encoding=encoding, newline='') as csvfile:
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            fieldnames = next(reader, None)
+            if fieldnames is None:
+                return
+
+            field_positions = {name: idx for idx, name in enumerate(fieldnames)}
+            positions = [(header, field_positions.get(header)) for header in headers]
+
+            chunk = []
+            for row_idx, row in enumerate(reader):
+                if not row:
+                    continue
+                try:
+                    chunk.append({
+                        header: ("" if pos is None else row[pos] if pos < len(row) else None)
+                        for header, pos in positions
+                    })
+                except Exception as row_error:
+                    logger.warning(f"Error processing row {row_idx + 1}: {row_error}. Skipping this row.")
+                    continue
 
-            logger.info(f"Successfully read CSV with encoding {encoding}.")
-            return data
-        except UnicodeDecodeError as e:
-            logger.warning(f"Failed to read CSV with encoding {encoding}: {e}")
-            raise
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+
+            if chunk:
+                yield chunk
+
+        logger.info(f"Successfully read CSV with encoding {encoding}.")
 
     @staticmethod
     def process_excel(file_path, headers):
@@ -260,170 +333,354 @@ class FileProcessor:
         Process Excel files (both .xls and .xlsx formats)
         """
         try:
-            file_extension = os.path.splitext(file_path)[1].lower()
-            if file_extension == '.xls':
+            data = []
+            for chunk in FileProcessor.iter_excel_chunks(file_path, headers):
+                data.extend(chunk)
+            return data
+        except Exception as e:
+            logger.error(f"Error processing Excel file {file_path}: {e}")
+            return []
+
+    @staticmethod
+    def _format_excel_value(cell_value):
+        if cell_value is None:
+            return ""
+        if isinstance(cell_value, (datetime.datetime, datetime.date)):
+            return cell_value.strftime("%Y/%m/%d")
+        try:
+            num_value = float(cell_value)
+            if num_value == 0:
+                return "0"
+            elif num_value == int(num_value):
+                return str(int(num_value))
+            return str(num_value)
+        except (ValueError, TypeError, OverflowError):
+            return str(cell_value)
+
+    @staticmethod
+    def iter_excel_chunks(file_path, headers, chunk_size=None):
+        """
+        Stream Excel rows in chunks, converting only the columns mapped to headers.
+        """
+        chunk_size = chunk_size or FileProcessor.get_chunk_size()
+        file_extension = os.path.splitext(file_path)[1].lower()
+
+        if file_extension == '.xls':
+            yield from FileProcessor._iter_xls_chunks(file_path, headers, chunk_size)
+            return
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            rows = sheet.iter_rows(values_only=True)
+
+            first_row = next(rows, None)
+            if first_row is None:
+                return
+
+            header_row = [str(value).strip() if value else "" for value in first_row]
+            header_indices = {header: idx for idx, header in enumerate(header_row) if header in headers}
+            projection = [(header, header_indices.get(header)) for header in headers]
+            format_value = FileProcessor._format_excel_value
+
+            chunk = []
+            for row in rows:
                 try:
-                    import xlrd
-                    workbook = xlrd.open_workbook(file_path)
-                    sheet = workbook.sheet_by_index(0)
+                    if all(value is None or str(value).strip() == '' for value in row):
+                        continue
 
-                    header_row = [str(sheet.cell_value(0, col)) for col in range(sheet.ncols)]
-                    header_indices = {header: idx for idx, header in enumerate(header_row) if header in headers}
-
-                    data = []
-                    for row_idx in range(1, sheet.nrows):
-                        try:
-                            if all(sheet.cell_value(row_idx, col) == '' for col in range(sheet.ncols)):
-                                continue
-
-                            row_data = {}
-                            for header in headers:
-                                if header in header_indices:
-                                    cell_value = sheet.cell_value(row_idx, header_indices[header])
-                                    if sheet.cell_type(row_idx, header_indices[header]) == xlrd.XL_CELL_DATE:
-                                        datetime_obj = xlrd.xldate_as_datetime(cell_value, workbook.datemode)
-                                        cell_value = datetime_obj.strftime("%Y/%m/%d")
-                                    else:
-                                        try:
-                                            num_value = float(cell_value)
-                                            if num_value == 0:
-                                                cell_value = "0"
-                                            elif num_value == int(num_value):
-                                                cell_value = str(int(num_value))
-                                            else:
-                                                cell_value = str(num_value)
-                                        except (ValueError, TypeError):
-                                            cell_value = str(cell_value) if cell_value is not None else ""
-
-                                    row_data[header] = cell_value
-                                else:
-                                    row_data[header] = ""
-                            data.append(row_data)
-                        except Exception as e:
-                            logger.error(f"Error processing row {row_idx}: {e}")
-                            continue
-
-                    return data
-                except ImportError:
-                    logger.error("xlrd library not installed. Cannot process .xls files.")
-                    raise ImportError("xlrd library required for processing .xls files")
-            else:
-                workbook = load_workbook(file_path, read_only=True, data_only=True)
-                sheet = workbook.active
+                    chunk.append({
+                        header: format_value(row[idx]) if idx is not None and idx < len(row) else ""
+                        for header, idx in projection
+                    })
+                except Exception as e:
+                    logger.error(f"Error processing row: {e}")
+                    continue
 
-                first_row = list(sheet.iter_rows(min_row=1, max_row=1))[0]
-                header_row = [str(cell.value).strip() if cell.value else "" for cell in first_row]
-                header_indices = {header: idx for idx, header in enumerate(header_row) if header in headers}
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
 
-                data = []
-                for row in list(sheet.iter_rows())[1:]:
-                    try:
-                        if all(cell.value is None or str(cell.value).strip() == '' for cell in row):
-                            continue
-
-                        row_data = {}
-                        for header in headers:
-                            if header in header_indices and header_indices[header] < len(row):
-                                cell_value = row[header_indices[header]].value
-                                if isinstance(cell_value, (datetime.datetime, datetime.date)):
-                                    cell_value = cell_value.strftime("%Y/%m/%d")
-                                else:
-                                    try:
-                                        num_value = float(cell_value)
-                                        if num_value == 0:
-                                            cell_value = "0"
-                                        elif num_value == int(num_value):
-                                            cell_value = str(int(num_value))
-                                        else:
-                                            cell_value = str(num_value)
-                                    except (ValueError, TypeError):
-                                        cell_value = str(cell_value) if cell_value is not None else ""
-
-                                row_data[header] = cell_value
-                            else:
-                                row_data[header] = ""
-                        data.append(row_data)
-                    except Exception as e:
-                        logger.error(f"Error processing row: {e}")
+            if chunk:
+                yield chunk
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _iter_xls_chunks(file_path, headers, chunk_size):
+        try:
+            import xlrd
+        except ImportError:
+            logger.error("xlrd library not installed. Cannot process .xls files.")
+            raise ImportError("xlrd library required for processing .xls files")
+
+        workbook = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(0)
+
+            header_row = [str(sheet.cell_value(0, col)) for col in range(sheet.ncols)]
+            header_indices = {header: idx for idx, header in enumerate(header_row) if header in headers}
+            projection = [(header, header_indices.get(header)) for header in headers]
+            format_value = FileProcessor._format_excel_value
+
+            chunk = []
+            for row_idx in range(1, sheet.nrows):
+                try:
+                    values = sheet.row_values(row_idx)
+                    if all(value == '' for value in values):
                         continue
 
-                return data
+                    row_data = {}
+                    for header, idx in projection:
+                        if idx is None:
+                            row_data[header] = ""
+                        elif sheet.cell_type(row_idx, idx) == xlrd.XL_CELL_DATE:
+                            datetime_obj = xlrd.xldate_as_datetime(values[idx], workbook.datemode)
+                            row_data[header] = datetime_obj.strftime("%Y/%m/%d")
+                        else:
+                            row_data[header] = format_value(values[idx])
+                    chunk.append(row_data)
+                except Exception as e:
+                    logger.error(f"Error processing row {row_idx}: {e}")
+                    continue
 
-        except Exception as e:
-            logger.error(f"Error processing Excel file {file_path}: {e}")
-            return []
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+
+            if chunk:
+                yield chunk
+        finally:
+            workbook.release_resources()
 
     @staticmethod
-    def process_json(file_path, headers):
+    def process_json(file_path, headers, file_meta=None):
         """
-        Process JSON files with fallback for different encodings
+        Process JSON files into a single list of rows
         """
         try:
-            for encoding in ['utf-8', 'shift_jis', 'cp932', 'iso-8859-1']:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as jsonfile:
-                        json_data = json.load(jsonfile)
-                        if isinstance(json_data, list):
-                            data = []
-                            for item in json_data:
-                                data.append({header: item.get(header, "") for header in headers})
-                        elif isinstance(json_data, dict):
-                            data = [{header: json_data.get(header, "") for header in headers}]
-                        else:
-                            data = []
-                        return data
-                except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                    logger.warning(f"Error decoding JSON with encoding {encoding}: {e}")
-            raise ValueError("Failed to process JSON file with all attempted encodings.")
+            data = []
+            for chunk in FileProcessor.iter_json_chunks(file_path, headers, file_meta=file_meta):
+                data.extend(chunk)
+            return data
         except Exception as e:
             logger.error(f"Error processing JSON file {file_path}: {e}")
             raise
 
     @staticmethod
-    def process_xml(file_path, headers):
+    def iter_json_values(file_path, encoding, read_size=64 * 1024):
         """
-        Process XML files with fallback for different encodings
+        Incrementally decode a JSON document without loading it whole.
+
+        A top-level array yields its items one at a time, JSON Lines (or concatenated
+        values) yield each value, and any other document yields itself once.
+        """
+        decoder = json.JSONDecoder()
+
+        with open(file_path, 'r', encoding=encoding) as jsonfile:
+            buffer = ""
+            pos = 0
+            eof = False
+
+            def fill(min_size=read_size):
+                nonlocal buffer, pos, eof
+                if eof:
+                    return False
+                text = jsonfile.read(max(min_size, read_size))
+                if not text:
+                    eof = True
+                    return False
+                buffer = buffer[pos:] + text
+                pos = 0
+                return True
+
+            def skip_whitespace():
+                nonlocal pos
+                while True:
+                    while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                        pos += 1
+                    if pos < len(buffer) or not fill():
+                        return
+
+            def decode_value():
+                nonlocal pos
+                while True:
+                    try:
+                        value, end = decoder.raw_decode(buffer, pos)
+                        # A value ending exactly at the buffer edge may be truncated (e.g. a number).
+                        if end < len(buffer) or eof:
+                            pos = end
+                            return value
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                    fill(len(buffer) - pos)
+
+            skip_whitespace()
+            if pos >= len(buffer):
+                return
+
+            if buffer[pos] == '[':
+                pos += 1
+                skip_whitespace()
+                if pos < len(buffer) and buffer[pos] == ']':
+                    return
+                while True:
+                    yield decode_value()
+                    skip_whitespace()
+                    if pos >= len(buffer):
+                        raise ValueError("Unexpected end of JSON array.")
+                    if buffer[pos] == ']':
+                        return
+                    if buffer[pos] != ',':
+                        raise ValueError(f"Unexpected character {buffer[pos]!r} in JSON array.")
+                    pos += 1
+                    skip_whitespace()
+            else:
+                while pos < len(buffer):
+                    yield decode_value()
+                    skip_whitespace()
+
+    @staticmethod
+    def iter_json_chunks(file_path, headers, chunk_size=None, file_meta=None):
+        """
+        Stream JSON objects projected to headers in chunks.
+        """
+        chunk_size = chunk_size or FileProcessor.get_chunk_size()
+        encoding = FileProcessor.resolve_encoding(file_path, file_meta)
+
+        chunk = []
+        for item_idx, item in enumerate(FileProcessor.iter_json_values(file_path, encoding)):
+            if not isinstance(item, dict):
+                logger.warning(f"Skipping JSON item {item_idx + 1}: not an object.")
+                continue
+
+            chunk.append({header: item.get(header, "") for header in headers})
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def process_xml(file_path, headers, file_meta=None):
+        """
+        Process XML files into a single list of rows
         """
         try:
-            for encoding in ['utf-8', 'shift_jis', 'cp932', 'iso-8859-1']:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as xmlfile:
-                        tree = ET.parse(xmlfile)
-                        root = tree.getroot()
-                        data = []
-                        for elem in root.findall('.//record'):
-                            data.append(
-                                {header: elem.find(header).text if elem.find(header) is not None else "" for header in
-                                 headers})
-                        return data
-                except (ET.ParseError, UnicodeDecodeError) as e:
-                    logger.warning(f"Error parsing XML with encoding {encoding}: {e}")
-            raise ValueError("Failed to process XML file with all attempted encodings.")
+            data = []
+            for chunk in FileProcessor.iter_xml_chunks(file_path, headers, file_meta=file_meta):
+                data.extend(chunk)
+            return data
         except Exception as e:
             logger.error(f"Error processing XML file {file_path}: {e}")
             raise
 
+    @staticmethod
+    def compile_record_path(record_path):
+        """
+        Split a record path ('record', './/record', 'rows/record') into the record tag
+        and the chain of parent tags it must be nested in.
+        """
+        path = (record_path or 'record').strip()
+        for prefix in ('.//', '//', './'):
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+                break
+
+        steps = [step for step in path.split('/') if step and step != '.']
+        if not steps:
+            raise ValueError(f"Invalid XML record path: {record_path}")
+
+        return steps[-1], list(reversed(steps[:-1]))
+
+    @staticmethod
+    def has_declared_xml_encoding(file_path):
+        """
+        Whether the document states its own encoding with a BOM or an XML declaration.
+        """
+        with open(file_path, 'rb') as f:
+            head = f.read(1024)
+        if head.startswith((codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return True
+        return FileProcessor.XML_ENCODING_DECLARATION.match(head) is not None
+
+    @staticmethod
+    def iter_xml_chunks(file_path, headers, chunk_size=None, file_meta=None, record_path=None):
+        """
+        Stream XML records in chunks with lxml iterparse, clearing each record once read.
+        The document's BOM or XML declaration decides its encoding; only a document with
+        neither is parsed with the encoding of the upload fingerprint or a head sample.
+        """
+        chunk_size = chunk_size or FileProcessor.get_chunk_size()
+        record_tag, parent_tags = FileProcessor.compile_record_path(
+            record_path or getattr(settings, 'XML_RECORD_PATH', './/record')
+        )
+
+        encoding = None
+        if not FileProcessor.has_declared_xml_encoding(file_path):
+            encoding = FileProcessor.resolve_encoding(file_path, file_meta)
+            if encoding in ('utf-8', 'utf-8-sig'):
+                encoding = None
+
+        child_headers = {header: header for header in headers if '/' not in header}
+        nested_headers = [header for header in headers if '/' in header]
+
+        context = etree.iterparse(
+            str(file_path),
+            events=('end',),
+            tag=record_tag,
+            encoding=encoding,
+            resolve_entities=False,
+            no_network=True,
+        )
+
+        chunk = []
+        for _, elem in context:
+            parent = elem.getparent()
+            matched = True
+            for parent_tag in parent_tags:
+                if parent is None or parent.tag != parent_tag:
+                    matched = False
+                    break
+                parent = parent.getparent()
+
+            if matched:
+                row = {}
+                for child in elem:
+                    header = child_headers.get(child.tag)
+                    if header is not None and header not in row:
+                        row[header] = child.text
+                for header in nested_headers:
+                    found = elem.find(header)
+                    row[header] = found.text if found is not None else ""
+
+                chunk.append({header: row.get(header, "") for header in headers})
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+        if chunk:
+            yield chunk
+
     @staticmethod
     def process_pdf(file_path, headers):
         """
         Process PDF files with structured data extraction
         """
         try:
-            pdf_document = fitz.open(file_path)
-            data = []
-            for page in pdf_document:
-                form_fields = page.widgets()
-                if form_fields:
-                    row_data = {}
-                    for widget in form_fields:
-                        field_name = widget.field_name
-                        field_value = widget.field_value or ""
-                        if field_name in headers:
-                            row_data[field_name] = field_value
-                        else:
-                            row_data[field_name] = ""
-                    data.append(row_data)
-            pdf_document.close()
+            data, timings = PdfFormExtractor.extract(
+                file_path,
+                headers,
+                pages_per_task=int(getattr(settings, 'PDF_PAGES_PER_TASK', 50)),
+                max_workers=int(getattr(settings, 'PDF_PROCESS_WORKERS', 0)) or None
+            )
+            logger.info(PdfFormExtractor.timing_report(file_path, timings))
             return data
         except Exception as e:
             logger.error(f"Error processing PDF file {file_path}: {e}")
@@ -465,50 +722,12 @@ class DataFormatter:
 
     @staticmethod
     def format_data_with_rules(row, rules, before_headers, after_headers, tenant_id):
+        """
+        Convert a single row. Callers converting many rows should build a ConversionPlan once instead.
+        """
         try:
-            mapped_row = [""] * len(after_headers)
-            after_header_map = {h['index_value']: {'pos': i, 'header_name': h['header_name']}
-                                for i, h in enumerate(after_headers)}
-
-            if isinstance(row, dict):
-                index_to_before_header = {h['index_value']: h['header_name'] for h in before_headers}
-
-                for rule_id, idx_before, idx_after in rules:
-                    try:
-                        after_info = after_header_map.get(idx_after)
-                        header_name = index_to_before_header.get(idx_before)
-
-                        if after_info and header_name and header_name in row:
-                            value = row[header_name]
-                            mapped_row[after_info['pos']] = value
-                        else:
-                            logger.info(f"Header name {header_name} not found in row or idx_after {idx_after} invalid")
-                    except Exception as e:
-                        logger.error(f"Error in rule mapping: {e}")
-            else:
-                logger.error(f"Unsupported row type: {type(row)}")
-                return [""] * len(after_headers)
-
-            for rule_id, idx_before, idx_after in rules:
-                try:
-                    after_info = after_header_map.get(idx_after)
-                    pos = after_info['pos']
-
-                    before_value = mapped_row[pos]
-                    if DataFormatter.is_fixed_rule(rule_id):
-                        mapped_row[pos] = DataFormatter.convert_fixed_value(
-                            before_value, rule_id, tenant_id
-                        )
-                    else:
-                        mapped_row[pos] = DataFormatter.apply_rule(
-                            before_value, rule_id
-                        )
-
-                except Exception as e:
-                    logger.error(f"Error applying rule: {e}")
-                
-            return mapped_row
-
+            plan = ConversionPlan.build(rules, before_headers, after_headers, tenant_id)
+            return plan.apply_row(row)
         except Exception as e:
             logger.error(f"Error in format_data_with_rules: {e}", exc_info=True)
             return [""] * len(after_headers)
@@ -538,119 +757,11 @@ class DataFormatter:
         - Formats with time components: DD/MM/YYYY HH:MM, MM/DD/YYYY HH:MM:SS, etc.
         - Other delimiters and variations
 
+        See DateParser for the ambiguity policy.
+
         :return: Formatted date string or original value if conversion fails
         """
-        try:
-            def is_valid_date(year, month, day):
-                try:
-                    datetime.datetime(year, month, day)
-                    return True
-                except ValueError:
-                    return False
-
-            if not value or not isinstance(value, str):
-                return ""
-
-            value = value.strip()
-            date_result = None
-
-            time_part = ""
-            time_match = re.search(r'(\s+\d{1,2}[:\.]\d{1,2}([:\.]\d{1,2})?\s*(AM|PM|am|pm)?)', value)
-            if time_match:
-                time_part = time_match.group(1)
-                value = value.replace(time_part, '')
-                value = value.strip()
-
-            # 1. Japanese Era formats
-            era_map = {"S": 1925, "H": 1988, "R": 2018}
-            era_match = re.match(r'([SHR])\s*(\d{1,2})[.\-年/](\d{1,2})[.\-月/](\d{1,2})日?', value)
-            if era_match:
-                era, year, month, day = era_match.groups()
-                base_year = era_map.get(era[0], 0)
-                year = int(year) + base_year
-                date_result = datetime.datetime(year, int(month), int(day))
-
-            kanji_era_match = re.match(r'(昭和|平成|令和)\s*(\d{1,2})[.\-年/](\d{1,2})[.\-月/](\d{1,2})日?', value)
-            if not date_result and kanji_era_match:
-                kanji_era, year, month, day = kanji_era_match.groups()
-                era = {"昭和": 1925, "平成": 1988, "令和": 2018}[kanji_era]
-                year = int(year) + era
-                date_result = datetime.datetime(year, int(month), int(day))
-
-            # 2. ISO format (YYYY-MM-DD, YYYY/MM/DD, YYYY.MM.DD)
-            if not date_result:
-                iso_match = re.match(r'(\d{4})([.\-/])(\d{1,2})\2(\d{1,2})', value)
-                if iso_match:
-                    year, separator, month, day = iso_match.groups()
-                    date_result = datetime.datetime(int(year), int(month), int(day))
-
-            # 3. Kanji dates (YYYY年MM月DD日)
-            if not date_result:
-                kanji_match = re.match(r'(\d{4})年(\d{1,2})月(\d{1,2})日?', value)
-                if kanji_match:
-                    year, month, day = map(int, kanji_match.groups())
-                    date_result = datetime.datetime(year, month, day)
-
-            # 4. European format (DD-MM-YYYY, DD/MM/YYYY, DD.MM.YYYY)
-            if not date_result:
-                euro_match = re.match(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{4})', value)
-                if euro_match:
-                    day, separator, month, year = euro_match.groups()
-                    day_val = int(day)
-                    month_val = int(month)
-
-                    if day_val > 12 or (month_val <= 12 and is_valid_date(int(year), month_val, day_val)):
-                        date_result = datetime.datetime(int(year), month_val, day_val)
-                    elif month_val > 12 or not is_valid_date(int(year), month_val, day_val):
-                        if is_valid_date(int(year), day_val, month_val):
-                            date_result = datetime.datetime(int(year), day_val, month_val)
-
-            # 5. US format (MM-DD-YYYY, MM/DD/YYYY, MM.DD.YYYY)
-            if not date_result:
-                us_match = re.match(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{4})', value)
-                if us_match:
-                    month, separator, day, year = us_match.groups()
-                    month_val = int(month)
-                    day_val = int(day)
-
-                    if month_val <= 12 and is_valid_date(int(year), month_val, day_val):
-                        date_result = datetime.datetime(int(year), month_val, day_val)
-                    elif day_val <= 12 and is_valid_date(int(year), day_val, month_val):
-                        date_result = datetime.datetime(int(year), day_val, month_val)
-
-            # 6. Two-digit year formats (DD-MM-YY, MM-DD-YY)
-            if not date_result:
-                short_year_match = re.match(r'(\d{1,2})([.\-/])(\d{1,2})\2(\d{2})', value)
-                if short_year_match:
-                    first, separator, second, year = short_year_match.groups()
-                    full_year = int(year) + (2000 if int(year) < 50 else 1900)
-
-                    first_val = int(first)
-                    second_val = int(second)
-
-                    if first_val <= 12 and second_val <= 31 and is_valid_date(full_year, first_val, second_val):
-                        date_result = datetime.datetime(full_year, first_val, second_val)
-                    elif second_val <= 12 and first_val <= 31 and is_valid_date(full_year, second_val, first_val):
-                        date_result = datetime.datetime(full_year, second_val, first_val)
-
-            # 7. Reverse formats (YYYY.DD.MM)
-            if not date_result:
-                reverse_match = re.match(r'(\d{4})([.\-/])(\d{1,2})\2(\d{1,2})', value)
-                if reverse_match:
-                    year, separator, first, second = reverse_match.groups()
-                    if is_valid_date(int(year), int(first), int(second)):
-                        date_result = datetime.datetime(int(year), int(first), int(second))
-                    elif is_valid_date(int(year), int(second), int(first)):
-                        date_result = datetime.datetime(int(year), int(second), int(first))
-
-            # 8. Convert to the desired format
-            if date_result:
-                return date_result.strftime(target_format)
-
-            return value
-        except Exception as e:
-            logger.error(f"Error converting date: {value} -> {e}")
-            return value
+        return DateParser.convert(value, target_format)
 
     @staticmethod
     def convert_gender(value, gender_type='12'):
@@ -870,6 +981,241 @@ class DataFormatter:
             return f"File formatting error: {e}"
 
 
+class ConversionPlan:
+    """
+    Conversion rules compiled once per task.
+
+    Every rule is resolved up front to the source header (or source position, for list
+    rows read back from display:*) it copies from, the target position it writes to and
+    the callable that transforms the value (with fixed-value dictionaries already loaded),
+    so converting a row is a tight loop over plain tuples.
+    """
+
+    MEMO_MAX_ENTRIES = 100000
+
+    def __init__(self, width, copy_steps, rule_specs):
+        """
+        rule_specs: (target position, rule_id, fixed-value mapping or None) per rule.
+        """
+        self.width = width
+        self.copy_steps = copy_steps
+        self.rule_specs = rule_specs
+        self.rule_steps = [(pos, rule_id, self._bind_rule(rule_id, mapping)) for pos, rule_id, mapping in rule_specs]
+        self._memos = [{} for _ in rule_specs]
+        self._memo_hits = [0] * len(rule_specs)
+        self._memo_misses = [0] * len(rule_specs)
+        self._merged_distinct = [0] * len(rule_specs)
+        self._drained_distinct = [0] * len(rule_specs)
+
+    @staticmethod
+    def _fixed_value_function(mapping):
+        def convert(value):
+            after_value = mapping.get(f"{value}", '')
+            return after_value if after_value else value
+        return convert
+
+    @classmethod
+    def _bind_rule(cls, rule_id, mapping):
+        if mapping is not None:
+            return cls._fixed_value_function(mapping)
+        return DataFormatter.RULE_MAPPING[rule_id]
+
+    @classmethod
+    def build(cls, rules, before_headers, after_headers, tenant_id):
+        after_positions = {h['index_value']: i for i, h in enumerate(after_headers)}
+        index_to_before_header = {h['index_value']: h['header_name'] for h in before_headers}
+        before_positions = {h['index_value']: i for i, h in enumerate(before_headers)}
+        fixed_rule_ids = set(RuleFixedID.get_values())
+
+        copy_steps = []
+        rule_specs = []
+        for rule_id, idx_before, idx_after in rules:
+            pos = after_positions.get(idx_after)
+            if pos is None:
+                logger.warning(f"Rule {rule_id} targets unknown index {idx_after}. Skipping.")
+                continue
+
+            header_name = index_to_before_header.get(idx_before)
+            if header_name:
+                copy_steps.append((header_name, before_positions[idx_before], pos))
+            else:
+                logger.info(f"Rule {rule_id} source index {idx_before} has no header.")
+
+            if rule_id in fixed_rule_ids:
+                mapping = FixedValueFetcher.get_value_mapping(tenant_id, rule_id)
+                rule_specs.append((pos, rule_id, dict(mapping)))
+            elif rule_id in DataFormatter.RULE_MAPPING and rule_id != "CR_NOT_CHANGE":
+                rule_specs.append((pos, rule_id, None))
+
+        return cls(len(after_headers), copy_steps, rule_specs)
+
+    def to_spec(self):
+        """
+        Picklable form of the plan (no callables), for handing it to pool workers.
+        """
+        return {'width': self.width, 'copy_steps': self.copy_steps, 'rule_specs': self.rule_specs}
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(spec['width'], spec['copy_steps'], spec['rule_specs'])
+
+    def _copy_row(self, row):
+        """
+        Place the source values of a row at their target positions.
+        Returns None for unsupported row types.
+        """
+        mapped_row = [""] * self.width
+
+        if isinstance(row, dict):
+            for header_name, _, pos in self.copy_steps:
+                if header_name in row:
+                    mapped_row[pos] = row[header_name]
+        elif isinstance(row, list):
+            row_length = len(row)
+            for _, source_pos, pos in self.copy_steps:
+                if source_pos < row_length:
+                    mapped_row[pos] = row[source_pos]
+        else:
+            logger.error(f"Unsupported row type: {type(row)}")
+            return None
+
+        return mapped_row
+
+    def apply_row(self, row):
+        mapped_row = self._copy_row(row)
+        if mapped_row is None:
+            return [""] * self.width
+
+        for pos, rule_id, function in self.rule_steps:
+            value = mapped_row[pos]
+            try:
+                mapped_row[pos] = function(value)
+            except Exception as e:
+                logger.error(f"Error applying rule {rule_id} to value {value}: {e}")
+
+        return mapped_row
+
+    def _convert_column(self, step_index, values):
+        """
+        Convert one column with a rule, converting each distinct value only once per plan.
+        """
+        _, rule_id, function = self.rule_steps[step_index]
+        memo = self._memos[step_index]
+        results = []
+        hits = 0
+        misses = 0
+
+        for value in values:
+            # 1, 1.0 and True compare equal but can convert differently.
+            memo_key = value if type(value) is str else (type(value), value)
+            try:
+                results.append(memo[memo_key])
+                hits += 1
+                continue
+            except KeyError:
+                cacheable = True
+            except TypeError:
+                cacheable = False
+
+            misses += 1
+            try:
+                converted = function(value)
+            except Exception as e:
+                logger.error(f"Error applying rule {rule_id} to value {value}: {e}")
+                converted = value
+
+            if cacheable and len(memo) < self.MEMO_MAX_ENTRIES:
+                memo[memo_key] = converted
+            results.append(converted)
+
+        self._memo_hits[step_index] += hits
+        self._memo_misses[step_index] += misses
+        return results
+
+    def apply_rows(self, rows):
+        """
+        Convert a whole chunk: copy the source values row by row, then run every rule
+        over its target column at once.
+        """
+        mapped_rows = []
+        convertible_rows = []
+        for row in rows:
+            mapped_row = self._copy_row(row)
+            if mapped_row is None:
+                mapped_rows.append([""] * self.width)
+                continue
+            mapped_rows.append(mapped_row)
+            convertible_rows.append(mapped_row)
+
+        if not convertible_rows:
+            return mapped_rows
+
+        for step_index, (pos, _, _) in enumerate(self.rule_steps):
+            column = self._convert_column(step_index, [mapped_row[pos] for mapped_row in convertible_rows])
+            for mapped_row, value in zip(convertible_rows, column):
+                mapped_row[pos] = value
+
+        return mapped_rows
+
+    def memo_stats(self):
+        """
+        Memoization hit/miss counts per rule, in rule order.
+        """
+        stats = []
+        for step_index, (pos, rule_id, _) in enumerate(self.rule_steps):
+            hits = self._memo_hits[step_index]
+            misses = self._memo_misses[step_index]
+            lookups = hits + misses
+            stats.append({
+                'rule_id': rule_id,
+                'position': pos,
+                'hits': hits,
+                'misses': misses,
+                'distinct': len(self._memos[step_index]) + self._merged_distinct[step_index],
+                'distinct_exact': not self._merged_distinct[step_index],
+                'hit_rate': hits / lookups if lookups else 0.0,
+            })
+        return stats
+
+    def drain_memo_stats(self):
+        """
+        memo_stats() accumulated since the previous drain; the counters start over afterwards.
+        """
+        stats = self.memo_stats()
+        for step_index, item in enumerate(stats):
+            item['distinct'] -= self._drained_distinct[step_index]
+            self._drained_distinct[step_index] += item['distinct']
+        self._memo_hits = [0] * len(self.rule_steps)
+        self._memo_misses = [0] * len(self.rule_steps)
+        return stats
+
+    def merge_memo_stats(self, stats):
+        """
+        Add the memo_stats() of a plan that ran elsewhere (e.g. in a pool worker) to this plan's counts.
+        Workers memoize separately and a value seen by several of them is counted by each, so
+        once merged, 'distinct' is only an upper bound (distinct_exact is False).
+        """
+        for step_index, item in enumerate(stats[:len(self.rule_steps)]):
+            self._memo_hits[step_index] += item['hits']
+            self._memo_misses[step_index] += item['misses']
+            self._merged_distinct[step_index] += item['distinct']
+
+    def memo_report(self):
+        stats = self.memo_stats()
+        if not stats:
+            return "Conversion memo: no rules."
+
+        hits = sum(item['hits'] for item in stats)
+        lookups = hits + sum(item['misses'] for item in stats)
+        rule_text = ", ".join(
+            f"{item['rule_id']}@{item['position']}={item['hit_rate'] * 100:.1f}% "
+            f"({'' if item['distinct_exact'] else '<='}{item['distinct']} distinct)"
+            for item in stats
+        )
+        overall = hits / lookups * 100 if lookups else 0.0
+        return f"Conversion memo: {hits}/{lookups} hits ({overall:.1f}%); {rule_text}"
+
+
 class ProcessHeader:
 
     @staticmethod
@@ -1,11 +1,12 @@
 import json
 import math
 import os
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse
 from django.views import View
 from accounts.models import Account
 from process.fetch_data import (
@@ -15,14 +16,24 @@ from process.fetch_data import (
     HeaderType,
     DisplayType
 )
+from .chunk_codec import ChunkCodec
 from .data_type import DownloadType
+from .file_inspector import FileInspector
 from .file_tasks import (
     process_and_format_file,
     process_multiple_files_task,
-    generate_zip_task,
-    generate_csv_task, generate_excel_task
+    export_download_task,
+    drop_session_file,
+    load_manifest,
+    generate_zip_task
 )
-from .utils import ProcessHeader, DisplayData
+from .job_progress import JobProgress
+from .memory_budget import MemoryBudget
+from .session_index import SessionIndex
+from .session_namespace import SessionNamespace
+from .task_routing import TaskRouting
+from .tenant_quota import TenantQuota
+from .utils import ConversionPlan, ProcessHeader, DisplayData
 from .redis import redis_client
 import logging
 
@@ -37,15 +48,12 @@ class UploadFileView(LoginRequiredMixin, View):
             return JsonResponse({'status': 'error', 'message': 'ファイルが提供されていません。'})
 
         file_name = file.name
-        file_path = os.path.join('/tmp', file_name)
-
-        with open(file_path, 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
+        # Inspected before anything is written, so a rejected upload never reaches the shared volume.
+        file_meta = FileInspector.inspect_upload(file)
 
         client = redis_client.get_client()
 
-        if not client.keys(f'{request.session.session_key}-file:*'):
+        if not SessionIndex.has_files(client, request.session.session_key):
             client.delete(f'{request.session.session_key}-file-format')
 
         user = Account.objects.get(pk=request.user.id)
@@ -54,15 +62,24 @@ class UploadFileView(LoginRequiredMixin, View):
         file_extension = os.path.splitext(file_name)[1].lower()
         content_type = file.content_type
 
-        if not FileFormatFetcher.is_valid_file_type(content_type, file_extension, allowed_formats):
+        if not FileFormatFetcher.is_valid_file_type(content_type, file_extension, allowed_formats, file_meta):
             return JsonResponse({'status': 'error', 'message': f'無効なファイルタイプ: {file_name}。'})
 
         if file.size > 5 * 1024 * 1024:
             return JsonResponse({'status': 'error', 'message': f'ファイルサイズが制限を超えています: {file_name}。'})
+
+        file_path = os.path.join(SessionNamespace.get_upload_dir(request.session.session_key), file_name)
+        with open(file_path, 'wb+') as destination:
+            for chunk in file.chunks():
+                destination.write(chunk)
+
+        JobProgress.cancel_session(client, request.session.session_key)
         client.set(f'{request.session.session_key}-file:{file_name}', file_path)
+        SessionIndex.add(client, request.session.session_key, SessionIndex.FILE, file_name)
+        FileInspector.save_meta(client, request.session.session_key, file_name, file_meta)
 
-        if not client.keys(f'{request.session.session_key}-file-format'):
-            file_format = FileFormatFetcher.get_file_format_for_content_type(content_type, file_extension)
+        if not client.exists(f'{request.session.session_key}-file-format'):
+            file_format = FileFormatFetcher.get_file_format_for_content_type(content_type, file_extension, file_meta)
             client.set(f'{request.session.session_key}-file-format', file_format, ex=3600)
 
         return JsonResponse({'status': 'success', 'message': f'ファイルがアップロードされました: {file_name}。'})
@@ -80,11 +97,15 @@ class DeleteFileView(LoginRequiredMixin, View):
             client = redis_client.get_client()
             file_path = client.get(f'{request.session.session_key}-file:{file_name}')
             if file_path:
+                JobProgress.cancel_session(client, request.session.session_key)
                 os.remove(file_path.decode('utf-8'))
                 client.delete(f'{request.session.session_key}-file:{file_name}')
+                SessionIndex.remove(client, request.session.session_key, SessionIndex.FILE, file_name)
+                client.delete(FileInspector.get_meta_key(request.session.session_key, file_name))
+                drop_session_file(client, request.session.session_key, file_name)
                 return JsonResponse({'status': 'success', 'message': f'ファイルが削除されました: {file_name}。'})
 
-            if not client.keys(f'{request.session.session_key}-file:*') and client.keys(f'{request.session.session_key}-file-format'):
+            if not SessionIndex.has_files(client, request.session.session_key):
                 client.delete(f'{request.session.session_key}-file-format')
 
             return JsonResponse({'status': 'error', 'message': f'Redisにファイルが見つかりません: {file_name}。'})
@@ -96,20 +117,40 @@ class ProcessFilesView(LoginRequiredMixin, View):
     def post(self, request):
         try:
             user = Account.objects.get(pk=request.user.id)
+            data_format_id = get_data_format_id_from_redis(request)
 
             headers = HeaderFetcher.get_headers(
                 user,
                 HeaderType.INPUT.value,
                 DisplayType.ALL.value,
                 False,
-                get_data_format_id_from_redis(request)
+                data_format_id
+            )
+
+            plan_spec = None
+            if getattr(settings, 'FUSED_FILE_PROCESSING', True):
+                rules, before_headers, after_headers = get_display_conversion(user, data_format_id)
+                plan_spec = ConversionPlan.build(rules, before_headers, after_headers, user.tenant.id).to_spec()
+
+            session_id = request.session.session_key
+            job_id = JobProgress.create(redis_client.get_client(), session_id, 'process', user.tenant.id)
+            process_multiple_files_task.apply_async(
+                args=(session_id, headers),
+                kwargs={
+                    'plan_spec': plan_spec,
+                    'tenant_id': user.tenant.id,
+                    'data_format_id': data_format_id,
+                    'job_id': job_id
+                },
+                task_id=job_id,
+                priority=TaskRouting.INTERACTIVE_PRIORITY
             )
-            process_multiple_files_task.run(request.session.session_key, headers)
 
             return JsonResponse({
                 'status': 'success',
-                'message': 'File processing started.'
-            })
+                'message': 'File processing started.',
+                'job_id': job_id
+            }, status=202)
         except Exception as e:
             logger.error(f"Error starting file processing task: {e}")
             return JsonResponse({'status': 'error', 'message': f'エラー: {str(e)}'})
@@ -119,41 +160,30 @@ class FormatDataProcessingView(LoginRequiredMixin, View):
     def post(self, request):
         try:
             user = Account.objects.get(pk=request.user.id)
-            data_format_id = get_data_format_id_from_redis(request)
-            before_headers = HeaderFetcher.get_headers(
-                user,
-                HeaderType.INPUT.value,
-                DisplayType.ALL.value,
-                True,
-                data_format_id=data_format_id
-            )
 
-            after_headers = HeaderFetcher.get_headers(
-                user,
-                HeaderType.DISPLAY.value,
-                DisplayType.ALL.value,
-                True,
-                data_format_id=data_format_id
-            )
+            client = redis_client.get_client()
+            session_id = request.session.session_key
 
-            rules = RuleFetcher.get_rules(
-                user,
-                HeaderType.INPUT.value,
-                HeaderType.DISPLAY.value,
-                data_format_id=data_format_id
-            )
+            job_id = None
+            manifest = load_manifest(client, session_id)
+            if not (manifest and manifest.get('fused')):
+                rules, before_headers, after_headers = get_display_conversion(
+                    user,
+                    get_data_format_id_from_redis(request)
+                )
 
-            process_and_format_file.run(
-                request.session.session_key,
-                rules,
-                before_headers,
-                after_headers,
-                user.tenant.id
-            )
+                job_id = JobProgress.create(client, session_id, 'format', user.tenant.id)
+                process_and_format_file.apply_async(
+                    args=(session_id, rules, before_headers, after_headers, user.tenant.id),
+                    kwargs={'job_id': job_id},
+                    task_id=job_id,
+                    **TaskRouting.get_options(TaskRouting.count_rows(client, session_id, 'processed'))
+                )
 
             return JsonResponse({
                 "status": "success",
-                "message": "データ処理がバックグラウンドで開始されました。結果は後ほど確認してください。"
+                "message": "データ処理がバックグラウンドで開始されました。結果は後ほど確認してください。",
+                "job_id": job_id
             }, status=202)
 
         except Exception as e:
@@ -170,7 +200,7 @@ class DownloadZipView(LoginRequiredMixin, View):
             headers = HeaderFetcher.get_headers(user, HeaderType.AGENCY_OUTPUT.value, DisplayType.SHOW.value)
             file_format = FileFormatFetcher.get_file_format_id(user, before=False)
 
-            zip_key = generate_zip_task(zip_key, headers, file_format)
+            zip_key = generate_zip_task(f"{request.session.session_key}-{zip_key}", headers, file_format)
 
             if not zip_key:
                 return redirect('home')
@@ -189,109 +219,114 @@ class DownloadZipView(LoginRequiredMixin, View):
 
 
 class DownloadView(LoginRequiredMixin, View):
-    def get(self, request, download_type=DownloadType.SYSTEM.value):
+    CONTENT_TYPES = {
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'csv': 'text/csv',
+    }
+
+    def post(self, request, download_type=DownloadType.SYSTEM.value):
+        """
+        Start export_download_task and return its job_id; the file is fetched with GET ?job_id= once it succeeded.
+        """
         if download_type not in [down_type.value for down_type in DownloadType]:
-            messages.error(request, '無効なダウンロードタイプです。')
-            return redirect('home')
+            return JsonResponse({'status': 'error', 'message': '無効なダウンロードタイプです。'}, status=400)
 
         try:
-            client = redis_client.get_client()
             user = Account.objects.get(pk=request.user.id)
-
             data_format_id = get_data_format_id_from_redis(request)
 
             if download_type == DownloadType.SYSTEM.value:
-                sheet_name= DownloadType.SYSTEM.value
-
-                display_headers = HeaderFetcher.get_headers(
-                    user,
-                    HeaderType.DISPLAY.value,
-                    DisplayType.SHOW.value,
-                    get_edit_header=True,
-                    data_format_id=data_format_id
-                )
+                sheet_name = DownloadType.SYSTEM.value
+                output_type = HeaderType.SYSTEM_OUTPUT.value
                 output_headers = HeaderFetcher.get_headers(
                     user,
-                    HeaderType.SYSTEM_OUTPUT.value,
+                    output_type,
                     DisplayType.ALL.value,
                     get_edit_header=True,
                     data_format_id=data_format_id
                 )
-
-                rules = RuleFetcher.get_rules(
-                    user,
-                    HeaderType.DISPLAY.value,
-                    HeaderType.SYSTEM_OUTPUT.value,
-                    data_format_id=data_format_id
-                )
             else:
-                sheet_name= DownloadType.AGENCY.value
-
-                format_headers = HeaderFetcher.get_headers(
-                    user,
-                    HeaderType.DISPLAY.value,
-                    DisplayType.ALL.value,
-                    get_edit_header=True,
-                    data_format_id=data_format_id
-                )
+                sheet_name = DownloadType.AGENCY.value
+                output_type = HeaderType.AGENCY_OUTPUT.value
                 output_headers = HeaderFetcher.get_headers(
                     user,
-                    HeaderType.AGENCY_OUTPUT.value,
+                    output_type,
                     DisplayType.ALL.value,
                     data_format_id=data_format_id
                 )
-                rules = RuleFetcher.get_rules(
-                    user,
-                    HeaderType.DISPLAY.value,
-                    HeaderType.AGENCY_OUTPUT.value,
-                    data_format_id=data_format_id
-                )
 
-            process_and_format_file.run(
-                request.session.session_key,
-                rules,
-                format_headers,
-                output_headers,
-                user.tenant.id,
-                type_keys="display:*",
+            format_headers = HeaderFetcher.get_headers(
+                user,
+                HeaderType.DISPLAY.value,
+                DisplayType.ALL.value,
+                get_edit_header=True,
+                data_format_id=data_format_id
+            )
+            rules = RuleFetcher.get_rules(
+                user,
+                HeaderType.DISPLAY.value,
+                output_type,
                 data_format_id=data_format_id
             )
-
             output_file_format = FileFormatFetcher.get_output_file_format_id(user, download_type, data_format_id)
 
-            if output_file_format == 'EXCEL':
-                file_key = generate_excel_task(f"{request.session.session_key}-output:*", output_headers, sheet_name)
-                if not file_key:
-                    messages.error(request, '指定されたExcelファイルを生成できませんでした。')
-                    return redirect('home')
+            client = redis_client.get_client()
+            session_id = request.session.session_key
+            job_id = JobProgress.create(client, session_id, 'export', user.tenant.id)
+            export_download_task.apply_async(
+                args=(
+                    session_id,
+                    download_type,
+                    rules,
+                    format_headers,
+                    output_headers,
+                    user.tenant.id,
+                    output_file_format,
+                    sheet_name
+                ),
+                kwargs={'job_id': job_id},
+                task_id=job_id,
+                **TaskRouting.get_options(TaskRouting.count_rows(client, session_id, 'display'))
+            )
 
-                excel_data = client.get(file_key)
-                if not excel_data:
-                    messages.error(request, '指定されたExcelファイルが見つかりません。')
-                    return redirect('home')
+            return JsonResponse({'status': 'success', 'job_id': job_id}, status=202)
 
-                response = HttpResponse(
-                    excel_data,
-                    content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
-                response[
-                    'Content-Disposition'] = f'attachment; filename="{timezone.now().strftime("%Y%m%d_%H%M%S")}_{download_type}_output.xlsx"'
+        except Exception as e:
+            logger.error(f"Error starting download: {e}")
+            return JsonResponse(
+                {'status': 'error', 'message': f'ファイルのダウンロード中にエラーが発生しました: {str(e)}'},
+                status=500
+            )
 
-            else:
-                file_key = generate_csv_task(f"{request.session.session_key}-output:*", output_headers, output_file_format)
-                if not file_key:
-                    messages.error(request, '指定されたCSVファイルを生成できませんでした。')
-                    return redirect('home')
+    def get(self, request, download_type=DownloadType.SYSTEM.value):
+        try:
+            client = redis_client.get_client()
+            job = JobProgress.get(client, request.GET.get('job_id', ''))
 
-                csv_data = client.get(file_key)
-                if not csv_data:
-                    messages.error(request, '指定されたCSVファイルが見つかりません。')
-                    return redirect('home')
+            if not job or job['session_id'] != request.session.session_key or job['kind'] != 'export':
+                messages.error(request, '指定されたファイルが見つかりません。')
+                return redirect('home')
+
+            if job['status'] != JobProgress.SUCCESS:
+                messages.error(request, job['message'] or 'ファイルはまだ生成されていません。')
+                return redirect('home')
 
-                response = HttpResponse(csv_data, content_type='text/csv')
-                response[
-                    'Content-Disposition'] = f'attachment; filename="{timezone.now().strftime("%Y%m%d_%H%M%S")}_{download_type}_output.csv"'
+            file_data = client.get(job['result'])
+            if not file_data:
+                messages.error(request, '指定されたファイルが見つかりません。')
+                return redirect('home')
+
+            file_name = job['file_name']
+            content_type = self.CONTENT_TYPES[file_name.rsplit('.', 1)[1]]
+            if MemoryBudget.is_spilled(job['result']):
+                spill_path = file_data.decode('utf-8')
+                if not os.path.exists(spill_path):
+                    messages.error(request, '指定されたファイルが見つかりません。')
+                    return redirect('home')
+                return FileResponse(open(spill_path, 'rb'), as_attachment=True, filename=file_name, content_type=content_type)
 
+            response = HttpResponse(file_data, content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{file_name}"'
             return response
 
         except Exception as e:
@@ -300,6 +335,32 @@ class DownloadView(LoginRequiredMixin, View):
             return redirect('home')
 
 
+class JobStatusView(LoginRequiredMixin, View):
+    def get(self, request, job_id):
+        job = JobProgress.get(redis_client.get_client(), job_id)
+        if not job or job['session_id'] != request.session.session_key:
+            return JsonResponse({'status': 'error', 'message': 'ジョブが見つかりません。'}, status=404)
+
+        return JsonResponse({'status': 'success', 'job': job})
+
+
+class TenantUsageView(LoginRequiredMixin, View):
+    def get(self, request):
+        if not request.user.is_superuser:
+            return JsonResponse({'status': 'error', 'message': '権限がありません。'}, status=403)
+
+        return JsonResponse({'status': 'success', 'usage': TenantQuota.get_usage(redis_client.get_client())})
+
+
+class RedisPoolStatsView(LoginRequiredMixin, View):
+    def get(self, request):
+        if not request.user.is_superuser:
+            return JsonResponse({'status': 'error', 'message': '権限がありません。'}, status=403)
+
+        # Counters of this web process's pool; every worker process has its own.
+        return JsonResponse({'status': 'success', 'pool': redis_client.get_pool_stats()})
+
+
 class ProcessAndDisplayView:
     @staticmethod
     def process_and_display(session_id, user_id, request=None):
@@ -339,7 +400,7 @@ class ProcessAndDisplayView:
                 data_format_id=get_data_format_id_from_redis(request)
             )
 
-            format_keys = client.keys(f"{session_id}-display:*")
+            format_keys = SessionIndex.get_keys(client, session_id, 'display')
 
             if not format_keys:
                 logger.warning("Can't not find processed data")
@@ -348,13 +409,15 @@ class ProcessAndDisplayView:
                     'message': '処理されたファイルが見つかりません。'
                 }, status=404)
 
-            paginated_rows, total_rows = DisplayData.get_paginated_data(
-                client,
-                format_keys,
-                all_format_header,
-                page,
-                page_size
-            )
+            with MemoryBudget.track('paginate'):
+                paginated_rows, total_rows = DisplayData.get_paginated_data(
+                    client,
+                    session_id,
+                    format_keys,
+                    all_format_header,
+                    page,
+                    page_size
+                )
 
             total_pages = math.ceil(total_rows / page_size) if total_rows > 0 else 0
 
@@ -408,7 +471,7 @@ class SaveFormatFieldView:
             return JsonResponse({'status': 'error', 'message': '指定されたキーが見つかりません。'})
 
         try:
-            format_data = json.loads(raw_format_data.decode('utf-8'))
+            format_data = ChunkCodec.loads(raw_format_data)
 
             if not isinstance(format_data, list) or index >= len(format_data):
                 return JsonResponse({'status': 'error', 'message': 'データインデックスが範囲外です。'})
@@ -432,7 +495,7 @@ class SaveFormatFieldView:
             else:
                 return JsonResponse({'status': 'error', 'message': 'データの更新中にエラーが発生しました。'})
 
-            client.set(input_key, json.dumps(format_data))
+            client.set(input_key, ChunkCodec.dumps(format_data))
 
             return JsonResponse({'status': 'success', 'message': 'データが正常に更新されました。'})
 
@@ -451,26 +514,15 @@ class ProcessHeadersView(LoginRequiredMixin, View):
 
         structured_data = {}
 
-        for idx, (file, file_type) in enumerate(uploaded_files):
+        for idx, (file, file_type, file_meta) in enumerate(uploaded_files):
             try:
-                file_extension = os.path.splitext(file.name)[1].lower() if hasattr(file, 'name') else ''
-                content_type = file.content_type if hasattr(file, 'content_type') else ''
-
                 if not file_type:
-                    if file_extension in ['.csv', '.tsv', '.txt']:
-                        if '\t' in file.read().decode('utf-8', errors='ignore')[:1000]:
-                            file_type = 'CSV_T_UTF-8'
-                        else:
-                            file_type = 'CSV_C_UTF-8'
-                        file.seek(0)
-                    elif file_extension in ['.xlsx', '.xls']:
-                        file_type = 'EXCEL'
-                    elif file_extension == '.json':
-                        file_type = 'JSON'
-                    elif file_extension == '.xml':
-                        file_type = 'XML'
-
-                headers = ProcessHeader.get_header(file, file_type)
+                    file_type = file_meta.get('file_format')
+
+                if file_meta.get('header') and file_meta.get('file_format') == file_type:
+                    headers = file_meta['header']
+                else:
+                    headers = ProcessHeader.get_header(file, file_type)
 
                 if headers:
                     for i, header in enumerate(headers):
@@ -547,25 +599,36 @@ class ProcessHeadersView(LoginRequiredMixin, View):
         format_type = request.POST.get('format-type', '').strip()
         output_type = request.POST.get('output-type', '').strip()
 
+        input_meta = FileInspector.inspect_upload(input_file)
+        format_meta = FileInspector.inspect_upload(format_file)
+        output_meta = FileInspector.inspect_upload(output_file)
+
         if not input_type or not format_type or not output_type:
-            input_type = self.auto_detect_file_format(input_file)
-            format_type = self.auto_detect_file_format(format_file)
-            output_type = self.auto_detect_file_format(output_file)
+            input_type = self.auto_detect_file_format(input_file, input_meta)
+            format_type = self.auto_detect_file_format(format_file, format_meta)
+            output_type = self.auto_detect_file_format(output_file, output_meta)
 
             if not all([input_type, format_type, output_type]):
                 return None, 'すべてのファイル形式 (input-type, format-type, output-type) を選択してください。'
 
         uploaded_files = []
 
-        for file, file_type in [(input_file, input_type), (format_file, format_type), (output_file, output_type)]:
-            uploaded_files.append((file, file_type))
+        for file, file_type, file_meta in [
+            (input_file, input_type, input_meta),
+            (format_file, format_type, format_meta),
+            (output_file, output_type, output_meta)
+        ]:
+            uploaded_files.append((file, file_type, file_meta))
 
         return uploaded_files, None
 
-    def auto_detect_file_format(self, file):
+    def auto_detect_file_format(self, file, file_meta=None):
         if not file:
             return None
 
+        if file_meta and file_meta.get('file_format'):
+            return file_meta['file_format']
+
         content_type = file.content_type
         file_extension = os.path.splitext(file.name)[1].lower()
 
@@ -603,19 +666,39 @@ class ProcessHeadersView(LoginRequiredMixin, View):
         if not file_format:
             file_format = extension_mapping.get(file_extension)
 
-        if file_format == 'CSV_C_UTF-8' and file_extension == '.csv':
-            file_sample = file.read(1000)
-            file.seek(0)
-            try:
-                sample_text = file_sample.decode('utf-8', errors='ignore')
-                if '\t' in sample_text and ',' not in sample_text:
-                    file_format = 'CSV_T_UTF-8'
-            except:
-                pass
-
         return file_format
 
 
+def get_display_conversion(user, data_format_id):
+    """
+    Rules and headers of the input -> display conversion.
+    """
+    before_headers = HeaderFetcher.get_headers(
+        user,
+        HeaderType.INPUT.value,
+        DisplayType.ALL.value,
+        True,
+        data_format_id=data_format_id
+    )
+
+    after_headers = HeaderFetcher.get_headers(
+        user,
+        HeaderType.DISPLAY.value,
+        DisplayType.ALL.value,
+        True,
+        data_format_id=data_format_id
+    )
+
+    rules = RuleFetcher.get_rules(
+        user,
+        HeaderType.INPUT.value,
+        HeaderType.DISPLAY.value,
+        data_format_id=data_format_id
+    )
+
+    return rules, before_headers, after_headers
+
+
 def get_data_format_id_from_redis(request):
     data_format_id = None
 
@@ -33,4 +33,69 @@ echo "Detected RAM: ${TOTAL_RAM_MB:-unknown} MB"
 echo "Detected CPUs: ${TOTAL_CPU_CORES:-unknown}"
 echo "Calculated Celery Concurrency: ${CONCURRENCY}"
 
-exec celery -A ConvertService worker --concurrency=$CONCURRENCY --loglevel=info
+# Per-child memory limit (KB) of the prefork pools: an equal share of RAM, leaving room
+# for the interactive and export workers. Children above it are replaced after their task.
+if [ "${TOTAL_RAM_MB:-0}" -gt "0" ]; then
+    DEFAULT_MAX_MEMORY_PER_CHILD=$(($TOTAL_RAM_MB * 1024 / ($CONCURRENCY + 2)))
+else
+    DEFAULT_MAX_MEMORY_PER_CHILD=0
+fi
+
+# One worker per queue (see ConvertService/celery.py):
+#   interactive - prefork, small jobs only
+#   convert     - prefork, CPU-heavy parsing / conversion (also the conversion step of exports)
+#   export      - threads, Redis/IO-heavy file generation and cleanup (no per-child memory limit),
+#                 with the periodic session sweeper (beat) embedded unless CELERY_BEAT=False
+QUEUES=${CELERY_QUEUES:-"interactive convert export"}
+PIDS=""
+
+start_worker() {
+    QUEUE=$1
+    POOL=$2
+    WORKER_CONCURRENCY=$3
+    MAX_MEMORY_PER_CHILD=$4
+
+    EMBED_BEAT=$5
+
+    ARGS="-A ConvertService worker -Q $QUEUE -n $QUEUE@%h --pool=$POOL --concurrency=$WORKER_CONCURRENCY --loglevel=info"
+    if [ "$POOL" = "prefork" ] && [ "$MAX_MEMORY_PER_CHILD" -gt "0" ]; then
+        ARGS="$ARGS --max-memory-per-child=$MAX_MEMORY_PER_CHILD"
+    fi
+    if [ "$EMBED_BEAT" = "True" ]; then
+        ARGS="$ARGS --beat --schedule=${CELERY_BEAT_SCHEDULE:-/tmp/celerybeat-schedule}"
+    fi
+
+    echo "Starting $QUEUE worker: pool=$POOL concurrency=$WORKER_CONCURRENCY max-memory-per-child=${MAX_MEMORY_PER_CHILD}KB"
+    celery $ARGS &
+    PIDS="$PIDS $!"
+}
+
+for QUEUE in $QUEUES; do
+    case $QUEUE in
+        interactive)
+            start_worker interactive prefork \
+                "${CELERY_INTERACTIVE_CONCURRENCY:-1}" \
+                "${CELERY_INTERACTIVE_MAX_MEMORY_PER_CHILD:-$DEFAULT_MAX_MEMORY_PER_CHILD}"
+            ;;
+        convert)
+            start_worker convert prefork \
+                "${CELERY_CONVERT_CONCURRENCY:-$CONCURRENCY}" \
+                "${CELERY_CONVERT_MAX_MEMORY_PER_CHILD:-$DEFAULT_MAX_MEMORY_PER_CHILD}"
+            ;;
+        export)
+            start_worker export threads "${CELERY_EXPORT_CONCURRENCY:-4}" 0 "${CELERY_BEAT:-True}"
+            ;;
+        *)
+            echo "Unknown queue: $QUEUE"
+            ;;
+    esac
+done
+
+trap 'kill -TERM $PIDS 2>/dev/null; wait' TERM INT
+
+# Stop everything when one worker exits so the container restarts as a whole.
+wait -n
+STATUS=$?
+kill -TERM $PIDS 2>/dev/null
+wait
+exit $STATUS
@@ -180,10 +180,16 @@ $(document).ready(function () {
         const submitBtn = container.find('.submit-btn');
         const parentProcess = container.find('.process');
         const loader = container.find('.lds-roller');
+        const loaderLabel = loader.find('p');
+        const loaderText = loaderLabel.text();
         const listSection = container.find('.list-section');
         const listContainer = container.find('.list');
         const fileSelectorInput = container.find('.file-selector-input');
 
+        function showProgress(job) {
+            loaderLabel.text(`${loaderText} ${formatJobProgress(job)}`.trim());
+        }
+
         submitBtn.on('click', function (e) {
             e.preventDefault();
 
@@ -208,36 +214,42 @@ $(document).ready(function () {
                         return response.json();
                     })
                     .then(result => {
-                        if (result.status === 'success') {
-                            fileSelectorInput.val('');
-                            $.ajax({
-                                url: "/api/file-format/",
-                                type: "POST",
-                                headers: {
-                                    'X-CSRFToken': getCookie('csrftoken'),
-                                    'Content-Type': 'application/json'
-                                },
-                                data: JSON.stringify({
-                                    "data_convert_id": "C_001"
-                                }),
-                                success: function (response) {
-                                    if (response.status === "success") {
-                                        window.location.href = '/?tab=process-file';
-                                    } else {
-                                        createToast(response.status, response.message);
-                                    }
-                                }
+                        if (result.status !== 'success') {
+                            throw new Error(result.message || 'エラーが発生しました。');
+                        }
+                        fileSelectorInput.val('');
+                        return pollJob(result.job_id, showProgress);
+                    })
+                    .then(job => {
+                        if (job.message) {
+                            createToast('warning', job.message);
+                        }
+                        return fetch('/api/file-format/', {
+                            method: 'POST',
+                            headers: {
+                                'X-CSRFToken': getCookie('csrftoken'),
+                                'Content-Type': 'application/json'
+                            },
+                            body: JSON.stringify({
+                                "data_convert_id": "C_001"
                             })
-
-                        } else {
-                            createToast('error', result.message || 'エラーが発生しました。');
+                        }).then(response => response.json());
+                    })
+                    .then(response => {
+                        if (response.status !== 'success') {
+                            throw new Error(response.message || 'エラーが発生しました。');
                         }
+                        return response.job_id ? pollJob(response.job_id, showProgress) : null;
+                    })
+                    .then(() => {
+                        window.location.href = '/?tab=process-file';
                     })
                     .catch(error => {
                         console.error('Error:', error);
-                        createToast('error', 'ファイル処理中にエラーが発生しました。');
+                        createToast('error', error.message || 'ファイル処理中にエラーが発生しました。');
                     })
                     .finally(() => {
+                        loaderLabel.text(loaderText);
                         loader.addClass('d-none');
                         $(this).attr('disabled', false);
                     });
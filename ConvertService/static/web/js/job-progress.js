@@ -0,0 +1,40 @@
+function formatJobProgress(job) {
+    if (job.rows_total > 0) {
+        return `${Math.min(100, Math.floor(job.rows_done * 100 / job.rows_total))}%`;
+    }
+    if (job.files_total > 0) {
+        return `${job.files_done}/${job.files_total}`;
+    }
+    return '';
+}
+
+function pollJob(jobId, onProgress, interval = 1000) {
+    return new Promise((resolve, reject) => {
+        function check() {
+            fetch(`/api/job-status/${jobId}/`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Network response was not ok');
+                    }
+                    return response.json();
+                })
+                .then(result => {
+                    const job = result.job;
+                    if (onProgress) {
+                        onProgress(job);
+                    }
+
+                    if (job.status === 'SUCCESS') {
+                        resolve(job);
+                    } else if (job.status === 'FAILURE' || job.status === 'CANCELLED') {
+                        reject(new Error(job.message || 'エラーが発生しました。'));
+                    } else {
+                        setTimeout(check, interval);
+                    }
+                })
+                .catch(reject);
+        }
+
+        check();
+    });
+}